@@ -0,0 +1,47 @@
+from functools import wraps
+from typing import Any, Callable
+
+from django.db import close_old_connections
+from django.http import HttpRequest, HttpResponse
+
+from asgiref.sync import sync_to_async
+
+
+def run_view(
+    view: Callable, request: HttpRequest, *args: Any, **kwargs: Any
+) -> HttpResponse:
+    # Worker threads don't get the request_started and request_finished
+    # signals, which normally manage database connections
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+
+        # Render DRF responses here too, rather than in Django's shared thread
+        if hasattr(response, "render") and callable(response.render):
+            response = response.render()
+
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view: Callable) -> Callable:
+    """
+    Turns a synchronous view into an async one that runs it in a thread pool
+
+    Under ASGI, Django runs all synchronous views of a process one at a time on
+    a single thread. The participant API views don't share any state between
+    requests, so they run in the event loop's thread pool instead, each thread
+    with its own database connection. Reading the request and sending the
+    response happen in the event loop, so slow clients don't hold up a thread.
+    """
+
+    @wraps(view)
+    async def wrapped_view(
+        request: HttpRequest, *args: Any, **kwargs: Any
+    ) -> HttpResponse:
+        return await sync_to_async(run_view, thread_sensitive=False)(
+            view, request, *args, **kwargs
+        )
+
+    return wrapped_view
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import time
+from typing import Any, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import quote_etag
+
+from flare_portal.experiments.assets import save_asset_hashes
+from flare_portal.experiments.models import Experiment
+from flare_portal.site_config.models import SiteConfiguration
+from flare_portal.utils.cache import LocalCache
+
+from . import constants
+
+_local_cache = LocalCache("API_CONFIGURATION_LOCAL_CACHE_SIZE")
+
+
+def get_cache_key(experiment: Experiment) -> str:
+    return f"api:configuration:{experiment.pk}:{experiment.config_version}"
+
+
+def build_configuration(
+    experiment: Experiment, asset_manifest: constants.AssetManifestType
+) -> constants.ConfigType:
+    """Builds the configuration API payload for the experiment"""
+    config = SiteConfiguration.get_solo()
+    asset_urls = {
+        field_name: asset["url"] if asset else None
+        for field_name, asset in asset_manifest.items()
+    }
+
+    return constants.ConfigType(
+        experiment=constants.ExperimentType(
+            id=experiment.pk,
+            name=experiment.name,
+            description=experiment.description,
+            contact_email=experiment.contact_email or None,
+            trial_length=experiment.trial_length,
+            rating_delay=experiment.rating_delay,
+            minimum_volume=experiment.minimum_volume,
+            iti_min_delay=experiment.iti_min_delay,
+            iti_max_delay=experiment.iti_max_delay,
+            rating_scale_anchor_label_left=experiment.rating_scale_anchor_label_left,
+            rating_scale_anchor_label_center=(
+                experiment.rating_scale_anchor_label_center
+            ),
+            rating_scale_anchor_label_right=(
+                experiment.rating_scale_anchor_label_right
+            ),
+            us=asset_urls["us"],
+            us_file_volume=experiment.us_file_volume,
+            csa=asset_urls["csa"],
+            csb=asset_urls["csb"],
+            context_a=asset_urls["context_a"],
+            context_b=asset_urls["context_b"],
+            context_c=asset_urls["context_c"],
+            gsa=asset_urls["gsa"],
+            gsb=asset_urls["gsb"],
+            gsc=asset_urls["gsc"],
+            gsd=asset_urls["gsd"],
+            reimbursements=experiment.voucher_pool_id is not None,
+        ),
+        config=constants.SiteConfigurationType(
+            terms_and_conditions=config.participant_terms_and_conditions,
+        ),
+        modules=[
+            module.get_module_config()
+            for module in experiment.modules.select_subclasses()  # type: ignore
+        ],
+        assets=asset_manifest,
+    )
+
+
+def get_from_local_cache(key: str) -> Any:
+    return _local_cache.get(key)
+
+
+def set_in_local_cache(key: str, value: Any, timeout: float) -> None:
+    _local_cache.set(key, value, timeout)
+
+
+def get_asset_url_timeout() -> int:
+    """
+    Returns how long asset URLs can be cached for
+
+    Signed URLs are refreshed while they're still valid for at least
+    API_ASSET_URL_MIN_VALIDITY seconds, so the app has time to download the
+    assets.
+    """
+    timeout = settings.API_ASSET_MANIFEST_CACHE_TIMEOUT
+
+    if getattr(default_storage, "querystring_auth", False):
+        timeout = min(
+            timeout,
+            default_storage.querystring_expire  # type: ignore
+            - settings.API_ASSET_URL_MIN_VALIDITY,
+        )
+
+    return max(timeout, 0)
+
+
+def build_asset_manifest(experiment: Experiment) -> constants.AssetManifestType:
+    """Builds the URLs and content hashes of the experiment's assets"""
+    # Experiments saved before assets were hashed on upload get their hashes
+    # the first time they're needed
+    save_asset_hashes(experiment)
+
+    assets = experiment.get_assets()
+
+    return {
+        field_name: constants.AssetType(
+            url=assets[field_name].url,
+            sha256=experiment.asset_hashes[field_name]["sha256"],
+        )
+        if field_name in assets
+        else None
+        for field_name in Experiment.ASSET_FIELDS
+    }
+
+
+def get_asset_manifest(
+    experiment: Experiment,
+) -> Tuple[float, constants.AssetManifestType]:
+    """
+    Returns the asset manifest for the experiment, along with the time (as a
+    timestamp) until which it can be served
+
+    Generating URLs can involve signing them, so manifests are cached for as
+    long as the URLs can be served for.
+    """
+    key = f"api:assets:{experiment.pk}:{experiment.config_version}"
+
+    if cached := get_from_local_cache(key):
+        return cached
+
+    cached = cache.get(key)
+
+    if cached is None:
+        timeout = get_asset_url_timeout()
+        cached = (time.time() + timeout, build_asset_manifest(experiment))
+        cache.set(key, cached, timeout)
+
+    set_in_local_cache(key, cached, cached[0] - time.time())
+
+    return cached
+
+
+def get_configuration_with_etag(
+    experiment: Experiment,
+) -> Tuple[constants.ConfigType, str]:
+    """
+    Returns the configuration API payload for the experiment, along with an
+    ETag for it
+
+    Payloads are cached in-process and in the Django cache, keyed by the
+    experiment's config version, so a changed experiment never gets served a
+    stale payload. They're never cached for longer than the asset URLs in them
+    can be served for.
+    """
+    key = get_cache_key(experiment)
+
+    if cached := get_from_local_cache(key):
+        return cached
+
+    cached = cache.get(key)
+
+    if cached is None:
+        assets_expire_at, asset_manifest = get_asset_manifest(experiment)
+        expires_at = min(
+            time.time() + settings.API_CONFIGURATION_CACHE_TIMEOUT, assets_expire_at
+        )
+        payload = build_configuration(experiment, asset_manifest)
+        etag = hashlib.sha256(
+            json.dumps(payload, sort_keys=True, cls=DjangoJSONEncoder).encode()
+        ).hexdigest()
+        cached = (expires_at, payload, quote_etag(etag))
+        cache.set(key, cached, expires_at - time.time())
+
+    expires_at, payload, etag = cached
+    set_in_local_cache(key, (payload, etag), expires_at - time.time())
+
+    return payload, etag
+
+
+def get_configuration(experiment: Experiment) -> constants.ConfigType:
+    """Returns the configuration API payload for the experiment"""
+    return get_configuration_with_etag(experiment)[0]
@@ -1,4 +1,4 @@
-from typing import List, Optional, TypedDict
+from typing import Dict, List, Optional, TypedDict
 
 from flare_portal.experiments.constants import ModuleConfigType
 
@@ -39,12 +39,24 @@ SiteConfigurationType = TypedDict(
     },
 )
 
+AssetType = TypedDict(
+    "AssetType",
+    {
+        "url": str,
+        "sha256": str,
+    },
+)
+
+# Keyed by asset field name
+AssetManifestType = Dict[str, Optional[AssetType]]
+
 ConfigType = TypedDict(
     "ConfigType",
     {
         "experiment": ExperimentType,
         "config": SiteConfigurationType,
         "modules": List[ModuleConfigType],
+        "assets": AssetManifestType,
     },
 )
 
@@ -1,6 +1,9 @@
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from django import forms
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import QuerySet
 from django.utils import timezone
 
 from rest_framework import serializers
@@ -11,13 +14,43 @@ from flare_portal.experiments.models import (
     FearConditioningModule,
     Participant,
 )
+from flare_portal.experiments.participants import participant_id_may_exist
+from flare_portal.experiments.tracking import (
+    TRACKING_FIELDS,
+    get_tracking_buffer,
+    get_tracking_state,
+    maybe_flush_tracking_buffer,
+)
 from flare_portal.reimbursement.models import Voucher, VoucherPool
 
 
+class ParticipantChoiceField(forms.ModelChoiceField):
+    """
+    Looks up a participant by participant ID, rejecting IDs that are known not
+    to exist without querying the database
+    """
+
+    def __init__(self, queryset: Optional[QuerySet] = None, **kwargs: Any) -> None:
+        super().__init__(
+            queryset=Participant.objects.all() if queryset is None else queryset,
+            to_field_name="participant_id",
+            **kwargs,
+        )
+
+    def to_python(self, value: Any) -> Optional[Participant]:
+        if value not in self.empty_values and not participant_id_may_exist(str(value)):
+            raise ValidationError(
+                self.error_messages["invalid_choice"],
+                code="invalid_choice",
+                params={"value": value},
+            )
+
+        return super().to_python(value)
+
+
 class ConfigurationForm(forms.Form):
-    participant = forms.ModelChoiceField(
-        queryset=Participant.objects.all(),
-        to_field_name="participant_id",
+    participant = ParticipantChoiceField(
+        queryset=Participant.objects.select_related("experiment"),
         error_messages={
             "invalid_choice": "This participant ID is "
             "not correct, please contact your study administrator."
@@ -29,7 +62,7 @@ class ConfigurationForm(forms.Form):
         participant = self.cleaned_data.get("participant")
         if participant.started_at is None:
             participant.started_at = timezone.now()
-            participant.save()
+            participant.save(update_fields=["started_at", "udpated_at"])
 
         return participant
 
@@ -47,10 +80,37 @@ class ConfigurationForm(forms.Form):
         return cleaned_data
 
 
-class SubmissionForm(forms.Form):
-    participant = forms.ModelChoiceField(
-        queryset=Participant.objects.all(),
-        to_field_name="participant_id",
+class ParticipantForm(forms.Form):
+    participant = ParticipantChoiceField(
+        queryset=Participant.objects.select_related("experiment"),
+        error_messages={"invalid_choice": "Invalid participant"},
+    )
+
+
+class PrefetchedParticipantMixin(forms.Form):
+    """
+    Accepts a participant that has already been looked up, in which case the
+    participant field is left out of the form
+    """
+
+    def __init__(
+        self, *args: Any, participant: Optional[Participant] = None, **kwargs: Any
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.participant = participant
+
+        if participant is not None:
+            del self.fields["participant"]
+
+    def clean(self) -> Dict[str, Any]:
+        cleaned_data = super().clean()
+        if self.participant is not None:
+            cleaned_data["participant"] = self.participant
+        return cleaned_data
+
+
+class SubmissionForm(PrefetchedParticipantMixin, forms.Form):
+    participant = ParticipantChoiceField(
         error_messages={"invalid_choice": "Invalid participant"},
     )
 
@@ -58,10 +118,21 @@ class SubmissionForm(forms.Form):
         # Flag the participant as started the experiment
         participant = self.cleaned_data.get("participant")
         if participant.finished_at is None:
+            buffer = get_tracking_buffer()
+
+            # The buffered progress is reset below, but the lock reason is kept
+            if buffer and (
+                state := buffer.get_many([participant.pk]).get(participant.pk)
+            ):
+                participant.lock_reason = state["lock_reason"]
+
             participant.finished_at = timezone.now()
             participant.current_module = None
             participant.current_trial_index = None
-            participant.save()
+            participant.save(update_fields=["finished_at", *TRACKING_FIELDS])
+
+            if buffer:
+                buffer.delete(participant.pk)
 
         return participant
 
@@ -90,16 +161,14 @@ class SubmissionForm(forms.Form):
 
 class TermsAndConditionsForm(forms.Form):
     agreed = forms.BooleanField(required=False)
-    participant = forms.ModelChoiceField(
-        queryset=Participant.objects.all(),
-        to_field_name="participant_id",
+    participant = ParticipantChoiceField(
         error_messages={"invalid_choice": "Invalid participant"},
     )
 
     def save(self) -> Participant:
         participant = self.cleaned_data["participant"]
         participant.agreed_to_terms_and_conditions = self.cleaned_data["agreed"]
-        participant.save()
+        participant.save(update_fields=["agreed_to_terms_and_conditions", "udpated_at"])
         return participant
 
 
@@ -116,10 +185,7 @@ class VoucherPoolUnassigned(APIException):
 
 
 class VoucherForm(forms.Form):
-    participant = forms.ModelChoiceField(
-        queryset=Participant.objects.all(),
-        to_field_name="participant_id",
-    )
+    participant = ParticipantChoiceField()
 
     def clean(self) -> Dict[str, Any]:
         cleaned_data = super().clean()
@@ -151,24 +217,40 @@ class VoucherForm(forms.Form):
             pool = VoucherPool.objects.get(experiments=participant.experiment_id)
         except VoucherPool.DoesNotExist:
             raise VoucherPoolUnassigned()
-        voucher = pool.vouchers.filter(participant__isnull=True).first()
 
-        if voucher:
-            voucher.participant = participant
-            voucher.save()
-        else:
-            raise VoucherPoolEmpty(detail=pool.empty_pool_message)
+        with transaction.atomic():
+            # Lock the participant so concurrent requests from the same
+            # participant can't claim more than one voucher
+            participant = Participant.objects.select_for_update().get(pk=participant.pk)
+            if voucher := Voucher.objects.filter(participant=participant).first():
+                return voucher
+
+            # Skip vouchers that are being claimed by other participants
+            # rather than waiting for them. The lookup is backed by the
+            # voucher_unassigned_idx index.
+            voucher = (
+                pool.vouchers.select_for_update(skip_locked=True)
+                .filter(participant__isnull=True)
+                .order_by("pk")
+                .first()
+            )
+
+            if voucher:
+                voucher.participant = participant
+                voucher.save(update_fields=["participant"])
+            else:
+                raise VoucherPoolEmpty(detail=pool.empty_pool_message)
 
         return voucher
 
 
-class ParticipantTrackingForm(forms.Form):
-    participant = forms.ModelChoiceField(
-        queryset=Participant.objects.all(),
-        to_field_name="participant_id",
-    )
+class ParticipantTrackingForm(PrefetchedParticipantMixin, forms.Form):
+    participant = ParticipantChoiceField()
     module = forms.ModelChoiceField(
-        queryset=BaseModule.objects.all(), to_field_name="pk", required=False
+        # Only fear conditioning modules need telling apart
+        queryset=BaseModule.objects.select_subclasses(FearConditioningModule),
+        to_field_name="pk",
+        required=False,
     )
 
     trial_index = forms.IntegerField(required=False)
@@ -179,14 +261,14 @@ class ParticipantTrackingForm(forms.Form):
         if participant := cleaned_data.get("participant"):
             if module := cleaned_data.get("module"):
                 # Check module ID is valid for this participant
-                if module.experiment.pk != participant.experiment.pk:
+                if module.experiment_id != participant.experiment_id:
                     self.add_error(
                         "module",
                         "This module is not part of the assigned experiment.",
                     )
 
                 # Check trial index is supplied
-                if type(module.specific) == FearConditioningModule:
+                if isinstance(module, FearConditioningModule):
                     if cleaned_data["trial_index"] is None:
                         self.add_error(
                             "trial_index",
@@ -201,15 +283,40 @@ class ParticipantTrackingForm(forms.Form):
         if not self.is_valid():
             raise ValueError("Form should be valid before calling .save()")
 
-        # Update fields on participant
         participant: Participant = self.cleaned_data["participant"]
-        participant.current_module = (
-            self.cleaned_data["module"] or participant.current_module
-        )
+        buffer = get_tracking_buffer()
+
+        if buffer is None:
+            self.apply(participant)
+            participant.save(update_fields=TRACKING_FIELDS)
+            return participant
+
+        # Updates are applied on top of the latest state, which may not have
+        # been written to the database yet. If another update is buffered in
+        # the meantime, this one is applied again on top of that.
+        saved_state = get_tracking_state(participant)
+
+        while True:
+            state = buffer.get_many([participant.pk]).get(participant.pk)
+            participant.current_module_id = (state or saved_state)["current_module_id"]
+            participant.lock_reason = (state or saved_state)["lock_reason"]
+            self.apply(participant)
+
+            if buffer.compare_and_set(
+                participant.pk,
+                get_tracking_state(participant),
+                state["updated_at"] if state else None,
+            ):
+                break
+
+        maybe_flush_tracking_buffer()
+        return participant
+
+    def apply(self, participant: Participant) -> None:
+        if module := self.cleaned_data["module"]:
+            participant.current_module = module
         participant.current_trial_index = self.cleaned_data["trial_index"]
         participant.lock_reason = (
             self.cleaned_data["lock_reason"] or participant.lock_reason
         )
-        participant.save()
-
-        return participant
+        participant.udpated_at = timezone.now()
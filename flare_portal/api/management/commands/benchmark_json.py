@@ -0,0 +1,218 @@
+import hashlib
+import io
+import timeit
+from datetime import timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Tuple
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import transaction
+from django.db.models import BooleanField
+from django.utils import timezone
+
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from flare_portal.experiments.models import (
+    AffectiveRatingModule,
+    BasicInfoModule,
+    BreakEndModule,
+    BreakStartModule,
+    ContingencyAwarenessModule,
+    CriterionModule,
+    Experiment,
+    FearConditioningData,
+    FearConditioningModule,
+    InstructionsModule,
+    Participant,
+    PostExperimentQuestionsModule,
+    Project,
+    TaskInstructionsModule,
+    TextModule,
+    USUnpleasantnessModule,
+    WebModule,
+)
+
+from ... import parsers, renderers
+from ...configuration import build_configuration
+from ...registry import data_api_registry
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares DRF's JSON renderer and parser with the ones used by the API, "
+        "on a configuration payload and a batch of fear conditioning trials. "
+        "The experiment used is created in a transaction that's rolled back."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--number", type=int, default=1000)
+        parser.add_argument(
+            "--trials",
+            type=int,
+            default=100,
+            help="Number of trials in the batch of fear conditioning data",
+        )
+
+    def handle(self, *args: Any, number: int, trials: int, **options: Any) -> None:
+        if renderers.orjson is None:
+            self.stderr.write(
+                "orjson isn't installed, so the API uses DRF's JSON renderer and "
+                "parser."
+            )
+
+        config, rows, values = self.build_payloads(trials)
+
+        render_payloads = {
+            "configuration": config,
+            f"{trials} trials (serialized)": rows,
+            f"{trials} trials (model values)": values,
+        }
+        parse_payloads = {
+            "configuration": JSONRenderer().render(config),
+            f"{trials} trials": JSONRenderer().render(rows),
+        }
+
+        self.stdout.write(
+            f"{'':40} {'bytes':>9} {'DRF (µs)':>10} {'fast (µs)':>10} {'speedup':>8}"
+        )
+
+        for name, data in render_payloads.items():
+            self.write_row(
+                f"render {name}",
+                len(JSONRenderer().render(data)),
+                number,
+                lambda: JSONRenderer().render(data),
+                lambda: renderers.FastJSONRenderer().render(data),
+            )
+
+        for name, body in parse_payloads.items():
+            self.write_row(
+                f"parse {name}",
+                len(body),
+                number,
+                lambda: JSONParser().parse(io.BytesIO(body)),
+                lambda: parsers.FastJSONParser().parse(io.BytesIO(body)),
+            )
+
+    def write_row(
+        self,
+        name: str,
+        size: int,
+        number: int,
+        baseline: Callable[[], Any],
+        fast: Callable[[], Any],
+    ) -> None:
+        baseline_time = timeit.timeit(baseline, number=number) / number * 1e6
+        fast_time = timeit.timeit(fast, number=number) / number * 1e6
+
+        self.stdout.write(
+            f"{name:40} {size:>9} {baseline_time:>10.1f} {fast_time:>10.1f} "
+            f"{baseline_time / fast_time:>7.1f}x"
+        )
+
+    def build_payloads(
+        self, trials: int
+    ) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Returns a configuration payload for an experiment with one of each
+        module, along with a batch of trials as returned by the data endpoint
+        and as field values
+        """
+        with transaction.atomic():
+            user = User.objects.create(username="benchmark-json")
+            project = Project.objects.create(name="Benchmark", owner=user)
+            experiment = Experiment.objects.create(
+                name="Benchmark",
+                code="BENCH",
+                description="An experiment to benchmark JSON encoding. " * 10,
+                owner=user,
+                project=project,
+                trial_length=1,
+            )
+
+            modules = [
+                FearConditioningModule.objects.create(
+                    experiment=experiment,
+                    phase=phase,
+                    trials_per_stimulus=12,
+                    reinforcement_rate=6,
+                )
+                for phase in ["habituation", "acquisition", "extinction"]
+            ]
+            for module_class in [
+                BasicInfoModule,
+                CriterionModule,
+                WebModule,
+                InstructionsModule,
+                AffectiveRatingModule,
+                TextModule,
+                TaskInstructionsModule,
+                PostExperimentQuestionsModule,
+                USUnpleasantnessModule,
+                ContingencyAwarenessModule,
+            ]:
+                # Switch on all of the optional questions
+                questions = {
+                    field.name: True
+                    for field in module_class._meta.fields
+                    if isinstance(field, BooleanField) and not field.has_default()
+                }
+                module_class.objects.create(experiment=experiment, **questions)
+
+            break_start = BreakStartModule.objects.create(
+                experiment=experiment, duration=60
+            )
+            BreakEndModule.objects.create(
+                experiment=experiment, start_module=break_start
+            )
+
+            config = build_configuration(
+                experiment,
+                {
+                    field_name: {
+                        "url": f"https://example.com/media/{field_name}.mp3",
+                        "sha256": hashlib.sha256(field_name.encode()).hexdigest(),
+                    }
+                    for field_name in Experiment.ASSET_FIELDS
+                },
+            )
+
+            transaction.set_rollback(True)
+
+        participant = Participant(participant_id="BENCH.1", experiment=experiment)
+        started_at = timezone.now()
+        data = [
+            FearConditioningData(
+                participant=participant,
+                module=modules[0],
+                trial=trial,
+                trial_by_stimulus=(trial + 1) // 2,
+                rating=trial % 10,
+                stimulus="CSA" if trial % 2 else "CSB",
+                normalised_stimulus="CS+" if trial % 2 else "CS-",
+                reinforced_stimulus="CS+",
+                unconditional_stimulus=trial % 4 == 1,
+                trial_started_at=started_at + timedelta(seconds=trial * 8),
+                response_recorded_at=started_at + timedelta(seconds=trial * 8 + 3),
+                volume_level=Decimal("0.75"),
+                calibrated_volume_level=Decimal("0.50"),
+                headphones=True,
+            )
+            for trial in range(1, trials + 1)
+        ]
+
+        serializer_class = data_api_registry.serializers["fear-conditioning-data"]
+        rows = serializer_class(data, many=True).data
+        values = [
+            {
+                field.attname: getattr(obj, field.attname)
+                for field in FearConditioningData._meta.concrete_fields
+            }
+            for obj in data
+        ]
+
+        return dict(config), rows, values
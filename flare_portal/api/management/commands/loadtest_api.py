@@ -0,0 +1,167 @@
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional, Tuple
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandParser
+
+from flare_portal.experiments.models import (
+    Experiment,
+    FearConditioningModule,
+    Participant,
+    Project,
+)
+from flare_portal.experiments.participants import invalidate_participant_ids
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs participant sessions against the API of a running server and "
+        "reports the request throughput and latency. Run it against the site "
+        "served with gunicorn (WSGI) and then uvicorn (ASGI) to compare them. "
+        "The data used is created and deleted by the command, in the database "
+        "the server uses."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--url", default="http://127.0.0.1:8000")
+        parser.add_argument("--participants", type=int, default=200)
+        parser.add_argument(
+            "--trials",
+            type=int,
+            default=10,
+            help="Number of trials each participant submits data and tracking for",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=50,
+            help="Number of participants taking part at the same time",
+        )
+
+    def handle(
+        self,
+        *args: Any,
+        url: str,
+        participants: int,
+        trials: int,
+        concurrency: int,
+        **options: Any,
+    ) -> None:
+        suffix = uuid.uuid4().hex[:6]
+        api_url = url.rstrip("/") + "/api/v1/"
+
+        user = User.objects.create(username=f"loadtest-{suffix}")
+        project = Project.objects.create(name=f"Load test {suffix}", owner=user)
+        experiment = Experiment.objects.create(
+            name=f"Load test {suffix}",
+            code=suffix,
+            owner=user,
+            project=project,
+            trial_length=1,
+        )
+
+        module = FearConditioningModule.objects.create(
+            experiment=experiment,
+            phase="habituation",
+            trials_per_stimulus=trials,
+            reinforcement_rate=1,
+        )
+
+        try:
+            participant_ids = [
+                participant.participant_id
+                for participant in Participant.objects.bulk_create(
+                    Participant(participant_id=f"{suffix}.{i}", experiment=experiment)
+                    for i in range(participants)
+                )
+            ]
+            invalidate_participant_ids()
+
+            def request(path: str, data: Optional[dict] = None) -> Tuple[float, bool]:
+                http_request = urllib.request.Request(
+                    api_url + path,
+                    data=None if data is None else json.dumps(data).encode(),
+                    headers={"Content-Type": "application/json"},
+                )
+                started = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(http_request, timeout=60) as response:
+                        response.read()
+                    ok = True
+                except (urllib.error.URLError, OSError):
+                    ok = False
+                return time.perf_counter() - started, ok
+
+            def run_session(participant_id: str) -> List[Tuple[float, bool]]:
+                results = [request("configuration/", {"participant": participant_id})]
+
+                for trial in range(1, trials + 1):
+                    results.append(
+                        request(
+                            "fear-conditioning-data/",
+                            {
+                                "participant": participant_id,
+                                "module": module.pk,
+                                "trial": trial,
+                                "trial_by_stimulus": trial,
+                                "rating": 5,
+                                "stimulus": "CSA",
+                                "unconditional_stimulus": False,
+                                "trial_started_at": "2020-01-01T00:00Z",
+                                "volume_level": "0.50",
+                                "calibrated_volume_level": "0.50",
+                                "headphones": True,
+                            },
+                        )
+                    )
+                    results.append(
+                        request(
+                            "tracking/",
+                            {
+                                "participant": participant_id,
+                                "module": module.pk,
+                                "trial_index": trial,
+                            },
+                        )
+                    )
+
+                results.append(request("submission/", {"participant": participant_id}))
+                return results
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = [
+                    result
+                    for session in executor.map(run_session, participant_ids)
+                    for result in session
+                ]
+            elapsed = time.perf_counter() - started
+
+            latencies = sorted(latency for latency, ok in results)
+            failed = sum(not ok for latency, ok in results)
+            percentiles = statistics.quantiles(latencies, n=100)
+
+            self.stdout.write(
+                f"{len(results)} requests from {participants} participants "
+                f"({concurrency} at a time) in {elapsed:.2f}s "
+                f"({len(results) / elapsed:.0f} requests/s), {failed} failed"
+            )
+            self.stdout.write(
+                f"Latency: p50 {percentiles[49] * 1000:.0f}ms, "
+                f"p95 {percentiles[94] * 1000:.0f}ms, "
+                f"p99 {percentiles[98] * 1000:.0f}ms"
+            )
+        finally:
+            experiment.participants.all().delete()
+            module.data.all().delete()
+            experiment.delete()
+            project.delete()
+            user.delete()
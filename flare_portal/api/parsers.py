@@ -0,0 +1,54 @@
+import json
+from typing import IO, Any, Mapping, Optional
+
+from django.conf import settings
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from .renderers import FastJSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+
+def loads(data: bytes) -> Any:
+    """
+    Decodes UTF-8 encoded JSON with orjson, when it's installed
+
+    Raises ValueError if the JSON is invalid.
+    """
+    if orjson is None:
+        return json.loads(data)
+
+    return orjson.loads(data)
+
+
+class FastJSONParser(JSONParser):
+    """
+    Parses JSON with orjson, when it's installed
+
+    Falls back to JSONParser when orjson isn't installed, or the request isn't
+    UTF-8 encoded.
+    """
+
+    renderer_class = FastJSONRenderer
+
+    def parse(
+        self,
+        stream: IO[bytes],
+        media_type: Optional[str] = None,
+        parser_context: Optional[Mapping[str, Any]] = None,
+    ) -> Any:
+        encoding = (parser_context or {}).get("encoding", settings.DEFAULT_CHARSET)
+
+        if orjson is None or encoding.lower().replace("-", "") != "utf8":
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            # orjson rejects NaN and infinity, like JSONParser in strict mode
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError("JSON parse error - %s" % exc)
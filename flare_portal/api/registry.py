@@ -1,28 +1,246 @@
-from typing import Callable, Dict, List, Type
+import hashlib
+import json
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Type
 
-from django.db import transaction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connection, models, transaction
 from django.urls import URLPattern, path
 
 from rest_framework import serializers
-from rest_framework.generics import CreateAPIView
+from rest_framework.generics import CreateAPIView, GenericAPIView
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.validators import UniqueTogetherValidator
 
 from flare_portal.experiments.models import (
     AffectiveRatingData,
     BaseData,
+    BaseModule,
     BasicInfoData,
     ContingencyAwarenessData,
     CriterionData,
+    CriterionQuestion,
+    Experiment,
     FearConditioningData,
     Participant,
     PostExperimentQuestionsData,
     USUnpleasantnessData,
     VolumeCalibrationData,
 )
+from flare_portal.experiments.participants import (
+    evict_deleted_participants,
+    get_participants,
+    is_cached_participant,
+    participant_id_may_exist,
+)
+from flare_portal.utils.cache import LocalCache
+
+# Kept apart from the configuration payloads, so neither evicts the other
+_experiment_index_cache = LocalCache("API_EXPERIMENT_INDEX_CACHE_SIZE")
+
+
+class PrefetchedRelatedFieldMixin:
+    """
+    Resolves related objects from the serializer context if they have been
+    prefetched, falling back to a database lookup otherwise.
+    """
+
+    field_name: str
+    context: Dict[str, Any]
+
+    def to_internal_value(self, data: Any) -> Any:
+        prefetched = self.context.get("prefetched_objects", {})
+        try:
+            return prefetched[self.field_name][str(data)]
+        except KeyError:
+            return super().to_internal_value(data)  # type: ignore
+
+
+class PrefetchedPrimaryKeyRelatedField(
+    PrefetchedRelatedFieldMixin, serializers.PrimaryKeyRelatedField
+):
+    pass
+
+
+class PrefetchedSlugRelatedField(
+    PrefetchedRelatedFieldMixin, serializers.SlugRelatedField
+):
+    pass
+
+
+class PrefetchedParticipantField(PrefetchedSlugRelatedField):
+    """
+    Rejects participant IDs that are known not to exist without querying the
+    database
+    """
+
+    def to_internal_value(self, data: Any) -> Any:
+        prefetched = self.context.get("prefetched_objects", {})
+        if (
+            isinstance(data, str)
+            and data not in prefetched.get(self.field_name, {})
+            and not participant_id_may_exist(data)
+        ):
+            self.fail("does_not_exist", slug_name=self.slug_field, value=data)
+
+        return super().to_internal_value(data)
+
+
+class ExperimentIndex:
+    """
+    Maps the primary keys of an experiment's modules and criterion questions to
+    what's needed to validate data rows that reference them, so they don't
+    need looking up for every submission
+    """
+
+    def __init__(self, experiment_id: int) -> None:
+        self.experiment_id = experiment_id
+        self.module_classes: Dict[int, Type[BaseModule]] = {
+            module.pk: type(module)
+            for module in BaseModule.objects.filter(
+                experiment_id=experiment_id
+            ).select_subclasses()
+        }
+        self.question_modules: Dict[int, int] = dict(
+            CriterionQuestion.objects.filter(
+                module__experiment_id=experiment_id
+            ).values_list("pk", "module_id")
+        )
+
+    @staticmethod
+    def is_indexed(model: Type[models.Model]) -> bool:
+        return issubclass(model, (BaseModule, CriterionQuestion))
+
+    def get_object(self, model: Type[models.Model], pk: int) -> Optional[models.Model]:
+        """
+        Returns an unsaved instance with the primary key and the foreign keys
+        used in validation, if the object is in the experiment
+        """
+        if issubclass(model, BaseModule):
+            module_class = self.module_classes.get(pk)
+            if module_class is not None and issubclass(module_class, model):
+                return model(pk=pk, experiment_id=self.experiment_id)
+        elif issubclass(model, CriterionQuestion):
+            module_id = self.question_modules.get(pk)
+            if module_id is not None:
+                return model(pk=pk, module_id=module_id)
+
+        return None
+
+
+def get_experiment_index(experiment: Experiment) -> ExperimentIndex:
+    """
+    Returns the index of the experiment's modules and criterion questions
+
+    Indexes are cached in-process by config version, which changes whenever a
+    module or question is added, changed or deleted.
+    """
+    key = f"api:data-index:{experiment.pk}:{experiment.config_version}"
+
+    if index := _experiment_index_cache.get(key):
+        return index
+
+    index = ExperimentIndex(experiment.pk)
+    _experiment_index_cache.set(key, index, settings.API_CONFIGURATION_CACHE_TIMEOUT)
+
+    return index
+
+
+def prefetch_related_objects(
+    serializer_class: Type[serializers.ModelSerializer],
+    rows: List[Any],
+    prefetched: Optional[Dict[str, Dict[str, models.Model]]] = None,
+) -> Dict[str, Dict[str, models.Model]]:
+    """
+    Fetches the related objects referenced by the rows. Fields that are
+    already in prefetched aren't fetched again.
+
+    Participants are fetched along with their experiments, and may come from
+    the cache in flare_portal.experiments.participants. Their experiments'
+    indexes are used to resolve modules and criterion questions. Other related objects
+    are fetched with one query per field.
+
+    The result is passed to the serializers as the "prefetched_objects"
+    context variable. Values that couldn't be resolved are left out, so the
+    fields look them up (and report them if they're invalid) themselves.
+    """
+    prefetched = dict(prefetched or {})
+    related_fields = {
+        field_name: field
+        for field_name, field in serializer_class().fields.items()
+        if isinstance(field, PrefetchedRelatedFieldMixin)
+        and field_name not in prefetched
+    }
+
+    # Participants come first, as they determine which indexes are used
+    if related_fields.pop("participant", None):
+        prefetched["participant"] = get_participants(  # type: ignore
+            get_lookup_values("participant", "participant_id", rows)
+        )
+
+    indexes = [
+        get_experiment_index(participant.experiment)  # type: ignore
+        for participant in prefetched.get("participant", {}).values()
+    ]
+
+    for field_name, field in related_fields.items():
+        model = field.get_queryset().model  # type: ignore
+
+        if indexes and ExperimentIndex.is_indexed(model):
+            prefetched[field_name] = {}
+            for value in get_lookup_values(field_name, "pk", rows):
+                for index in indexes:
+                    if obj := index.get_object(model, int(value)):
+                        prefetched[field_name][value] = obj
+                        break
+        else:
+            prefetched[field_name] = fetch_related_objects(field_name, field, rows)
+
+    return prefetched
+
+
+def get_lookup_values(field_name: str, lookup_field: str, rows: List[Any]) -> Set[str]:
+    values = set()
+    for row in rows:
+        if not isinstance(row, dict) or row.get(field_name) is None:
+            continue
+
+        value = str(row[field_name])
+        if lookup_field == "pk" and not value.isdigit():
+            # Leave invalid primary keys to the field's own validation
+            continue
+
+        values.add(value)
+
+    return values
+
+
+def fetch_related_objects(
+    field_name: str, field: PrefetchedRelatedFieldMixin, rows: List[Any]
+) -> Dict[str, models.Model]:
+    lookup_field = getattr(field, "slug_field", "pk")
+    values = get_lookup_values(field_name, lookup_field, rows)
+
+    if not values:
+        return {}
+
+    return {
+        str(getattr(obj, lookup_field)): obj
+        for obj in field.get_queryset().filter(  # type: ignore
+            **{f"{lookup_field}__in": values}
+        )
+    }
 
 
 class DataSerializerMixin(serializers.ModelSerializer):
-    participant = serializers.SlugRelatedField(
-        slug_field="participant_id", queryset=Participant.objects.all()
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+
+    participant = PrefetchedParticipantField(
+        slug_field="participant_id",
+        # The experiment is needed to resolve modules from its index
+        queryset=Participant.objects.select_related("experiment"),
     )
 
     def validate(self, data: Dict) -> Dict:
@@ -47,22 +265,385 @@ class DataSerializerMixin(serializers.ModelSerializer):
         return data
 
 
+class DeferredUniqueDataSerializerMixin(serializers.ModelSerializer):
+    def get_unique_together_validators(self) -> List[UniqueTogetherValidator]:
+        # Uniqueness is checked by the view, which can then acknowledge
+        # replayed submissions rather than reject them
+        return []
+
+
+def get_natural_key(model: Type[BaseData]) -> Tuple[str, ...]:
+    """
+    Returns the attribute names of the fields that identify a data row
+    """
+    return tuple(
+        model._meta.get_field(field).attname for field in model._meta.unique_together[0]
+    )
+
+
+def get_unique_together_error(model: Type[BaseData]) -> Dict[str, List[str]]:
+    return {
+        serializers.api_settings.NON_FIELD_ERRORS_KEY: [
+            UniqueTogetherValidator.message.format(
+                field_names=", ".join(model._meta.unique_together[0])
+            )
+        ]
+    }
+
+
+def check_participants_exist(participants: Iterable[Participant]) -> None:
+    """
+    Raises an IntegrityError if data has been saved for cached participants
+    that have since been deleted
+
+    Foreign keys are otherwise only checked when the view's transaction
+    commits, when it's too late to report the participants as invalid.
+    """
+    if any(is_cached_participant(participant) for participant in participants):
+        connection.check_constraints()
+
+
+def get_deleted_participant_error(participant: Participant) -> Dict[str, List[str]]:
+    return {
+        "participant": [
+            serializers.SlugRelatedField.default_error_messages[
+                "does_not_exist"
+            ].format(slug_name="participant_id", value=participant.participant_id)
+        ]
+    }
+
+
+class IdempotencyMixin:
+    """
+    Replays the response to a previous request with the same Idempotency-Key
+    header
+
+    Keys are scoped to the participants in the request. Reusing a key with a
+    different payload is rejected with a 422 status code, rather than
+    replaying a response to a request that wasn't made.
+    """
+
+    request: Request
+
+    def get_idempotency_participants(self) -> List[str]:
+        data = self.request.data
+        items = data if isinstance(data, list) else [data]
+        return sorted(
+            {str(item.get("participant")) for item in items if isinstance(item, dict)}
+        )
+
+    def get_idempotency_cache_key(self) -> Optional[str]:
+        key = self.request.headers.get("Idempotency-Key")
+
+        if not key:
+            return None
+
+        scope = json.dumps([self.get_idempotency_participants(), key])
+        key_hash = hashlib.sha256(scope.encode()).hexdigest()
+        return f"api:idempotency:{self.request.path}:{key_hash}"
+
+    def get_request_hash(self) -> str:
+        payload = json.dumps(self.request.data, sort_keys=True, cls=DjangoJSONEncoder)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get_replayed_response(self, cache_key: str) -> Optional[Response]:
+        cached = cache.get(cache_key)
+
+        if cached is None:
+            return None
+
+        request_hash, data = cached
+        if request_hash != self.get_request_hash():
+            return Response(
+                {
+                    "detail": "The Idempotency-Key header has already been used "
+                    "for a different request."
+                },
+                status=422,
+            )
+
+        return Response(data)
+
+    def store_response(self, cache_key: str, data: Any) -> None:
+        cached = (self.get_request_hash(), data)
+        # Only make the response replayable once the data has been saved
+        transaction.on_commit(
+            lambda: cache.set(cache_key, cached, settings.API_IDEMPOTENCY_KEY_TIMEOUT)
+        )
+
+
+def is_same_row(instance: BaseData, saved: BaseData) -> bool:
+    """
+    Checks whether a submitted data row has the same values as a saved one
+    """
+    return all(
+        getattr(instance, field.attname) == getattr(saved, field.attname)
+        for field in instance._meta.concrete_fields
+        if not field.primary_key
+    )
+
+
+class DataCreateAPIView(IdempotencyMixin, CreateAPIView):
+    """
+    Creates a data row
+
+    Submissions with an Idempotency-Key header can safely be retried. A
+    replayed submission, or one for a row that has already been saved with
+    the same values, is acknowledged with the saved row and a 200 status code.
+    """
+
+    deferred_unique_serializer_class: Type[serializers.ModelSerializer]
+
+    def create(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        cache_key = self.get_idempotency_cache_key()
+
+        if cache_key:
+            response = self.get_replayed_response(cache_key)
+            if response is not None:
+                return response
+
+            serializer_class = self.deferred_unique_serializer_class
+        else:
+            serializer_class = self.get_serializer_class()
+
+        context = {
+            **self.get_serializer_context(),
+            "prefetched_objects": prefetch_related_objects(
+                serializer_class, [request.data]
+            ),
+        }
+        serializer = serializer_class(data=request.data, context=context)
+
+        serializer.is_valid(raise_exception=True)
+        model = serializer.Meta.model
+        submitted = model(**serializer.validated_data)
+        natural_key = {
+            field: getattr(submitted, field) for field in get_natural_key(model)
+        }
+
+        instance = model.objects.filter(**natural_key).first() if cache_key else None
+        status = 200
+
+        if instance is None:
+            try:
+                with transaction.atomic():
+                    instance = serializer.save()
+                    check_participants_exist([submitted.participant])
+                status = 201
+            except IntegrityError:
+                # A concurrent request has saved the same row since it was
+                # validated, or the participant was deleted after being cached
+                instance = model.objects.filter(**natural_key).first()
+                if instance is None:
+                    if evict_deleted_participants([submitted.participant]):
+                        raise serializers.ValidationError(
+                            get_deleted_participant_error(submitted.participant)
+                        )
+                    raise
+                if not cache_key:
+                    raise serializers.ValidationError(get_unique_together_error(model))
+
+        if status == 200 and not is_same_row(submitted, instance):
+            raise serializers.ValidationError(get_unique_together_error(model))
+
+        data = self.get_serializer(instance).data
+
+        if cache_key:
+            self.store_response(cache_key, data)
+
+        return Response(data, status=status, headers=self.get_success_headers(data))
+
+
+class DataBatchCreateAPIView(IdempotencyMixin, GenericAPIView):
+    """
+    Creates a list of data rows
+
+    Related objects are looked up once for the whole batch and the valid rows
+    are inserted with a single query. The response contains a result for each
+    submitted row, in the same order.
+
+    Rows that have already been saved are invalid, unless the request has an
+    Idempotency-Key header and the saved row has the same values, in which
+    case they are acknowledged with the saved row's ID.
+    """
+
+    max_batch_size = 1000
+
+    def post(self, request: Request, format: str = None) -> Response:
+        rows = request.data
+
+        if not isinstance(rows, list):
+            raise serializers.ValidationError(
+                {
+                    serializers.api_settings.NON_FIELD_ERRORS_KEY: [
+                        "Expected a list of items."
+                    ]
+                }
+            )
+
+        if len(rows) > self.max_batch_size:
+            raise serializers.ValidationError(
+                {
+                    serializers.api_settings.NON_FIELD_ERRORS_KEY: [
+                        f"Ensure there are no more than {self.max_batch_size} items."
+                    ]
+                }
+            )
+
+        cache_key = self.get_idempotency_cache_key()
+
+        if cache_key:
+            response = self.get_replayed_response(cache_key)
+            if response is not None:
+                return response
+
+        serializer_class = self.get_serializer_class()
+        context = {
+            **self.get_serializer_context(),
+            "prefetched_objects": prefetch_related_objects(serializer_class, rows),
+        }
+
+        results = save_data_rows(
+            serializer_class, rows, context, acknowledge_existing=bool(cache_key)
+        )
+        data = summarise_data_results(results)
+
+        if cache_key:
+            self.store_response(cache_key, data)
+
+        return Response(data)
+
+
+def get_duplicates(
+    model: Type[BaseData], instances: Dict[int, BaseData]
+) -> Dict[int, BaseData]:
+    """
+    Maps the indexes of rows that conflict with saved data to the saved row,
+    and of rows that conflict with an earlier row in the batch to that row
+    """
+    natural_key = get_natural_key(model)
+    seen: Dict[Tuple, BaseData] = {
+        tuple(getattr(saved, field) for field in natural_key): saved
+        for saved in model.objects.filter(
+            **{
+                f"{field}__in": {
+                    getattr(instance, field) for instance in instances.values()
+                }
+                for field in natural_key
+            }
+        )
+    }
+    duplicates = {}
+
+    for index, instance in instances.items():
+        key = tuple(getattr(instance, field) for field in natural_key)
+        if key in seen:
+            duplicates[index] = seen[key]
+        else:
+            seen[key] = instance
+
+    return duplicates
+
+
+def save_data_rows(
+    serializer_class: Type[serializers.ModelSerializer],
+    rows: List[Any],
+    context: Dict[str, Any],
+    acknowledge_existing: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Validates the rows and inserts the valid ones with a single query
+
+    The serializer class shouldn't check uniqueness, which is done here for
+    the whole batch. Rows that have already been saved are invalid, unless
+    acknowledge_existing is set and the saved row has the same values.
+    Returns a result for each row, in the same order.
+    """
+    model = serializer_class.Meta.model
+    results: List[Dict[str, Any]] = []
+    instances: Dict[int, BaseData] = {}
+
+    for index, row in enumerate(rows):
+        serializer = serializer_class(data=row, context=context)
+        if serializer.is_valid():
+            instances[index] = model(**serializer.validated_data)
+            results.append({"status": "created"})
+        else:
+            results.append({"status": "invalid", "errors": serializer.errors})
+
+    duplicates = get_duplicates(model, instances)
+
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create(
+                instance
+                for index, instance in instances.items()
+                if index not in duplicates
+            )
+            check_participants_exist(
+                {instance.participant for instance in instances.values()}
+            )
+    except IntegrityError:
+        # A concurrent request has saved some of the rows since they were
+        # checked, or participants were deleted after being cached
+        for participant in evict_deleted_participants(
+            {instance.participant for instance in instances.values()}
+        ):
+            for index, instance in list(instances.items()):
+                if instance.participant_id == participant.pk:
+                    del instances[index]
+                    results[index] = {
+                        "status": "invalid",
+                        "errors": get_deleted_participant_error(participant),
+                    }
+
+        duplicates = get_duplicates(model, instances)
+        model.objects.bulk_create(
+            instance for index, instance in instances.items() if index not in duplicates
+        )
+
+    for index, instance in instances.items():
+        if index not in duplicates:
+            results[index]["id"] = instance.pk
+        elif acknowledge_existing and is_same_row(instance, duplicates[index]):
+            results[index] = {"status": "existing", "id": duplicates[index].pk}
+        else:
+            results[index] = {
+                "status": "invalid",
+                "errors": get_unique_together_error(model),
+            }
+
+    return results
+
+
+def summarise_data_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    data: Dict[str, Any] = {
+        status: sum(result["status"] == status for result in results)
+        for status in ["created", "existing", "invalid"]
+    }
+    data["results"] = results
+    return data
+
+
 class DataAPIRegistry:
     """
     Registry for module data
 
     Registering a module data model to this registry will generate a create API
-    endpoint for that model
+    endpoint, and a batch create API endpoint for that model
     """
 
     def __init__(self) -> None:
         self.data_models: List[Type[BaseData]] = []
         self.urls: List[URLPattern] = []
         self.views: Dict[str, Callable] = {}
+        # Serializers for creating data in batches, keyed by module slug
+        self.serializers: Dict[str, Type[serializers.ModelSerializer]] = {}
 
     def register(self, data_class: Type[BaseData]) -> None:
         """
-        Creates a CreateAPIView for the data class
+        Creates a DataCreateAPIView and a DataBatchCreateAPIView for the data
+        class
         """
         module_camel_case = data_class.get_module_camel_case()
         self.data_models.append(data_class)
@@ -74,18 +655,49 @@ class DataAPIRegistry:
         serializer_class = type(
             f"{module_camel_case}Serializer", (DataSerializerMixin,), {"Meta": Meta}
         )
+        deferred_unique_serializer_class = type(
+            f"{module_camel_case}DeferredUniqueSerializer",
+            (DeferredUniqueDataSerializerMixin, serializer_class),
+            {},
+        )
+
+        self.serializers[
+            data_class.get_module_slug()
+        ] = deferred_unique_serializer_class
 
         api_path = data_class.get_module_slug() + "/"
         api_view_name = data_class.get_module_snake_case()
-        api_view_class: CreateAPIView = type(
+        api_view_class: DataCreateAPIView = type(
             f"{module_camel_case}APIView",
-            (CreateAPIView,),
-            {"serializer_class": serializer_class},
+            (DataCreateAPIView,),
+            {
+                "serializer_class": serializer_class,
+                "deferred_unique_serializer_class": deferred_unique_serializer_class,
+            },
         )
 
         self.views[api_view_name] = transaction.atomic(api_view_class.as_view())
         self.urls.append(path(api_path, self.views[api_view_name], name=api_view_name))
 
+        # Batch create view
+        batch_api_view_name = f"{api_view_name}_batch"
+        batch_api_view_class: DataBatchCreateAPIView = type(
+            f"{module_camel_case}BatchAPIView",
+            (DataBatchCreateAPIView,),
+            {"serializer_class": deferred_unique_serializer_class},
+        )
+
+        self.views[batch_api_view_name] = transaction.atomic(
+            batch_api_view_class.as_view()
+        )
+        self.urls.append(
+            path(
+                f"{api_path}batch/",
+                self.views[batch_api_view_name],
+                name=batch_api_view_name,
+            )
+        )
+
 
 data_api_registry = DataAPIRegistry()
 
@@ -0,0 +1,78 @@
+from typing import Any, Mapping, Optional
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+# Characters that JSONRenderer escapes, so the JSON is valid JavaScript
+LINE_SEPARATOR = "\u2028".encode()
+PARAGRAPH_SEPARATOR = "\u2029".encode()
+
+encoder = JSONEncoder()
+
+
+def default(obj: Any) -> Any:
+    """
+    Converts objects orjson can't encode like the json module would
+
+    Subclasses of builtin types are handled here too, as orjson reads them
+    directly, which is wrong for some (e.g. Django's ErrorList, which keeps
+    its items in an attribute).
+    """
+    if isinstance(obj, str):
+        return str.__str__(obj)
+    if isinstance(obj, int):
+        return int.__int__(obj)
+    if isinstance(obj, dict):
+        return dict(obj)
+    if isinstance(obj, list):
+        return list(obj)
+
+    return encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Renders JSON with orjson, when it's installed
+
+    The output is the same as JSONRenderer's, which is used when orjson isn't
+    installed, the output should be indented or ASCII only, or orjson can't
+    encode the data (e.g. integers over 64 bits). NaN and infinity are
+    rendered as null rather than raising an error.
+    """
+
+    def render(
+        self,
+        data: Any,
+        accepted_media_type: Optional[str] = None,
+        renderer_context: Optional[Mapping[str, Any]] = None,
+    ) -> bytes:
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=default,
+                option=(
+                    orjson.OPT_NON_STR_KEYS
+                    | orjson.OPT_PASSTHROUGH_SUBCLASS
+                    | orjson.OPT_UTC_Z
+                ),
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return ret.replace(LINE_SEPARATOR, b"\\u2028").replace(
+            PARAGRAPH_SEPARATOR, b"\\u2029"
+        )
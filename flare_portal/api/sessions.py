@@ -0,0 +1,188 @@
+"""
+Importing of whole session logs
+
+Apps that can't stay online hold on to a participant's data, and upload the
+whole session at once as newline delimited JSON, which may be gzipped. Each
+line is either a data row for one of the registered data endpoints, or a
+tracking event:
+
+    {"type": "data", "module": "fear-conditioning-data", "row": {...}}
+    {"type": "tracking", "module": 7, "trial_index": 2}
+
+The log is parsed as it's read, and the data rows are saved in chunks.
+"""
+import gzip
+import zlib
+from collections import defaultdict
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+from flare_portal.experiments.models import Participant
+
+from .forms import ParticipantTrackingForm
+from .parsers import loads
+from .registry import data_api_registry, prefetch_related_objects, save_data_rows
+
+
+class SessionLogError(Exception):
+    pass
+
+
+def iter_session_log(
+    stream: IO[bytes], max_line_size: int
+) -> Iterator[Tuple[int, Any]]:
+    """
+    Yields the line number and the decoded JSON of each non-blank line of the
+    stream, or None for lines that aren't valid JSON
+
+    Raises SessionLogError if a line is longer than max_line_size bytes, or
+    the stream isn't valid gzip.
+    """
+    line_number = 0
+
+    while True:
+        try:
+            line = stream.readline(max_line_size + 1)
+        except (EOFError, OSError, zlib.error):
+            raise SessionLogError("The body is not valid gzip.")
+
+        if not line:
+            return
+
+        line_number += 1
+
+        if len(line) > max_line_size:
+            raise SessionLogError(
+                f"Line {line_number} is longer than {max_line_size} bytes."
+            )
+
+        if not line.strip():
+            continue
+
+        try:
+            yield line_number, loads(line)
+        except ValueError:
+            yield line_number, None
+
+
+def open_session_log(stream: IO[bytes], content_encoding: str) -> IO[bytes]:
+    if content_encoding.lower() == "gzip":
+        return gzip.GzipFile(fileobj=stream, mode="rb")  # type: ignore
+
+    return stream
+
+
+class SessionLogImporter:
+    """
+    Saves the entries of a participant's session log
+
+    Data rows are buffered per endpoint and saved chunk_size at a time. Rows
+    that have already been saved are acknowledged rather than rejected, so an
+    interrupted upload can be sent again. Tracking events are combined as
+    they would be by the tracking endpoint, and only the resulting state is
+    saved.
+    """
+
+    max_errors = 100
+
+    def __init__(
+        self, participant: Participant, context: Dict[str, Any], chunk_size: int
+    ) -> None:
+        self.participant = participant
+        self.context = context
+        self.chunk_size = chunk_size
+
+        self.pending_rows: Dict[str, List[Tuple[int, Any]]] = defaultdict(list)
+        self.counts = {"created": 0, "existing": 0, "invalid": 0}
+        self.errors: List[Dict[str, Any]] = []
+
+        self.tracking: Optional[Dict[str, Any]] = None
+        self.tracking_line_number = 0
+
+    def add_error(self, line_number: int, errors: Any) -> None:
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line_number, "errors": errors})
+
+    def add(self, line_number: int, entry: Any) -> None:
+        entry_type = entry.get("type") if isinstance(entry, dict) else None
+
+        if entry_type == "data":
+            module = entry.get("module")
+            row = entry.get("row")
+
+            if module not in data_api_registry.serializers:
+                errors: Dict[str, List[str]] = {"module": ["Invalid data module."]}
+            elif not isinstance(row, dict):
+                errors = {"row": ["Expected an object."]}
+            else:
+                # Rows always belong to the uploading participant
+                row = {**row, "participant": self.participant.participant_id}
+                self.pending_rows[module].append((line_number, row))
+
+                if len(self.pending_rows[module]) >= self.chunk_size:
+                    self.save_rows(module)
+                return
+        elif entry_type == "tracking":
+            previous = self.tracking or {}
+            self.tracking = {
+                "module": entry.get("module") or previous.get("module"),
+                "trial_index": entry.get("trial_index"),
+                "lock_reason": entry.get("lock_reason") or previous.get("lock_reason"),
+            }
+            self.tracking_line_number = line_number
+            return
+        elif entry is None:
+            errors = {"non_field_errors": ["Invalid JSON."]}
+        else:
+            errors = {"type": ['Expected "data" or "tracking".']}
+
+        self.counts["invalid"] += 1
+        self.add_error(line_number, errors)
+
+    def save_rows(self, module: str) -> None:
+        serializer_class = data_api_registry.serializers[module]
+        line_numbers, rows = zip(*self.pending_rows.pop(module))
+        context = {
+            **self.context,
+            "prefetched_objects": prefetch_related_objects(
+                serializer_class,
+                list(rows),
+                {"participant": {self.participant.participant_id: self.participant}},
+            ),
+        }
+
+        results = save_data_rows(
+            serializer_class, list(rows), context, acknowledge_existing=True
+        )
+
+        for line_number, result in zip(line_numbers, results):
+            self.counts[result["status"]] += 1
+            if result["status"] == "invalid":
+                self.add_error(line_number, result["errors"])
+
+    def finish(self) -> Dict[str, Any]:
+        """
+        Saves the remaining rows and the tracking state, and returns a summary
+        of the upload
+        """
+        for module in list(self.pending_rows):
+            self.save_rows(module)
+
+        tracking = None
+        if self.tracking is not None:
+            form = ParticipantTrackingForm(self.tracking, participant=self.participant)
+            if form.is_valid():
+                participant = form.save()
+                tracking = {
+                    "current_module": participant.current_module_id,
+                    "current_trial": participant.current_trial_index,
+                    "lock_reason": participant.lock_reason or None,
+                }
+            else:
+                self.add_error(self.tracking_line_number, form.errors)
+
+        return {
+            "participant": self.participant.participant_id,
+            **self.counts,
+            "errors": sorted(self.errors, key=lambda error: error["line"]),
+            "tracking": tracking,
+        }
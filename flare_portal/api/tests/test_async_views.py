@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+from django.core.handlers.asgi import ASGIHandler
+from django.http import HttpRequest, HttpResponse
+from django.test import AsyncRequestFactory, TransactionTestCase
+from django.urls import reverse
+
+from asgiref.sync import async_to_sync
+
+from flare_portal.experiments.factories import (
+    ExperimentFactory,
+    FearConditioningModuleFactory,
+    ParticipantFactory,
+)
+from flare_portal.experiments.models import Participant
+
+from ..async_views import async_view
+from ..views import tracking_api_view
+
+
+class AsyncViewTest(TransactionTestCase):
+    def test_view(self) -> None:
+        experiment = ExperimentFactory()
+        module = FearConditioningModuleFactory(experiment=experiment)
+        participant: Participant = ParticipantFactory(experiment=experiment)
+        view = async_view(tracking_api_view)
+
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+        self.assertTrue(view.csrf_exempt)  # type: ignore
+
+        request = AsyncRequestFactory().post(
+            reverse("api:tracking"),
+            {
+                "participant": participant.participant_id,
+                "module": module.pk,
+                "trial_index": 1,
+            },
+            content_type="application/json",
+        )
+        resp = async_to_sync(view)(request)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(
+            resp.rendered_content,
+            (
+                '{"participant":"%s","lock_reason":null,"current_module":%d,'
+                '"current_trial":1}' % (participant.participant_id, module.pk)
+            ).encode(),
+        )
+
+        participant.refresh_from_db()
+        self.assertEqual(participant.current_module_id, module.pk)
+
+    def test_concurrency(self) -> None:
+        # Each request waits for the others, so this only finishes if they're
+        # handled at the same time
+        barrier = threading.Barrier(3, timeout=5)
+
+        def view(request: HttpRequest) -> HttpResponse:
+            barrier.wait()
+            return HttpResponse(threading.get_ident())
+
+        wrapped_view = async_view(view)
+        request = AsyncRequestFactory().get("/")
+
+        async def get_all() -> list:
+            return await asyncio.gather(*(wrapped_view(request) for _ in range(3)))
+
+        responses = async_to_sync(get_all)()
+
+        self.assertEqual(len({resp.content for resp in responses}), 3)
+
+    def test_middleware_chain_is_async(self) -> None:
+        # A sync only middleware would make Django run the rest of the chain,
+        # and the views, one request at a time under ASGI
+        handler = ASGIHandler()._middleware_chain
+
+        while handler is not None:
+            self.assertTrue(asyncio.iscoroutinefunction(handler), handler)
+            handler = getattr(handler, "__wrapped__", handler)
+            handler = getattr(handler, "get_response", None)
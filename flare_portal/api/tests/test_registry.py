@@ -17,3 +17,11 @@ class DataRegistryTest(TestCase):
         )
         self.assertEqual(registry.urls[0].name, "fear_conditioning_data")
         self.assertEqual(registry.data_models, [FearConditioningData])
+
+        self.assertEqual(
+            registry.urls[1].pattern._route, "fear-conditioning-data/batch/"
+        )
+        self.assertEqual(
+            registry.urls[1].callback, registry.views["fear_conditioning_data_batch"]
+        )
+        self.assertEqual(registry.urls[1].name, "fear_conditioning_data_batch")
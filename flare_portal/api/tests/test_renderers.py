@@ -0,0 +1,96 @@
+import datetime
+import io
+import uuid
+from decimal import Decimal
+from unittest import mock
+
+from django.forms.utils import ErrorDict, ErrorList
+from django.test import TestCase
+from django.utils.translation import gettext_lazy
+
+import pytz
+from rest_framework.exceptions import ErrorDetail, ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from .. import parsers, renderers
+from ..parsers import FastJSONParser
+from ..renderers import FastJSONRenderer
+
+
+class FastJSONRendererTest(TestCase):
+    def assertRendersLikeDRF(self, data: object, **kwargs: object) -> None:
+        self.assertEqual(
+            FastJSONRenderer().render(data, **kwargs),  # type: ignore
+            JSONRenderer().render(data, **kwargs),  # type: ignore
+        )
+
+    def test_render(self) -> None:
+        # London is on UTC in winter, which DRF renders as Z
+        now = datetime.datetime(2021, 1, 5, 12, 30, 15, 123456, tzinfo=pytz.utc)
+        data = {
+            "volume_level": Decimal("0.50"),
+            "trial_started_at": now,
+            "response_recorded_at": now.astimezone(pytz.timezone("Europe/London")),
+            "local_time": now.astimezone(pytz.timezone("Asia/Tokyo")),
+            "naive_time": now.replace(tzinfo=None),
+            "date": now.date(),
+            "time": datetime.time(12, 30, 15, 123456),
+            "duration": datetime.timedelta(minutes=5),
+            "id": uuid.uuid4(),
+            "name": "Fear\u2028conditioning\u2029 \u2014 CS+",
+            "label": gettext_lazy("Participant"),
+            "errors": {0: [ErrorDetail("This field is required.", code="required")]},
+            "form_errors": ErrorDict(module=ErrorList(["Select a valid choice."])),
+            "trials": (1, 2, 3),
+            "rating": 1.5,
+            "empty": None,
+        }
+
+        self.assertRendersLikeDRF(data)
+        self.assertRendersLikeDRF([data, data])
+
+    def test_render_none(self) -> None:
+        self.assertEqual(FastJSONRenderer().render(None), b"")
+
+    def test_render_large_integers(self) -> None:
+        self.assertRendersLikeDRF({"value": 2**70})
+
+    def test_render_indented(self) -> None:
+        self.assertRendersLikeDRF(
+            {"value": 1}, accepted_media_type="application/json; indent=4"
+        )
+
+    def test_render_without_orjson(self) -> None:
+        with mock.patch.object(renderers, "orjson", None):
+            self.assertRendersLikeDRF({"volume_level": Decimal("0.50")})
+
+
+class FastJSONParserTest(TestCase):
+    def test_parse(self) -> None:
+        body = '{"participant": "ABC.1", "volume_level": "0.50", "name": "—"}'
+
+        self.assertEqual(
+            FastJSONParser().parse(io.BytesIO(body.encode())),
+            JSONParser().parse(io.BytesIO(body.encode())),
+        )
+
+    def test_parse_error(self) -> None:
+        for body in [b"{", b'{"rating": NaN}']:
+            with self.subTest(body=body), self.assertRaises(ParseError):
+                FastJSONParser().parse(io.BytesIO(body))
+
+    def test_parse_other_encoding(self) -> None:
+        body = '{"name": "—"}'.encode("utf-16")
+
+        self.assertEqual(
+            FastJSONParser().parse(io.BytesIO(body), None, {"encoding": "utf-16"}),
+            {"name": "—"},
+        )
+
+    def test_parse_without_orjson(self) -> None:
+        with mock.patch.object(parsers, "orjson", None):
+            self.assertEqual(
+                FastJSONParser().parse(io.BytesIO(b'{"trial": 1}')), {"trial": 1}
+            )
+            self.assertEqual(parsers.loads(b'{"trial": 1}'), {"trial": 1})
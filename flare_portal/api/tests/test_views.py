@@ -1,13 +1,31 @@
+import gzip
+import hashlib
+import io
+import json
+import threading
+import uuid
+import zipfile
 from decimal import Decimal
+from typing import Any, List, Type
+from unittest import mock
 
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.db import connection
+from django.db.models import BooleanField
+from django.test import Client, TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 
 from rest_framework.serializers import DateTimeField
 
+from flare_portal.experiments import assets
+from flare_portal.experiments.assets import (
+    build_asset_bundle,
+    build_outdated_asset_bundles,
+    get_asset_bundle_hash,
+)
 from flare_portal.experiments.factories import (
     AffectiveRatingModuleFactory,
     CriterionModuleFactory,
@@ -17,12 +35,27 @@ from flare_portal.experiments.factories import (
     ParticipantFactory,
 )
 from flare_portal.experiments.models import (
+    AffectiveRatingData,
+    BaseData,
+    BaseModule,
+    BasicInfoData,
+    ContingencyAwarenessData,
+    CriterionData,
     Experiment,
+    FearConditioningData,
     FearConditioningModule,
     Participant,
+    PostExperimentQuestionsData,
+    USUnpleasantnessData,
+    VolumeCalibrationData,
 )
+from flare_portal.experiments.participants import clear_participant_caches
 from flare_portal.reimbursement.factories import VoucherFactory, VoucherPoolFactory
 from flare_portal.site_config.models import SiteConfiguration
+from flare_portal.users.factories import UserFactory
+
+from ..configuration import set_in_local_cache
+from ..registry import data_api_registry, get_experiment_index
 
 test_file = "flare_portal/experiments/tests/assets/circle.png"
 
@@ -54,6 +87,54 @@ def get_example_experiment() -> Experiment:
     )
 
 
+def get_fear_conditioning_row(
+    participant: Participant, module: FearConditioningModule, trial: int
+) -> dict:
+    return {
+        "participant": participant.participant_id,
+        "module": module.pk,
+        "trial": trial,
+        "trial_by_stimulus": trial,
+        "rating": 5,
+        "stimulus": "CSA",
+        "normalised_stimulus": "CS+",
+        "reinforced_stimulus": "CSA",
+        "unconditional_stimulus": True,
+        "trial_started_at": "2020-01-01T00:00Z",
+        "response_recorded_at": "2020-01-01T00:00Z",
+        "volume_level": "0.50",
+        "calibrated_volume_level": "0.85",
+        "headphones": True,
+        "did_leave_iti": False,
+        "did_leave_trial": False,
+    }
+
+
+def post_concurrently(url: str, payloads: List[Any], **extra: str) -> List[int]:
+    """
+    Posts each payload from its own thread at the same time and returns the
+    sorted response status codes
+    """
+    barrier = threading.Barrier(len(payloads))
+    status_codes = []
+
+    def post(payload: Any) -> None:
+        try:
+            barrier.wait()
+            resp = Client().post(url, payload, content_type="application/json", **extra)
+            status_codes.append(resp.status_code)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=post, args=(payload,)) for payload in payloads]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return sorted(status_codes)
+
+
 class ConfigurationAPIViewTest(TestCase):
     def test_post(self) -> None:
         config = SiteConfiguration.get_solo()
@@ -122,6 +203,25 @@ class ConfigurationAPIViewTest(TestCase):
                 "terms_and_conditions": "Some T&Cs",
             },
         )
+        self.assertEqual(
+            data["assets"],
+            {
+                **{
+                    field_name: {
+                        "url": getattr(experiment, field_name).url,
+                        "sha256": hashlib.sha256(
+                            getattr(experiment, field_name).read()
+                        ).hexdigest(),
+                    }
+                    for field_name in ["us", "csa", "csb", "context_a", "context_b"]
+                },
+                "context_c": None,
+                "gsa": None,
+                "gsb": None,
+                "gsc": None,
+                "gsd": None,
+            },
+        )
         self.assertEqual(
             data["modules"],
             [
@@ -154,6 +254,201 @@ class ConfigurationAPIViewTest(TestCase):
             ],
         )
 
+    def test_cached_configuration(self) -> None:
+        experiment: Experiment = get_example_experiment()
+        FearConditioningModuleFactory(experiment=experiment)
+        CriterionQuestionFactory(module__experiment=experiment)
+        participant_1 = ParticipantFactory(experiment=experiment)
+        participant_2 = ParticipantFactory(experiment=experiment)
+
+        resp = self.client.post(
+            reverse("api:configuration"),
+            {"participant": participant_1.participant_id},
+            content_type="application/json",
+        )
+        self.assertEqual(200, resp.status_code)
+
+        # Looking up the participant and flagging it as started is all that's
+        # left once the configuration has been compiled
+        with self.assertNumQueries(2):
+            cached_resp = self.client.post(
+                reverse("api:configuration"),
+                {"participant": participant_2.participant_id},
+                content_type="application/json",
+            )
+
+        self.assertEqual(200, cached_resp.status_code)
+        self.assertEqual(resp.json(), cached_resp.json())
+
+    def test_signed_asset_urls(self) -> None:
+        experiment: Experiment = get_example_experiment()
+        participant_1 = ParticipantFactory(experiment=experiment)
+        participant_2 = ParticipantFactory(experiment=experiment)
+
+        # Signed URLs that are valid for less time than they need to be when
+        # they're served can't be cached
+        storage = experiment.us.storage
+        with mock.patch.multiple(
+            storage, querystring_auth=True, querystring_expire=60, create=True
+        ), mock.patch.object(
+            storage, "url", side_effect=lambda name: f"/signed/{uuid.uuid4()}/{name}"
+        ):
+            data_1 = self.client.post(
+                reverse("api:configuration"),
+                {"participant": participant_1.participant_id},
+                content_type="application/json",
+            ).json()
+            data_2 = self.client.post(
+                reverse("api:configuration"),
+                {"participant": participant_2.participant_id},
+                content_type="application/json",
+            ).json()
+
+        self.assertNotEqual(data_1["experiment"]["us"], data_2["experiment"]["us"])
+        self.assertEqual(data_2["experiment"]["us"], data_2["assets"]["us"]["url"])
+        self.assertEqual(
+            data_1["assets"]["us"]["sha256"], data_2["assets"]["us"]["sha256"]
+        )
+
+    def test_get(self) -> None:
+        experiment: Experiment = get_example_experiment()
+        FearConditioningModuleFactory(experiment=experiment)
+        participant = ParticipantFactory(experiment=experiment)
+        url = reverse("api:configuration")
+        params = {"participant": participant.participant_id}
+
+        resp = self.client.get(url, params)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertIn("no-cache", resp["Cache-Control"])
+        etag = resp["ETag"]
+
+        # Getting the configuration doesn't start the experiment
+        participant.refresh_from_db()
+        self.assertIsNone(participant.started_at)
+
+        post_resp = self.client.post(url, params, content_type="application/json")
+
+        self.assertEqual(resp.json(), post_resp.json())
+        self.assertEqual(post_resp["ETag"], etag)
+
+        resp = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(304, resp.status_code)
+        self.assertEqual(resp["ETag"], etag)
+
+        experiment.name = "Updated name"
+        experiment.save()
+
+        resp = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertNotEqual(resp["ETag"], etag)
+        self.assertEqual(resp.json()["experiment"]["name"], "Updated name")
+
+    def test_get_compressed(self) -> None:
+        experiment: Experiment = get_example_experiment()
+        participant = ParticipantFactory(experiment=experiment)
+        url = reverse("api:configuration")
+        params = {"participant": participant.participant_id}
+
+        resp = self.client.get(url, params, HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", resp["Vary"])
+        self.assertEqual(
+            json.loads(gzip.decompress(resp.content)),
+            self.client.get(url, params).json(),
+        )
+
+        # Compressed responses have weak ETags, which can still be revalidated
+        etag = resp["ETag"]
+        self.assertTrue(etag.startswith("W/"))
+
+        resp = self.client.get(
+            url, params, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertEqual(304, resp.status_code)
+
+    def test_get_html_not_compressed(self) -> None:
+        experiment: Experiment = get_example_experiment()
+        participant = ParticipantFactory(experiment=experiment)
+        self.client.force_login(UserFactory())
+
+        resp = self.client.get(
+            reverse("api:configuration"),
+            {"participant": participant.participant_id},
+            HTTP_ACCEPT="text/html",
+            HTTP_ACCEPT_ENCODING="gzip",
+        )
+
+        self.assertEqual(200, resp.status_code)
+        self.assertTrue(resp["Content-Type"].startswith("text/html"))
+        self.assertNotIn("Content-Encoding", resp)
+
+    def test_get_validation(self) -> None:
+        resp = self.client.get(reverse("api:configuration"), {"participant": "nope"})
+
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(resp.json(), {"participant": ["Invalid participant"]})
+
+    def test_configuration_invalidation(self) -> None:
+        experiment: Experiment = get_example_experiment()
+        module: FearConditioningModule = FearConditioningModuleFactory(
+            experiment=experiment, phase="habituation"
+        )
+        question = CriterionQuestionFactory(
+            module__experiment=experiment, question_text="Question?"
+        )
+
+        def get_configuration() -> dict:
+            participant = ParticipantFactory(experiment=experiment)
+            return self.client.post(
+                reverse("api:configuration"),
+                {"participant": participant.participant_id},
+                content_type="application/json",
+            ).json()
+
+        data = get_configuration()
+        self.assertEqual(data["modules"][0]["config"]["phase"], "habituation")
+        self.assertEqual(
+            data["modules"][1]["config"]["questions"][0]["question_text"], "Question?"
+        )
+
+        module.phase = "acquisition"
+        module.save()
+        data = get_configuration()
+        self.assertEqual(data["modules"][0]["config"]["phase"], "acquisition")
+
+        question.question_text = "Updated question?"
+        question.save()
+        data = get_configuration()
+        self.assertEqual(
+            data["modules"][1]["config"]["questions"][0]["question_text"],
+            "Updated question?",
+        )
+
+        experiment.name = "Updated name"
+        experiment.save()
+        data = get_configuration()
+        self.assertEqual(data["experiment"]["name"], "Updated name")
+
+        config = SiteConfiguration.get_solo()
+        config.participant_terms_and_conditions = "Updated T&Cs"
+        config.save()
+        data = get_configuration()
+        self.assertEqual(data["config"]["terms_and_conditions"], "Updated T&Cs")
+
+        question.delete()
+        data = get_configuration()
+        self.assertEqual(data["modules"][1]["config"]["questions"], [])
+
+        module.delete()
+        data = get_configuration()
+        self.assertEqual(len(data["modules"]), 1)
+
     def test_validation(self) -> None:
         resp = self.client.post(
             reverse("api:configuration"), {"participant": "Flare.ABCDEF"}
@@ -172,6 +467,215 @@ class ConfigurationAPIViewTest(TestCase):
         )
 
 
+class AssetBundleAPIViewTest(TestCase):
+    def setUp(self) -> None:
+        self.experiment: Experiment = get_example_experiment()
+        self.participant: Participant = ParticipantFactory(experiment=self.experiment)
+        self.url = reverse("api:asset_bundle")
+        self.params = {"participant": self.participant.participant_id}
+        build_asset_bundle(self.experiment)
+
+    def test_get(self) -> None:
+        resp = self.client.get(self.url, self.params)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(resp["Content-Type"], "application/zip")
+        self.assertEqual(resp["Accept-Ranges"], "bytes")
+
+        content = b"".join(resp.streaming_content)
+        self.assertEqual(int(resp["Content-Length"]), len(content))
+
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertEqual(
+                archive.namelist(),
+                [
+                    "manifest.json",
+                    "us.wav",
+                    "csa.png",
+                    "csb.png",
+                    "context_a.png",
+                    "context_b.png",
+                ],
+            )
+            self.assertEqual(archive.read("us.wav"), b"wav content")
+
+            manifest = json.loads(archive.read("manifest.json"))
+            self.assertEqual(
+                manifest["us"],
+                {
+                    "filename": "us.wav",
+                    "sha256": hashlib.sha256(b"wav content").hexdigest(),
+                },
+            )
+
+        # The view doesn't rebuild the bundle
+        self.experiment.refresh_from_db()
+        bundle_name = self.experiment.asset_bundle.name
+        resp = self.client.get(self.url, self.params)
+        self.assertEqual(resp["ETag"], f'"{get_asset_bundle_hash(self.experiment)}"')
+        self.assertEqual(b"".join(resp.streaming_content), content)
+        self.experiment.refresh_from_db()
+        self.assertEqual(self.experiment.asset_bundle.name, bundle_name)
+
+    def test_if_none_match(self) -> None:
+        resp = self.client.get(self.url, self.params)
+        etag = resp["ETag"]
+
+        resp = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(304, resp.status_code)
+        self.assertEqual(resp["ETag"], etag)
+
+        # Changing an asset rebuilds the bundle in the background
+        self.experiment.refresh_from_db()
+        old_bundle = self.experiment.asset_bundle.name
+        self.experiment.us = SimpleUploadedFile("us.mp3", b"mp3 content")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.experiment.save()
+
+        self.experiment.refresh_from_db()
+        self.assertEqual(self.experiment.asset_bundle.name, old_bundle)
+        self.assertEqual(build_outdated_asset_bundles(), 1)
+        self.assertEqual(build_outdated_asset_bundles(), 0)
+
+        self.experiment.refresh_from_db()
+        self.assertNotEqual(self.experiment.asset_bundle.name, old_bundle)
+        # The old bundle is kept so downloads in progress can finish
+        self.assertTrue(self.experiment.asset_bundle.storage.exists(old_bundle))
+
+        resp = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertNotEqual(resp["ETag"], etag)
+
+        with zipfile.ZipFile(io.BytesIO(b"".join(resp.streaming_content))) as archive:
+            self.assertIn("us.mp3", archive.namelist())
+            self.assertNotIn("us.wav", archive.namelist())
+
+    def test_range(self) -> None:
+        resp = self.client.get(self.url, self.params)
+        content = b"".join(resp.streaming_content)
+        etag = resp["ETag"]
+
+        resp = self.client.get(self.url, self.params, HTTP_RANGE="bytes=10-19")
+
+        self.assertEqual(206, resp.status_code)
+        self.assertEqual(resp["Content-Range"], f"bytes 10-19/{len(content)}")
+        self.assertEqual(resp["Content-Length"], "10")
+        self.assertEqual(b"".join(resp.streaming_content), content[10:20])
+
+        resp = self.client.get(
+            self.url, self.params, HTTP_RANGE="bytes=100-", HTTP_IF_RANGE=etag
+        )
+
+        self.assertEqual(206, resp.status_code)
+        self.assertEqual(b"".join(resp.streaming_content), content[100:])
+
+        resp = self.client.get(self.url, self.params, HTTP_RANGE="bytes=-5")
+
+        self.assertEqual(206, resp.status_code)
+        self.assertEqual(b"".join(resp.streaming_content), content[-5:])
+
+        # Ranges of a different version of the bundle are ignored
+        resp = self.client.get(
+            self.url, self.params, HTTP_RANGE="bytes=100-", HTTP_IF_RANGE='"old"'
+        )
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(b"".join(resp.streaming_content), content)
+
+        resp = self.client.get(
+            self.url, self.params, HTTP_RANGE=f"bytes={len(content)}-"
+        )
+
+        self.assertEqual(416, resp.status_code)
+        self.assertEqual(resp["Content-Range"], f"bytes */{len(content)}")
+
+    def test_stale_bundles(self) -> None:
+        old_bundle = self.experiment.asset_bundle.name
+        self.experiment.us = SimpleUploadedFile("us.mp3", b"mp3 content")
+        self.experiment.save()
+        build_asset_bundle(self.experiment)
+        storage = self.experiment.asset_bundle.storage
+
+        # Rebuilding an up to date bundle keeps the replaced one until its
+        # grace period has passed
+        build_asset_bundle(self.experiment)
+        self.assertTrue(storage.exists(old_bundle))
+
+        with override_settings(ASSET_BUNDLE_GRACE_PERIOD=0):
+            build_asset_bundle(self.experiment)
+
+        self.assertFalse(storage.exists(old_bundle))
+        self.assertTrue(storage.exists(self.experiment.asset_bundle.name))
+
+    def test_building(self) -> None:
+        Experiment.objects.filter(pk=self.experiment.pk).update(asset_bundle="")
+
+        resp = self.client.get(self.url, self.params)
+
+        self.assertEqual(503, resp.status_code)
+        self.assertEqual(resp["Retry-After"], "60")
+
+        # Only one process builds the bundle at a time
+        lock_key = f"experiments:asset-bundle-lock:{self.experiment.pk}"
+        cache.add(lock_key, True)
+        try:
+            self.assertIsNone(build_asset_bundle(self.experiment))
+        finally:
+            cache.delete(lock_key)
+
+        self.experiment.refresh_from_db()
+        self.assertFalse(self.experiment.asset_bundle)
+
+        build_asset_bundle(self.experiment)
+        resp = self.client.get(self.url, self.params)
+
+        self.assertEqual(200, resp.status_code)
+
+    def test_rebuild_requested_while_building(self) -> None:
+        build = assets._build_asset_bundle
+
+        def change_assets_while_building(experiment: Experiment) -> Any:
+            bundle_hash = build(experiment)
+            if build_mock.call_count == 1:
+                # Another process changes the assets after they were read
+                other_experiment = Experiment.objects.get(pk=experiment.pk)
+                other_experiment.us = SimpleUploadedFile("us.mp3", b"mp3 content")
+                other_experiment.save()
+                self.assertIsNone(build_asset_bundle(other_experiment))
+            return bundle_hash
+
+        self.experiment.us = SimpleUploadedFile("us.wav", b"wav content")
+        self.experiment.save()
+
+        with mock.patch.object(
+            assets, "_build_asset_bundle", side_effect=change_assets_while_building
+        ) as build_mock:
+            bundle_hash = build_asset_bundle(self.experiment)
+
+        # The bundle was built again with the changed assets
+        self.assertEqual(build_mock.call_count, 2)
+        self.experiment.refresh_from_db()
+        self.assertEqual(bundle_hash, get_asset_bundle_hash(self.experiment))
+        self.assertEqual(
+            assets.get_saved_asset_bundle_hash(self.experiment), bundle_hash
+        )
+
+    def test_no_assets(self) -> None:
+        participant = ParticipantFactory()
+
+        resp = self.client.get(self.url, {"participant": participant.participant_id})
+
+        self.assertEqual(204, resp.status_code)
+
+    def test_validation(self) -> None:
+        resp = self.client.get(self.url, {"participant": "invalid"})
+
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(resp.json(), {"participant": ["Invalid participant"]})
+
+
 class SubmissionAPIViewTest(TestCase):
     def test_post(self) -> None:
         experiment: Experiment = get_example_experiment()
@@ -310,6 +814,82 @@ class ModuleDataAPIViewTest(TestCase):
         )
         self.assertEqual(data.headphones, json_data["headphones"])
 
+    def test_query_count(self) -> None:
+        experiment: Experiment = ExperimentFactory()
+        participant: Participant = ParticipantFactory(experiment=experiment)
+        criterion_module = CriterionModuleFactory(experiment=experiment)
+        fear_conditioning_module = FearConditioningModuleFactory(experiment=experiment)
+
+        def create_module(data_class: Type[BaseData]) -> BaseModule:
+            module_class = data_class._meta.get_field("module").related_model
+            # Some modules have questions that need switching on or off
+            questions = {
+                field.name: True
+                for field in module_class._meta.fields
+                if isinstance(field, BooleanField) and not field.has_default()
+            }
+            return module_class.objects.create(experiment=experiment, **questions)
+
+        modules = {
+            data_class: create_module(data_class)
+            for data_class in data_api_registry.data_models
+            if data_class not in [CriterionData, FearConditioningData]
+        }
+        modules[CriterionData] = criterion_module
+        modules[FearConditioningData] = fear_conditioning_module
+
+        payloads = {
+            AffectiveRatingData: {"stimulus": "CSA", "rating": 5},
+            BasicInfoData: {
+                "device_make": "Make",
+                "device_model": "Model",
+                "headphone_type": "in_ear",
+                "os_name": "OS",
+                "os_version": "1",
+            },
+            CriterionData: {
+                "question": CriterionQuestionFactory(module=criterion_module).pk,
+                "answer": True,
+            },
+            ContingencyAwarenessData: {"awareness_answer": True, "is_aware": True},
+            FearConditioningData: get_fear_conditioning_row(
+                participant, fear_conditioning_module, 1
+            ),
+            VolumeCalibrationData: {"calibrated_volume_level": "0.50", "rating": 5},
+            PostExperimentQuestionsData: {"experiment_unpleasant_rating": 5},
+            USUnpleasantnessData: {"rating": 5},
+        }
+
+        # Modules and questions are resolved from the experiment's index
+        get_experiment_index(Experiment.objects.get(pk=experiment.pk))
+
+        for data_class in data_api_registry.data_models:
+            with self.subTest(data_class=data_class.__name__):
+                # Participant, uniqueness check and insert, plus savepoints
+                with self.assertNumQueries(7):
+                    resp = self.client.post(
+                        reverse(f"api:{data_class.get_module_snake_case()}"),
+                        {
+                            **payloads[data_class],
+                            "participant": participant.participant_id,
+                            "module": modules[data_class].pk,
+                        },
+                        content_type="application/json",
+                    )
+
+                self.assertEqual(201, resp.status_code, resp.json())
+
+    @override_settings(API_CONFIGURATION_LOCAL_CACHE_SIZE=1)
+    def test_experiment_index_cache(self) -> None:
+        experiment = ExperimentFactory()
+        index = get_experiment_index(experiment)
+
+        # Caching configuration payloads doesn't evict experiment indexes
+        for key in range(3):
+            set_in_local_cache(f"test:{key}", key, 60)
+
+        self.assertIs(get_experiment_index(experiment), index)
+
     def test_validation(self) -> None:
         # Should not be able to add data for a participant that is not in the
         # same experiment as the module
@@ -398,108 +978,557 @@ class FearConditioningDataAPIViewTest(TestCase):
             },
         )
 
+    def test_idempotency_key(self) -> None:
+        experiment: Experiment = ExperimentFactory()
+        module: FearConditioningModule = FearConditioningModuleFactory(
+            experiment=experiment
+        )
+        participant: Participant = ParticipantFactory(experiment=experiment)
 
-class CriterionDataAPIViewTest(TestCase):
-    def test_post(self) -> None:
-        experiment = ExperimentFactory()
-        participant = ParticipantFactory(experiment=experiment)
-        module = CriterionModuleFactory(experiment=experiment)
-
-        question_1 = CriterionQuestionFactory(module=module)
-        question_2 = CriterionQuestionFactory(module=module)
-
-        url = reverse("api:criterion_data")
-
-        json_data = {
-            "participant": participant.participant_id,
-            "module": module.pk,
-            "question": question_1.pk,
-            "answer": True,
-        }
-
-        resp = self.client.post(url, json_data, content_type="application/json")
-
-        self.assertEqual(201, resp.status_code)
-
-        json_data = {
-            "participant": participant.participant_id,
-            "module": module.pk,
-            "question": question_2.pk,
-            "answer": False,
-        }
+        url = reverse("api:fear_conditioning_data")
+        json_data = get_fear_conditioning_row(participant, module, 1)
 
-        resp = self.client.post(url, json_data, content_type="application/json")
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(
+                url,
+                json_data,
+                content_type="application/json",
+                HTTP_IDEMPOTENCY_KEY="1",
+            )
 
         self.assertEqual(201, resp.status_code)
+        data = resp.json()
 
-        answers = module.data.all()
-
-        self.assertEqual(answers[0].question, question_1)
-        self.assertEqual(answers[0].answer, True)
-
-        self.assertEqual(answers[1].question, question_2)
-        self.assertEqual(answers[1].answer, False)
-
-    def test_unique_answer(self) -> None:
-        experiment = ExperimentFactory()
-        participant = ParticipantFactory(experiment=experiment)
-        module = CriterionModuleFactory(experiment=experiment)
+        # Replaying the request is answered from the cache (the other queries
+        # are the savepoint for the view's transaction)
+        with self.assertNumQueries(3):
+            resp = self.client.post(
+                url,
+                json_data,
+                content_type="application/json",
+                HTTP_IDEMPOTENCY_KEY="1",
+            )
 
-        question_1 = CriterionQuestionFactory(module=module)
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(resp.json(), data)
 
-        url = reverse("api:criterion_data")
+        # Reusing the key for a different request is rejected
+        resp = self.client.post(
+            url,
+            {**json_data, "rating": 1},
+            content_type="application/json",
+            HTTP_IDEMPOTENCY_KEY="1",
+        )
 
-        # Participant can only submit one answer to a question
-        json_data = {
-            "participant": participant.participant_id,
-            "module": module.pk,
-            "question": question_1.pk,
-            "answer": True,
-        }
+        self.assertEqual(422, resp.status_code)
 
-        resp = self.client.post(url, json_data, content_type="application/json")
+        # Keys are scoped to the participant
+        other_participant: Participant = ParticipantFactory(experiment=experiment)
+        resp = self.client.post(
+            url,
+            get_fear_conditioning_row(other_participant, module, 1),
+            content_type="application/json",
+            HTTP_IDEMPOTENCY_KEY="1",
+        )
 
         self.assertEqual(201, resp.status_code)
 
-        json_data = {
-            "participant": participant.participant_id,
-            "module": module.pk,
-            "question": question_1.pk,
-            "answer": True,
-        }
+        # A retry with a new key is acknowledged with the saved row
+        resp = self.client.post(
+            url,
+            json_data,
+            content_type="application/json",
+            HTTP_IDEMPOTENCY_KEY="2",
+        )
 
-        resp = self.client.post(url, json_data, content_type="application/json")
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(resp.json(), data)
+
+        # Unless the values differ from the saved row
+        resp = self.client.post(
+            url,
+            {**json_data, "rating": 1},
+            content_type="application/json",
+            HTTP_IDEMPOTENCY_KEY="3",
+        )
 
-        # Error
         self.assertEqual(400, resp.status_code)
         self.assertEqual(
             resp.json(),
             {
                 "non_field_errors": [
-                    "The fields participant, question must make a unique set."
+                    "The fields trial, module, participant must make a unique set."
                 ]
             },
         )
+        self.assertEqual(module.data.get(participant=participant).rating, 5)
 
-    def test_question_validation(self) -> None:
-        # Question should belong to the module
-        experiment = ExperimentFactory()
-        participant = ParticipantFactory(experiment=experiment)
-        module = CriterionModuleFactory(experiment=experiment)
-
-        question_1 = CriterionQuestionFactory()
+        # Invalid data is still rejected
+        resp = self.client.post(
+            url,
+            {**json_data, "trial": None},
+            content_type="application/json",
+            HTTP_IDEMPOTENCY_KEY="4",
+        )
 
-        url = reverse("api:criterion_data")
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(resp.json(), {"trial": ["This field may not be null."]})
 
-        # Participant can only submit one answer to a question
-        json_data = {
-            "participant": participant.participant_id,
-            "module": module.pk,
-            "question": question_1.pk,
-            "answer": True,
-        }
 
-        resp = self.client.post(url, json_data, content_type="application/json")
+class FearConditioningDataConcurrencyTest(TransactionTestCase):
+    def test_concurrent_duplicates(self) -> None:
+        experiment: Experiment = ExperimentFactory()
+        module: FearConditioningModule = FearConditioningModuleFactory(
+            experiment=experiment
+        )
+        participant: Participant = ParticipantFactory(experiment=experiment)
+
+        url = reverse("api:fear_conditioning_data")
+
+        status_codes = post_concurrently(
+            url,
+            [get_fear_conditioning_row(participant, module, 1)] * 4,
+            HTTP_IDEMPOTENCY_KEY="1",
+        )
+
+        self.assertEqual(status_codes[0], 200)
+        self.assertEqual(status_codes[-1], 201)
+        self.assertEqual(status_codes.count(201), 1)
+        self.assertEqual(module.data.count(), 1)
+
+        # Without an idempotency key, the duplicates are rejected
+        status_codes = post_concurrently(
+            url, [get_fear_conditioning_row(participant, module, 2)] * 4
+        )
+
+        self.assertEqual(status_codes, [201, 400, 400, 400])
+        self.assertEqual(module.data.count(), 2)
+
+    def test_concurrent_duplicate_batches(self) -> None:
+        experiment: Experiment = ExperimentFactory()
+        module: FearConditioningModule = FearConditioningModuleFactory(
+            experiment=experiment
+        )
+        participant: Participant = ParticipantFactory(experiment=experiment)
+
+        rows = [
+            get_fear_conditioning_row(participant, module, trial)
+            for trial in range(1, 11)
+        ]
+        status_codes = post_concurrently(
+            reverse("api:fear_conditioning_data_batch"),
+            [rows] * 4,
+            HTTP_IDEMPOTENCY_KEY="1",
+        )
+
+        self.assertEqual(status_codes, [200, 200, 200, 200])
+        self.assertEqual(module.data.count(), 10)
+
+
+@override_settings(API_PARTICIPANT_FILTER=True, API_PARTICIPANT_CACHE_TIMEOUT=5)
+class ParticipantLookupTest(TransactionTestCase):
+    """
+    Data submissions with the participant ID filter and participant cache
+    that the rest of the tests turn off
+    """
+
+    def setUp(self) -> None:
+        clear_participant_caches()
+        self.addCleanup(clear_participant_caches)
+
+        experiment: Experiment = ExperimentFactory()
+        self.module: FearConditioningModule = FearConditioningModuleFactory(
+            experiment=experiment
+        )
+        self.participant: Participant = ParticipantFactory(experiment=experiment)
+        self.url = reverse("api:fear_conditioning_data")
+        self.batch_url = reverse("api:fear_conditioning_data_batch")
+
+    def get_row(self, trial: int) -> dict:
+        return get_fear_conditioning_row(self.participant, self.module, trial)
+
+    def test_unknown_participant(self) -> None:
+        resp = self.client.post(
+            self.url,
+            {**self.get_row(1), "participant": "Unknown.ABCDEF"},
+            content_type="application/json",
+        )
+
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(
+            resp.json(),
+            {
+                "participant": [
+                    "Object with participant_id=Unknown.ABCDEF does not exist."
+                ]
+            },
+        )
+
+        # New participants are accepted straight away
+        resp = self.client.post(
+            self.url, self.get_row(1), content_type="application/json"
+        )
+
+        self.assertEqual(201, resp.status_code)
+
+    def test_deleted_participant(self) -> None:
+        resp = self.client.post(
+            self.url, self.get_row(1), content_type="application/json"
+        )
+        self.assertEqual(201, resp.status_code)
+
+        # The participant is still cached after it's deleted
+        self.participant.delete()
+        error = {
+            "participant": [
+                f"Object with participant_id={self.participant.participant_id} "
+                "does not exist."
+            ]
+        }
+
+        resp = self.client.post(
+            self.batch_url, [self.get_row(2)], content_type="application/json"
+        )
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(
+            resp.json()["results"], [{"status": "invalid", "errors": error}]
+        )
+
+        # The failed insert dropped it from the cache
+        resp = self.client.post(
+            self.url, self.get_row(3), content_type="application/json"
+        )
+
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(resp.json(), error)
+        self.assertFalse(FearConditioningData.objects.exists())
+
+    def test_deleted_participant_single_row(self) -> None:
+        resp = self.client.post(
+            self.batch_url, [self.get_row(1)], content_type="application/json"
+        )
+        self.assertEqual(200, resp.status_code)
+
+        self.participant.delete()
+
+        resp = self.client.post(
+            self.url, self.get_row(2), content_type="application/json"
+        )
+
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(
+            resp.json(),
+            {
+                "participant": [
+                    f"Object with participant_id={self.participant.participant_id}"
+                    " does not exist."
+                ]
+            },
+        )
+
+
+class FearConditioningDataBatchAPIViewTest(TestCase):
+    def setUp(self) -> None:
+        self.experiment: Experiment = ExperimentFactory()
+        self.module: FearConditioningModule = FearConditioningModuleFactory(
+            experiment=self.experiment
+        )
+        self.participant: Participant = ParticipantFactory(experiment=self.experiment)
+        self.url = reverse("api:fear_conditioning_data_batch")
+
+    def get_row(self, trial: int, **kwargs: Any) -> dict:
+        return {
+            **get_fear_conditioning_row(self.participant, self.module, trial),
+            **kwargs,
+        }
+
+    def test_post(self) -> None:
+        json_data = [self.get_row(trial) for trial in range(1, 51)]
+
+        # The experiment's modules are indexed by the first request
+        get_experiment_index(Experiment.objects.get(pk=self.experiment.pk))
+
+        # Participant, uniqueness check and insert, plus savepoints, regardless
+        # of the number of rows
+        with self.assertNumQueries(7):
+            resp = self.client.post(
+                self.url, json_data, content_type="application/json"
+            )
+
+        self.assertEqual(200, resp.status_code)
+
+        data = list(self.module.data.order_by("trial"))
+        self.assertEqual(len(data), 50)
+        self.assertEqual(resp.json()["created"], 50)
+        self.assertEqual(resp.json()["invalid"], 0)
+        self.assertEqual(
+            resp.json()["results"],
+            [{"status": "created", "id": datum.pk} for datum in data],
+        )
+        self.assertEqual(data[0].participant, self.participant)
+        self.assertEqual(data[0].volume_level, Decimal("0.50"))
+
+    def test_invalid_rows(self) -> None:
+        other_participant: Participant = ParticipantFactory()
+
+        # Trial 1 has already been submitted
+        resp = self.client.post(
+            reverse("api:fear_conditioning_data"),
+            self.get_row(1),
+            content_type="application/json",
+        )
+        self.assertEqual(201, resp.status_code)
+
+        json_data = [
+            self.get_row(1),
+            self.get_row(2),
+            self.get_row(2),
+            self.get_row(3, participant=other_participant.participant_id),
+            self.get_row(4, module="invalid"),
+            self.get_row(5, rating=None),
+        ]
+
+        resp = self.client.post(self.url, json_data, content_type="application/json")
+
+        self.assertEqual(200, resp.status_code)
+
+        unique_error = {
+            "non_field_errors": [
+                "The fields trial, module, participant must make a unique set."
+            ]
+        }
+        self.assertEqual(resp.json()["created"], 2)
+        self.assertEqual(resp.json()["existing"], 0)
+        self.assertEqual(resp.json()["invalid"], 4)
+        self.assertEqual(
+            resp.json()["results"],
+            [
+                {"status": "invalid", "errors": unique_error},
+                {
+                    "status": "created",
+                    "id": self.module.data.get(trial=2).pk,
+                },
+                {"status": "invalid", "errors": unique_error},
+                {
+                    "status": "invalid",
+                    "errors": {
+                        "participant": [
+                            "This participant is not part of the module's "
+                            "experiment."
+                        ]
+                    },
+                },
+                {
+                    "status": "invalid",
+                    "errors": {
+                        "module": ["Incorrect type. Expected pk value, received str."]
+                    },
+                },
+                {
+                    "status": "created",
+                    "id": self.module.data.get(trial=5).pk,
+                },
+            ],
+        )
+
+    def test_idempotency_key(self) -> None:
+        resp = self.client.post(
+            reverse("api:fear_conditioning_data"),
+            self.get_row(1),
+            content_type="application/json",
+        )
+        self.assertEqual(201, resp.status_code)
+        existing_id = resp.json()["id"]
+
+        json_data = [
+            self.get_row(1),
+            self.get_row(2),
+            self.get_row(2),
+            self.get_row(1, rating=1),
+            self.get_row(2, rating=1),
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(
+                self.url,
+                json_data,
+                content_type="application/json",
+                HTTP_IDEMPOTENCY_KEY="1",
+            )
+
+        self.assertEqual(200, resp.status_code)
+
+        created_id = self.module.data.get(trial=2).pk
+        unique_error = {
+            "non_field_errors": [
+                "The fields trial, module, participant must make a unique set."
+            ]
+        }
+        data = resp.json()
+        self.assertEqual(
+            data,
+            {
+                "created": 1,
+                "existing": 2,
+                "invalid": 2,
+                "results": [
+                    {"status": "existing", "id": existing_id},
+                    {"status": "created", "id": created_id},
+                    {"status": "existing", "id": created_id},
+                    {"status": "invalid", "errors": unique_error},
+                    {"status": "invalid", "errors": unique_error},
+                ],
+            },
+        )
+
+        # Replaying the request is answered from the cache (the other queries
+        # are the savepoint for the view's transaction)
+        with self.assertNumQueries(3):
+            resp = self.client.post(
+                self.url,
+                json_data,
+                content_type="application/json",
+                HTTP_IDEMPOTENCY_KEY="1",
+            )
+
+        self.assertEqual(resp.json(), data)
+
+        # Reusing the key for a different request is rejected
+        resp = self.client.post(
+            self.url,
+            json_data[:1],
+            content_type="application/json",
+            HTTP_IDEMPOTENCY_KEY="1",
+        )
+
+        self.assertEqual(422, resp.status_code)
+
+    def test_invalid_payload(self) -> None:
+        resp = self.client.post(
+            self.url, self.get_row(1), content_type="application/json"
+        )
+
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(
+            resp.json(), {"non_field_errors": ["Expected a list of items."]}
+        )
+
+        resp = self.client.post(
+            self.url,
+            [self.get_row(trial) for trial in range(1, 1002)],
+            content_type="application/json",
+        )
+
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(
+            resp.json(),
+            {"non_field_errors": ["Ensure there are no more than 1000 items."]},
+        )
+        self.assertFalse(self.module.data.exists())
+
+
+class CriterionDataAPIViewTest(TestCase):
+    def test_post(self) -> None:
+        experiment = ExperimentFactory()
+        participant = ParticipantFactory(experiment=experiment)
+        module = CriterionModuleFactory(experiment=experiment)
+
+        question_1 = CriterionQuestionFactory(module=module)
+        question_2 = CriterionQuestionFactory(module=module)
+
+        url = reverse("api:criterion_data")
+
+        json_data = {
+            "participant": participant.participant_id,
+            "module": module.pk,
+            "question": question_1.pk,
+            "answer": True,
+        }
+
+        resp = self.client.post(url, json_data, content_type="application/json")
+
+        self.assertEqual(201, resp.status_code)
+
+        json_data = {
+            "participant": participant.participant_id,
+            "module": module.pk,
+            "question": question_2.pk,
+            "answer": False,
+        }
+
+        resp = self.client.post(url, json_data, content_type="application/json")
+
+        self.assertEqual(201, resp.status_code)
+
+        answers = module.data.all()
+
+        self.assertEqual(answers[0].question, question_1)
+        self.assertEqual(answers[0].answer, True)
+
+        self.assertEqual(answers[1].question, question_2)
+        self.assertEqual(answers[1].answer, False)
+
+    def test_unique_answer(self) -> None:
+        experiment = ExperimentFactory()
+        participant = ParticipantFactory(experiment=experiment)
+        module = CriterionModuleFactory(experiment=experiment)
+
+        question_1 = CriterionQuestionFactory(module=module)
+
+        url = reverse("api:criterion_data")
+
+        # Participant can only submit one answer to a question
+        json_data = {
+            "participant": participant.participant_id,
+            "module": module.pk,
+            "question": question_1.pk,
+            "answer": True,
+        }
+
+        resp = self.client.post(url, json_data, content_type="application/json")
+
+        self.assertEqual(201, resp.status_code)
+
+        json_data = {
+            "participant": participant.participant_id,
+            "module": module.pk,
+            "question": question_1.pk,
+            "answer": True,
+        }
+
+        resp = self.client.post(url, json_data, content_type="application/json")
+
+        # Error
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(
+            resp.json(),
+            {
+                "non_field_errors": [
+                    "The fields participant, question must make a unique set."
+                ]
+            },
+        )
+
+    def test_question_validation(self) -> None:
+        # Question should belong to the module
+        experiment = ExperimentFactory()
+        participant = ParticipantFactory(experiment=experiment)
+        module = CriterionModuleFactory(experiment=experiment)
+
+        question_1 = CriterionQuestionFactory()
+
+        url = reverse("api:criterion_data")
+
+        # Participant can only submit one answer to a question
+        json_data = {
+            "participant": participant.participant_id,
+            "module": module.pk,
+            "question": question_1.pk,
+            "answer": True,
+        }
+
+        resp = self.client.post(url, json_data, content_type="application/json")
 
         self.assertEqual(400, resp.status_code)
 
@@ -673,6 +1702,52 @@ class VoucherAPIViewTest(TestCase):
         self.assertEqual(400, resp.status_code)
 
 
+class VoucherConcurrencyTest(TransactionTestCase):
+    def test_concurrent_claims(self) -> None:
+        pool = VoucherPoolFactory()
+        VoucherFactory.create_batch(6, pool=pool)
+        experiment = ExperimentFactory(voucher_pool=pool)
+        participants = ParticipantFactory.create_batch(
+            8,
+            experiment=experiment,
+            started_at=timezone.now(),
+            finished_at=timezone.now(),
+        )
+
+        status_codes = post_concurrently(
+            reverse("api:voucher"),
+            [
+                {"participant": participant.participant_id}
+                for participant in participants
+            ],
+        )
+
+        self.assertEqual(status_codes, [200] * 8)
+        self.assertEqual(pool.vouchers.filter(participant__isnull=True).count(), 0)
+        self.assertEqual(
+            len(set(pool.vouchers.values_list("participant", flat=True))), 6
+        )
+
+    def test_concurrent_claims_by_participant(self) -> None:
+        pool = VoucherPoolFactory()
+        VoucherFactory.create_batch(5, pool=pool)
+        experiment = ExperimentFactory(voucher_pool=pool)
+        participant = ParticipantFactory(
+            experiment=experiment,
+            started_at=timezone.now(),
+            finished_at=timezone.now(),
+        )
+
+        status_codes = post_concurrently(
+            reverse("api:voucher"), [{"participant": participant.participant_id}] * 4
+        )
+
+        # Requests that pass validation before the first claim is saved get the
+        # same voucher
+        self.assertEqual(status_codes.count(500), 0)
+        self.assertEqual(pool.vouchers.filter(participant=participant).count(), 1)
+
+
 class TrackingAPIViewTest(TestCase):
     def test_post(self) -> None:
         experiment: Experiment = get_example_experiment()
@@ -720,3 +1795,380 @@ class TrackingAPIViewTest(TestCase):
                 "current_trial": None,
             },
         )
+
+
+class SyncAPIViewTest(TestCase):
+    def setUp(self) -> None:
+        self.experiment: Experiment = ExperimentFactory()
+        self.module: FearConditioningModule = FearConditioningModuleFactory(
+            experiment=self.experiment
+        )
+        self.participant: Participant = ParticipantFactory(
+            experiment=self.experiment, started_at=timezone.now()
+        )
+        self.url = reverse("api:sync")
+
+    def get_rows(self, *trials: int) -> List[dict]:
+        rows = []
+        for trial in trials:
+            row = get_fear_conditioning_row(self.participant, self.module, trial)
+            del row["participant"]
+            rows.append(row)
+        return rows
+
+    def post(self, operations: List[Any], **extra: str) -> Any:
+        return self.client.post(
+            self.url,
+            {"participant": self.participant.participant_id, "operations": operations},
+            content_type="application/json",
+            **extra,
+        )
+
+    def test_post(self) -> None:
+        operations = [
+            {
+                "type": "data",
+                "module": "fear-conditioning-data",
+                "rows": self.get_rows(1, 2),
+            },
+            {"type": "tracking", "module": self.module.pk, "trial_index": 2},
+            {
+                "type": "data",
+                "module": "fear-conditioning-data",
+                "rows": self.get_rows(3),
+            },
+            {"type": "submission"},
+        ]
+
+        # Participant, tracking module, two lots of data and the updates, plus
+        # savepoints
+        with self.assertNumQueries(16):
+            resp = self.post(operations)
+
+        self.assertEqual(200, resp.status_code)
+
+        data = list(self.module.data.order_by("trial"))
+        self.assertEqual(len(data), 3)
+        self.assertEqual(data[0].participant, self.participant)
+
+        self.participant.refresh_from_db()
+        self.assertIsNotNone(self.participant.finished_at)
+        self.assertIsNone(self.participant.current_module)
+
+        results = resp.json()["results"]
+        self.assertEqual(resp.json()["participant"], self.participant.participant_id)
+        self.assertEqual(
+            results[0],
+            {
+                "type": "data",
+                "module": "fear-conditioning-data",
+                "created": 2,
+                "existing": 0,
+                "invalid": 0,
+                "results": [
+                    {"status": "created", "id": data[0].pk},
+                    {"status": "created", "id": data[1].pk},
+                ],
+            },
+        )
+        self.assertEqual(
+            results[1],
+            {
+                "type": "tracking",
+                "participant": self.participant.participant_id,
+                "current_module": self.module.pk,
+                "current_trial": 2,
+                "lock_reason": None,
+            },
+        )
+        self.assertEqual(
+            results[2]["results"], [{"status": "created", "id": data[2].pk}]
+        )
+        self.assertEqual(
+            results[3],
+            {
+                "type": "submission",
+                "participant_started_at": DateTimeField().to_representation(
+                    self.participant.started_at
+                ),
+                "participant_finished_at": DateTimeField().to_representation(
+                    self.participant.finished_at
+                ),
+            },
+        )
+
+    def test_invalid_rows(self) -> None:
+        other_participant: Participant = ParticipantFactory(experiment=self.experiment)
+        rows = self.get_rows(1, 1, 2)
+        rows[1]["rating"] = None
+        # Rows can't be submitted for other participants
+        rows[2]["participant"] = other_participant.participant_id
+
+        resp = self.post(
+            [{"type": "data", "module": "fear-conditioning-data", "rows": rows}]
+        )
+
+        self.assertEqual(200, resp.status_code)
+        result = resp.json()["results"][0]
+        self.assertEqual(result["created"], 2)
+        self.assertEqual(result["invalid"], 1)
+        self.assertEqual(
+            set(self.module.data.values_list("participant", flat=True)),
+            {self.participant.pk},
+        )
+
+    def test_invalid_operations(self) -> None:
+        other_module = FearConditioningModuleFactory()
+
+        resp = self.post(
+            [
+                {
+                    "type": "data",
+                    "module": "fear-conditioning-data",
+                    "rows": self.get_rows(1),
+                },
+                {"type": "data", "module": "invalid", "rows": []},
+                {"type": "data", "module": "fear-conditioning-data", "rows": {}},
+                {"type": "tracking", "module": other_module.pk, "trial_index": 1},
+                {"type": "invalid"},
+            ]
+        )
+
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(
+            resp.json(),
+            {
+                "operations": {
+                    "1": {"module": ["Invalid data module."]},
+                    "2": {"rows": ["Expected a list of items."]},
+                    "3": {
+                        "module": [
+                            "This module is not part of the assigned experiment."
+                        ]
+                    },
+                    "4": {"type": ['Expected "data", "tracking" or "submission".']},
+                }
+            },
+        )
+
+        # Nothing is saved
+        self.assertFalse(self.module.data.exists())
+
+    def test_invalid_submission(self) -> None:
+        self.participant.started_at = None
+        self.participant.save()
+
+        resp = self.post(
+            [
+                {
+                    "type": "data",
+                    "module": "fear-conditioning-data",
+                    "rows": self.get_rows(1),
+                },
+                {"type": "submission"},
+            ]
+        )
+
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(
+            resp.json(),
+            {
+                "operations": {
+                    "1": {
+                        "participant": "This participant has not started an experiment."
+                    }
+                }
+            },
+        )
+        self.assertFalse(self.module.data.exists())
+
+    def test_invalid_payload(self) -> None:
+        resp = self.client.post(
+            self.url,
+            {"participant": self.participant.participant_id},
+            content_type="application/json",
+        )
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(resp.json(), {"operations": ["Expected a list of items."]})
+
+        resp = self.client.post(
+            self.url,
+            {"participant": "invalid", "operations": []},
+            content_type="application/json",
+        )
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(resp.json(), {"participant": ["Invalid participant"]})
+
+    def test_idempotency_key(self) -> None:
+        operations = [
+            {
+                "type": "data",
+                "module": "fear-conditioning-data",
+                "rows": self.get_rows(1),
+            },
+            {"type": "submission"},
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.post(operations, HTTP_IDEMPOTENCY_KEY="key")
+        self.assertEqual(200, resp.status_code)
+
+        # The response is replayed, even though the participant has finished
+        replayed_resp = self.post(operations, HTTP_IDEMPOTENCY_KEY="key")
+        self.assertEqual(200, replayed_resp.status_code)
+        self.assertEqual(resp.json(), replayed_resp.json())
+
+        # Saved rows are acknowledged in new requests
+        resp = self.post(
+            [
+                {
+                    "type": "data",
+                    "module": "fear-conditioning-data",
+                    "rows": self.get_rows(1),
+                }
+            ],
+            HTTP_IDEMPOTENCY_KEY="other key",
+        )
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(
+            resp.json()["results"][0]["results"],
+            [{"status": "existing", "id": self.module.data.get().pk}],
+        )
+
+
+class SessionUploadAPIViewTest(TestCase):
+    def setUp(self) -> None:
+        self.experiment: Experiment = ExperimentFactory()
+        self.module: FearConditioningModule = FearConditioningModuleFactory(
+            experiment=self.experiment
+        )
+        self.participant: Participant = ParticipantFactory(experiment=self.experiment)
+        self.url = (
+            reverse("api:session_upload")
+            + f"?participant={self.participant.participant_id}"
+        )
+
+    def get_log(self, trials: range) -> bytes:
+        lines = []
+        for trial in trials:
+            row = get_fear_conditioning_row(self.participant, self.module, trial)
+            del row["participant"]
+            lines.append(
+                {"type": "data", "module": "fear-conditioning-data", "row": row}
+            )
+            lines.append(
+                {"type": "tracking", "module": self.module.pk, "trial_index": trial}
+            )
+
+        return b"".join(json.dumps(line).encode() + b"\n" for line in lines)
+
+    def post(self, body: bytes, **extra: str) -> Any:
+        return self.client.post(
+            self.url, body, content_type="application/x-ndjson", **extra
+        )
+
+    def test_post(self) -> None:
+        with mock.patch("flare_portal.api.views.SessionUploadAPIView.chunk_size", 2):
+            resp = self.post(self.get_log(range(1, 6)))
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(
+            resp.json(),
+            {
+                "participant": self.participant.participant_id,
+                "created": 5,
+                "existing": 0,
+                "invalid": 0,
+                "errors": [],
+                "tracking": {
+                    "current_module": self.module.pk,
+                    "current_trial": 5,
+                    "lock_reason": None,
+                },
+            },
+        )
+        self.assertEqual(
+            list(self.module.data.order_by("trial").values_list("trial", flat=True)),
+            [1, 2, 3, 4, 5],
+        )
+
+        self.participant.refresh_from_db()
+        self.assertEqual(self.participant.current_module_id, self.module.pk)
+        self.assertEqual(self.participant.current_trial_index, 5)
+
+        # Uploading the log again acknowledges the saved rows
+        resp = self.post(self.get_log(range(1, 7)))
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(resp.json()["created"], 1)
+        self.assertEqual(resp.json()["existing"], 5)
+        self.assertEqual(self.module.data.count(), 6)
+
+    def test_post_compressed(self) -> None:
+        resp = self.post(
+            gzip.compress(self.get_log(range(1, 4))), HTTP_CONTENT_ENCODING="gzip"
+        )
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(resp.json()["created"], 3)
+        self.assertEqual(self.module.data.count(), 3)
+
+    def test_invalid_lines(self) -> None:
+        other_module = FearConditioningModuleFactory()
+        row = get_fear_conditioning_row(self.participant, self.module, 2)
+        row["module"] = other_module.pk
+
+        body = self.get_log(range(1, 2)) + b"\n".join(
+            [
+                json.dumps(
+                    {"type": "data", "module": "fear-conditioning-data", "row": row}
+                ).encode(),
+                b"{invalid",
+                json.dumps({"type": "invalid"}).encode(),
+                b"",
+                json.dumps(
+                    {"type": "tracking", "module": other_module.pk, "trial_index": 1}
+                ).encode(),
+            ]
+        )
+
+        resp = self.post(body)
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(resp.json()["created"], 1)
+        self.assertEqual(resp.json()["invalid"], 3)
+        self.assertEqual(
+            [error["line"] for error in resp.json()["errors"]], [3, 4, 5, 7]
+        )
+        self.assertEqual(
+            resp.json()["errors"][3]["errors"],
+            {"module": ["This module is not part of the assigned experiment."]},
+        )
+        self.assertIsNone(resp.json()["tracking"])
+
+        self.participant.refresh_from_db()
+        self.assertIsNone(self.participant.current_module)
+
+    def test_invalid_body(self) -> None:
+        resp = self.post(b"not gzip", HTTP_CONTENT_ENCODING="gzip")
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(
+            resp.json(), {"non_field_errors": ["The body is not valid gzip."]}
+        )
+
+        with mock.patch(
+            "flare_portal.api.views.SessionUploadAPIView.max_line_size", 100
+        ):
+            resp = self.post(self.get_log(range(1, 2)))
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(
+            resp.json(), {"non_field_errors": ["Line 1 is longer than 100 bytes."]}
+        )
+
+        resp = self.client.post(
+            reverse("api:session_upload") + "?participant=invalid",
+            b"",
+            content_type="application/x-ndjson",
+        )
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(resp.json(), {"participant": ["Invalid participant"]})
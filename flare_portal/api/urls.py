@@ -4,14 +4,23 @@ from . import views
 from .registry import data_api_registry
 
 app_name = "api"
-urlpatterns = [
+
+# Views used by participants throughout an experiment, which are served
+# asynchronously when API_ASYNC_VIEWS is set
+participant_urlpatterns = [
     path("configuration/", views.configuration_api_view, name="configuration"),
     path("submission/", views.submission_api_view, name="submission"),
+    path("tracking/", views.tracking_api_view, name="tracking"),
+    path("sync/", views.sync_api_view, name="sync"),
+    path("sessions/", views.session_upload_api_view, name="session_upload"),
+] + data_api_registry.urls
+
+urlpatterns = participant_urlpatterns + [
+    path("assets/", views.asset_bundle_api_view, name="asset_bundle"),
     path(
         "terms-and-conditions/",
         views.terms_and_conditions_api_view,
         name="terms_and_conditions",
     ),
     path("vouchers/", views.voucher_api_view, name="voucher"),
-    path("tracking/", views.tracking_api_view, name="tracking"),
-] + data_api_registry.urls
+]
@@ -1,3 +1,13 @@
+import io
+from functools import partial
+from typing import Any, Dict, List, Type
+
+from django.db import transaction
+from django.forms import Form
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import parse_etags
+
 from rest_framework import serializers
 from rest_framework.exceptions import APIException
 from rest_framework.request import Request
@@ -5,86 +15,162 @@ from rest_framework.response import Response
 from rest_framework.serializers import DateTimeField
 from rest_framework.views import APIView
 
-from flare_portal.experiments.models import Experiment
-from flare_portal.site_config.models import SiteConfiguration
+from flare_portal.experiments.assets import get_saved_asset_bundle_hash
+from flare_portal.experiments.models import Experiment, Participant
+from flare_portal.utils.http import (
+    RangeNotSatisfiable,
+    gzip_json_page,
+    parse_range_header,
+    stream_file,
+)
 
 from . import constants
+from .configuration import get_configuration_with_etag
 from .forms import (
     ConfigurationForm,
+    ParticipantForm,
     ParticipantTrackingForm,
     SubmissionForm,
     TermsAndConditionsForm,
     VoucherForm,
 )
+from .registry import (
+    DataBatchCreateAPIView,
+    IdempotencyMixin,
+    data_api_registry,
+    prefetch_related_objects,
+    save_data_rows,
+    summarise_data_results,
+)
+from .sessions import (
+    SessionLogError,
+    SessionLogImporter,
+    iter_session_log,
+    open_session_log,
+)
 
 
 class ConfigurationAPIView(APIView):
+    def get(self, request: Request, format: str = None) -> HttpResponse:
+        """
+        Returns the configuration without starting the experiment
+
+        Clients can revalidate the configuration they have with If-None-Match.
+        """
+        form = ParticipantForm(request.query_params)
+
+        if not form.is_valid():
+            raise serializers.ValidationError(form.errors)
+
+        experiment: Experiment = form.cleaned_data["participant"].experiment
+        payload, etag = get_configuration_with_etag(experiment)
+
+        response = get_conditional_response(request, etag=etag) or Response(payload)
+        response["ETag"] = etag
+        # Researchers can change the configuration at any time
+        patch_cache_control(response, no_cache=True)
+        return response
+
     def post(self, request: Request, format: str = None) -> Response:
         form = ConfigurationForm(request.data)
 
         if form.is_valid():
-            config = SiteConfiguration.get_solo()
             experiment: Experiment = form.cleaned_data["participant"].experiment
 
             # Invalidate the current particpant ID
             form.save()
 
-            return Response(
-                constants.ConfigType(
-                    experiment=constants.ExperimentType(
-                        id=experiment.pk,
-                        name=experiment.name,
-                        description=experiment.description,
-                        contact_email=experiment.contact_email or None,
-                        trial_length=experiment.trial_length,
-                        rating_delay=experiment.rating_delay,
-                        minimum_volume=experiment.minimum_volume,
-                        iti_min_delay=experiment.iti_min_delay,
-                        iti_max_delay=experiment.iti_max_delay,
-                        rating_scale_anchor_label_left=(
-                            experiment.rating_scale_anchor_label_left
-                        ),
-                        rating_scale_anchor_label_center=(
-                            experiment.rating_scale_anchor_label_center
-                        ),
-                        rating_scale_anchor_label_right=(
-                            experiment.rating_scale_anchor_label_right
-                        ),
-                        us=experiment.us.url,
-                        us_file_volume=experiment.us_file_volume,
-                        csa=experiment.csa.url,
-                        csb=experiment.csb.url,
-                        context_a=(
-                            experiment.context_a.url if experiment.context_a else None
-                        ),
-                        context_b=(
-                            experiment.context_b.url if experiment.context_b else None
-                        ),
-                        context_c=(
-                            experiment.context_c.url if experiment.context_c else None
-                        ),
-                        gsa=experiment.gsa.url if experiment.gsa else None,
-                        gsb=experiment.gsb.url if experiment.gsb else None,
-                        gsc=experiment.gsc.url if experiment.gsc else None,
-                        gsd=experiment.gsd.url if experiment.gsd else None,
-                        reimbursements=bool(experiment.voucher_pool),
-                    ),
-                    config=constants.SiteConfigurationType(
-                        terms_and_conditions=config.participant_terms_and_conditions,
-                    ),
-                    modules=[
-                        module.get_module_config()
-                        for module in (
-                            experiment.modules.select_subclasses()  # type: ignore
-                        )
-                    ],
-                )
-            )
+            payload, etag = get_configuration_with_etag(experiment)
+            return Response(payload, headers={"ETag": etag})
 
         raise serializers.ValidationError(form.errors)
 
 
-configuration_api_view = ConfigurationAPIView.as_view()
+# Only JSON responses are compressed, as compressing responses containing
+# secrets (like the browsable API's CSRF tokens) makes them vulnerable to
+# BREACH attacks
+configuration_api_view = gzip_json_page(ConfigurationAPIView.as_view())
+
+
+class AssetBundleAPIView(APIView):
+    """
+    Serves a zip archive of the experiment's assets
+
+    The ETag is the hash of the archive's contents, and single byte ranges are
+    supported so interrupted downloads can be resumed.
+
+    Bundles are built in the background when the assets change, so the last
+    one built is served while a new one is being built. Until an experiment
+    has one, the response is a 503 asking the app to retry.
+    """
+
+    retry_after = 60
+
+    def get(self, request: Request, format: str = None) -> HttpResponse:
+        form = ParticipantForm(request.query_params)
+
+        if not form.is_valid():
+            raise serializers.ValidationError(form.errors)
+
+        experiment: Experiment = form.cleaned_data["participant"].experiment
+        bundle_hash = get_saved_asset_bundle_hash(experiment)
+
+        if bundle_hash is None:
+            if not experiment.get_assets():
+                return HttpResponse(status=204)
+
+            response = HttpResponse(status=503)
+            response["Retry-After"] = self.retry_after
+            return response
+
+        etag = quote_etag(bundle_hash)
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+            response["ETag"] = etag
+            return response
+
+        bundle = experiment.asset_bundle
+        size = bundle.size
+        byte_range = None
+
+        # Ranges of an older version of the bundle can't be resumed
+        if request.headers.get("If-Range", etag) == etag:
+            try:
+                byte_range = parse_range_header(request.headers.get("Range", ""), size)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{size}"
+                return response
+
+        start, end = byte_range or (0, size - 1)
+        response = StreamingHttpResponse(
+            stream_file(bundle, start, end),
+            content_type="application/zip",
+            status=206 if byte_range else 200,
+        )
+        response["Content-Length"] = end - start + 1
+        response["ETag"] = etag
+        response["Accept-Ranges"] = "bytes"
+        response["Content-Disposition"] = 'attachment; filename="assets.zip"'
+
+        if byte_range:
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        return response
+
+
+asset_bundle_api_view = AssetBundleAPIView.as_view()
+
+
+def get_submission_data(participant: Participant) -> constants.SubmissionType:
+    return constants.SubmissionType(
+        participant_started_at=DateTimeField().to_representation(
+            participant.started_at
+        ),
+        participant_finished_at=DateTimeField().to_representation(
+            participant.finished_at
+        ),
+    )
 
 
 class SubmissionAPIView(APIView):
@@ -95,16 +181,7 @@ class SubmissionAPIView(APIView):
             form.save()
             participant = form.cleaned_data["participant"]
 
-            return Response(
-                constants.SubmissionType(
-                    participant_started_at=DateTimeField().to_representation(
-                        participant.started_at
-                    ),
-                    participant_finished_at=DateTimeField().to_representation(
-                        participant.finished_at
-                    ),
-                )
-            )
+            return Response(get_submission_data(participant))
 
         raise serializers.ValidationError(form.errors)
 
@@ -161,26 +238,244 @@ class VoucherAPIView(APIView):
 voucher_api_view = VoucherAPIView.as_view()
 
 
+def get_tracking_data(participant: Participant) -> Dict[str, Any]:
+    return {
+        "participant": participant.participant_id,
+        "lock_reason": participant.lock_reason or None,
+        "current_module": participant.current_module_id,
+        "current_trial": participant.current_trial_index
+        if participant.current_trial_index is not None
+        else None,
+    }
+
+
 class ParticipantTrackingAPIView(APIView):
     def post(self, request: Request, format: str = None) -> Response:
         form = ParticipantTrackingForm(request.data)
 
         if form.is_valid():
             participant = form.save()
-            return Response(
+            return Response(get_tracking_data(participant))
+
+        return Response(form.errors, status=400)
+
+
+tracking_api_view = ParticipantTrackingAPIView.as_view()
+
+
+class SyncAPIView(IdempotencyMixin, APIView):
+    """
+    Applies a list of operations for a participant in one request
+
+    Each operation is one of:
+
+    - {"type": "data", "module": <data endpoint slug>, "rows": [...]}, which
+      creates data rows like the batch data endpoints
+    - {"type": "tracking", ...}, with the fields of the tracking endpoint
+    - {"type": "submission"}, which marks the participant as finished
+
+    The participant is looked up once for all operations. Tracking and
+    submission operations are validated up front, and nothing is saved if any
+    of them are invalid. The operations are then applied in order, in a single
+    transaction.
+    """
+
+    max_operations = 100
+    max_rows = DataBatchCreateAPIView.max_batch_size
+
+    def post(self, request: Request, format: str = None) -> Response:
+        cache_key = self.get_idempotency_cache_key()
+
+        if cache_key:
+            response = self.get_replayed_response(cache_key)
+            if response is not None:
+                return response
+
+        envelope = request.data
+        if not isinstance(envelope, dict) or not isinstance(
+            envelope.get("operations"), list
+        ):
+            raise serializers.ValidationError(
+                {"operations": ["Expected a list of items."]}
+            )
+
+        operations = envelope["operations"]
+        if len(operations) > self.max_operations:
+            raise serializers.ValidationError(
                 {
-                    "participant": participant.participant_id,
-                    "lock_reason": participant.lock_reason or None,
-                    "current_module": participant.current_module.pk
-                    if participant.current_module
-                    else None,
-                    "current_trial": participant.current_trial_index
-                    if participant.current_trial_index is not None
-                    else None,
+                    "operations": [
+                        f"Ensure there are no more than {self.max_operations} items."
+                    ]
                 }
             )
 
-        return Response(form.errors, status=400)
+        form = ParticipantForm(envelope)
+        if not form.is_valid():
+            raise serializers.ValidationError(form.errors)
 
+        participant: Participant = form.cleaned_data["participant"]
+        actions = []
+        errors: Dict[int, Any] = {}
+        row_count = 0
 
-tracking_api_view = ParticipantTrackingAPIView.as_view()
+        for index, operation in enumerate(operations):
+            operation_type = (
+                operation.get("type") if isinstance(operation, dict) else None
+            )
+
+            if operation_type == "data":
+                serializer_class = data_api_registry.serializers.get(
+                    operation.get("module")
+                )
+                rows = operation.get("rows")
+
+                if serializer_class is None:
+                    errors[index] = {"module": ["Invalid data module."]}
+                elif not isinstance(rows, list):
+                    errors[index] = {"rows": ["Expected a list of items."]}
+                else:
+                    row_count += len(rows)
+                    actions.append(
+                        partial(
+                            self.save_data,
+                            participant,
+                            operation["module"],
+                            serializer_class,
+                            rows,
+                            acknowledge_existing=bool(cache_key),
+                        )
+                    )
+            elif operation_type in ["tracking", "submission"]:
+                form_class = (
+                    ParticipantTrackingForm
+                    if operation_type == "tracking"
+                    else SubmissionForm
+                )
+                form = form_class(operation, participant=participant)
+
+                try:
+                    is_valid = form.is_valid()
+                except serializers.ValidationError as e:
+                    # SubmissionForm raises its own errors
+                    is_valid = False
+                    errors[index] = e.detail
+                else:
+                    if not is_valid:
+                        errors[index] = form.errors
+
+                if is_valid:
+                    actions.append(partial(self.save_form, operation_type, form))
+            else:
+                errors[index] = {
+                    "type": ['Expected "data", "tracking" or "submission".']
+                }
+
+        if errors:
+            raise serializers.ValidationError({"operations": errors})
+
+        if row_count > self.max_rows:
+            raise serializers.ValidationError(
+                {
+                    "operations": [
+                        f"Ensure there are no more than {self.max_rows} data rows."
+                    ]
+                }
+            )
+
+        with transaction.atomic():
+            data = {
+                "participant": participant.participant_id,
+                "results": [action() for action in actions],
+            }
+
+            if cache_key:
+                self.store_response(cache_key, data)
+
+        return Response(data)
+
+    def save_data(
+        self,
+        participant: Participant,
+        module: str,
+        serializer_class: Type[serializers.ModelSerializer],
+        rows: List[Any],
+        acknowledge_existing: bool,
+    ) -> Dict[str, Any]:
+        # Rows always belong to the envelope's participant
+        rows = [
+            {**row, "participant": participant.participant_id}
+            if isinstance(row, dict)
+            else row
+            for row in rows
+        ]
+        context = {
+            **self.get_serializer_context(),
+            "prefetched_objects": prefetch_related_objects(
+                serializer_class,
+                rows,
+                {"participant": {participant.participant_id: participant}},
+            ),
+        }
+        results = save_data_rows(
+            serializer_class, rows, context, acknowledge_existing=acknowledge_existing
+        )
+
+        return {"type": "data", "module": module, **summarise_data_results(results)}
+
+    def save_form(self, operation_type: str, form: Form) -> Dict[str, Any]:
+        participant = form.save()
+
+        if operation_type == "tracking":
+            return {"type": "tracking", **get_tracking_data(participant)}
+
+        return {"type": "submission", **get_submission_data(participant)}
+
+    def get_serializer_context(self) -> Dict[str, Any]:
+        return {"request": self.request, "format": self.format_kwarg, "view": self}
+
+
+sync_api_view = SyncAPIView.as_view()
+
+
+class SessionUploadAPIView(APIView):
+    """
+    Saves a whole session log of a participant, uploaded as newline delimited
+    JSON (see flare_portal.api.sessions)
+
+    The participant is given in the query string, so the body can be read and
+    saved as it arrives rather than loaded into memory.
+    """
+
+    chunk_size = 500
+    max_line_size = 1024 * 1024
+
+    def post(self, request: Request, format: str = None) -> Response:
+        form = ParticipantForm(request.query_params)
+
+        if not form.is_valid():
+            raise serializers.ValidationError(form.errors)
+
+        stream = open_session_log(
+            request.stream or io.BytesIO(),
+            request.headers.get("Content-Encoding", ""),
+        )
+        importer = SessionLogImporter(
+            form.cleaned_data["participant"],
+            {"request": request, "view": self},
+            chunk_size=self.chunk_size,
+        )
+
+        try:
+            for line_number, entry in iter_session_log(stream, self.max_line_size):
+                importer.add(line_number, entry)
+        except SessionLogError as e:
+            # Chunks that have been saved are acknowledged when the log is
+            # uploaded again
+            raise serializers.ValidationError(
+                {serializers.api_settings.NON_FIELD_ERRORS_KEY: [str(e)]}
+            )
+
+        return Response(importer.finish())
+
+
+session_upload_api_view = SessionUploadAPIView.as_view()
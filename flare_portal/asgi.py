@@ -0,0 +1,19 @@
+"""
+ASGI config for flare_portal project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+The participant API views run concurrently when the site is served with it (see
+flare_portal.api.async_views).
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "flare_portal.settings.production")
+os.environ.setdefault("API_ASYNC_VIEWS", "true")
+
+application = get_asgi_application()
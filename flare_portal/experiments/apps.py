@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ExperimentsConfig(AppConfig):
     name = "flare_portal.experiments"
     label = "experiments"
+
+    def ready(self) -> None:
+        from . import signals  # noqa
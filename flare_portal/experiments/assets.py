@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+
+from .models import Experiment
+from .models.core import experiment_asset_bundle_path
+
+# How long a build can hold an experiment's bundle lock for, in seconds
+BUILD_LOCK_TIMEOUT = 60 * 10
+
+
+def save_asset_hashes(experiment: Experiment) -> bool:
+    """
+    Hashes the experiment's changed assets and saves the hashes, without
+    sending any signals
+
+    Returns whether any hashes changed.
+    """
+    if not experiment.update_asset_hashes():
+        return False
+
+    Experiment.objects.filter(pk=experiment.pk).update(
+        asset_hashes=experiment.asset_hashes
+    )
+    return True
+
+
+def get_asset_bundle_hash(experiment: Experiment) -> Optional[str]:
+    """
+    Returns a hash of the experiment's asset hashes, which identifies the
+    contents of its asset bundle
+    """
+    if not experiment.asset_hashes:
+        return None
+
+    sha256 = hashlib.sha256()
+    for field_name, asset_hash in sorted(experiment.asset_hashes.items()):
+        sha256.update(f"{field_name}:{asset_hash['sha256']}\n".encode())
+
+    return sha256.hexdigest()
+
+
+def get_saved_asset_bundle_hash(experiment: Experiment) -> Optional[str]:
+    """
+    Returns the hash of the experiment's saved asset bundle, which may be out
+    of date if it's being rebuilt
+    """
+    if not experiment.asset_bundle:
+        return None
+
+    # Bundles are named after their hash, plus any suffix the storage adds
+    return os.path.basename(experiment.asset_bundle.name)[:64]
+
+
+def get_asset_bundle_filename(field_name: str, field_file: FieldFile) -> str:
+    return field_name + os.path.splitext(field_file.name)[1]
+
+
+def build_asset_bundle(experiment: Experiment) -> Optional[str]:
+    """
+    Builds a zip archive of the experiment's assets and saves it to
+    Experiment.asset_bundle, unless the current one is up to date
+
+    The archive also contains a manifest.json file, mapping field names to file
+    names and hashes. Assets are already compressed, so they're stored as they
+    are.
+
+    Only one process builds an experiment's bundle at a time. When the bundle
+    is being built by another process, which may have read the assets before
+    they changed, that process is asked to build it again once it's done.
+    Replaced bundles are kept for ASSET_BUNDLE_GRACE_PERIOD seconds, so
+    downloads in progress can finish, and deleted by a later build.
+
+    Returns the bundle's hash, or None if there are no assets or the bundle is
+    being built by another process.
+    """
+    lock_key = f"experiments:asset-bundle-lock:{experiment.pk}"
+    rebuild_key = f"experiments:asset-bundle-rebuild:{experiment.pk}"
+    bundle_hash = None
+
+    while True:
+        if not cache.add(lock_key, True, BUILD_LOCK_TIMEOUT):
+            cache.set(rebuild_key, True, BUILD_LOCK_TIMEOUT)
+            # The lock may have been released before the rebuild was requested,
+            # in which case its holder won't have seen the request
+            if not cache.add(lock_key, True, BUILD_LOCK_TIMEOUT):
+                return bundle_hash
+
+        try:
+            if cache.get(rebuild_key):
+                # Another process changed the assets
+                cache.delete(rebuild_key)
+                experiment.refresh_from_db()
+            bundle_hash = _build_asset_bundle(experiment)
+        finally:
+            cache.delete(lock_key)
+
+        if not cache.get(rebuild_key):
+            return bundle_hash
+
+
+def build_outdated_asset_bundles() -> int:
+    """
+    Builds the bundles of experiments whose assets have changed since their
+    bundle was built, and returns how many were built
+
+    Assets are hashed as experiments are saved, so out of date bundles are
+    found without reading any files. Run by the export worker, so bundles are
+    built in the background soon after the assets change.
+    """
+    count = 0
+
+    for experiment in Experiment.objects.iterator():
+        if get_asset_bundle_hash(experiment) == get_saved_asset_bundle_hash(experiment):
+            continue
+
+        previous_bundle = experiment.asset_bundle.name
+        build_asset_bundle(experiment)
+        count += experiment.asset_bundle.name != previous_bundle
+
+    return count
+
+
+def _build_asset_bundle(experiment: Experiment) -> Optional[str]:
+    # Another process may have built a bundle since the experiment was loaded
+    experiment.refresh_from_db(fields=["asset_bundle", "updated_at"])
+    save_asset_hashes(experiment)
+    bundle_hash = get_asset_bundle_hash(experiment)
+    previous_bundle = experiment.asset_bundle.name
+
+    if bundle_hash is None:
+        experiment.asset_bundle = ""
+    elif get_saved_asset_bundle_hash(experiment) != bundle_hash:
+        assets = experiment.get_assets()
+        manifest = {
+            field_name: {
+                "filename": get_asset_bundle_filename(field_name, field_file),
+                "sha256": experiment.asset_hashes[field_name]["sha256"],
+            }
+            for field_name, field_file in assets.items()
+        }
+
+        with tempfile.NamedTemporaryFile(suffix=".zip") as bundle_file:
+            with zipfile.ZipFile(bundle_file, "w", zipfile.ZIP_STORED) as archive:
+                archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+
+                for field_name, field_file in assets.items():
+                    with archive.open(
+                        manifest[field_name]["filename"], "w"
+                    ) as archive_member, field_file.storage.open(
+                        field_file.name, "rb"
+                    ) as asset_file:
+                        for chunk in asset_file.chunks():
+                            archive_member.write(chunk)
+
+            bundle_file.seek(0)
+            experiment.asset_bundle.save(
+                f"{bundle_hash}.zip", File(bundle_file), save=False
+            )
+
+    if experiment.asset_bundle.name != previous_bundle:
+        Experiment.objects.filter(pk=experiment.pk).update(
+            asset_bundle=experiment.asset_bundle.name
+        )
+
+    delete_stale_asset_bundles(experiment)
+    return bundle_hash
+
+
+def delete_stale_asset_bundles(experiment: Experiment) -> int:
+    """
+    Deletes the experiment's bundles that were replaced more than
+    ASSET_BUNDLE_GRACE_PERIOD seconds ago, and returns how many were deleted
+
+    A bundle is replaced when the next one is built, or when the experiment
+    was last updated if there isn't a newer one, as its assets were removed.
+    Should only be called by build_asset_bundle, which holds the experiment's
+    bundle lock.
+    """
+    storage = experiment.asset_bundle.storage
+    directory = os.path.dirname(experiment_asset_bundle_path(experiment, "bundle"))
+
+    try:
+        _, filenames = storage.listdir(directory)
+    except FileNotFoundError:
+        return 0
+
+    bundles = sorted(
+        (storage.get_modified_time(name), name)
+        for name in (os.path.join(directory, filename) for filename in filenames)
+    )
+    cutoff = timezone.now() - timedelta(seconds=settings.ASSET_BUNDLE_GRACE_PERIOD)
+    count = 0
+
+    for index, (_, name) in enumerate(bundles):
+        if name == experiment.asset_bundle.name:
+            continue
+
+        if index + 1 < len(bundles):
+            replaced_at = bundles[index + 1][0]
+        else:
+            replaced_at = experiment.updated_at
+
+        if replaced_at < cutoff:
+            storage.delete(name)
+            count += 1
+
+    return count
@@ -0,0 +1,259 @@
+"""
+Exports with typed columns, as Parquet files
+
+Each exporter's serializer fields become columns, typed after the model
+fields they're read from, and rows are written in record batches so only a
+batch is held in memory at a time. Needs pyarrow, which is installed with
+the parquet extra.
+"""
+from itertools import islice
+from typing import IO, TYPE_CHECKING, Any, Dict, Iterator, List, Optional
+
+from django.contrib.admin.utils import NotRelationField, get_fields_from_path
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+
+from rest_framework import serializers
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None  # type: ignore
+
+if TYPE_CHECKING:
+    from .exports import Exporter
+
+# Number of rows in each record batch, and row group of the Parquet files
+BATCH_SIZE = 64 * 1024
+# Compression of the Parquet files' pages
+PARQUET_COMPRESSION = "zstd"
+
+
+def get_model_field(model: Any, source: str) -> Optional[models.Field]:
+    """
+    Returns the model field a serializer field's source is read from, or None
+    if it isn't a model field
+    """
+    *path, name = source.split(".")
+
+    try:
+        if path:
+            model = get_fields_from_path(model, "__".join(path))[-1].related_model
+        if name == "pk":
+            return model._meta.pk
+        return get_fields_from_path(model, name)[-1]
+    except (FieldDoesNotExist, NotRelationField, AttributeError):
+        return None
+
+
+def get_arrow_type(
+    field: serializers.Field, model_field: Optional[models.Field]
+) -> "pyarrow.DataType":
+    """
+    Returns the type of the field's column, from the model field if there is
+    one, and from the serializer field if not
+    """
+    if isinstance(field, serializers.SerializerMethodField):
+        return pyarrow.string()
+
+    typed_field = model_field or field
+    if isinstance(typed_field, models.ForeignKey):
+        typed_field = typed_field.target_field
+
+    if isinstance(typed_field, (models.BooleanField, serializers.BooleanField)):
+        return pyarrow.bool_()
+    if isinstance(
+        typed_field,
+        (models.IntegerField, models.AutoField, serializers.IntegerField),
+    ):
+        return pyarrow.int64()
+    if isinstance(typed_field, (models.FloatField, serializers.FloatField)):
+        return pyarrow.float64()
+    if isinstance(typed_field, (models.DecimalField, serializers.DecimalField)):
+        return pyarrow.decimal128(typed_field.max_digits, typed_field.decimal_places)
+    if isinstance(typed_field, (models.DateTimeField, serializers.DateTimeField)):
+        return pyarrow.timestamp("us", tz="UTC")
+    if isinstance(typed_field, (models.DateField, serializers.DateField)):
+        return pyarrow.date32()
+
+    return pyarrow.string()
+
+
+def get_value(field: serializers.Field, instance: models.Model) -> Any:
+    """Returns the field's value for the instance, before it's represented"""
+    value = field.get_attribute(instance)
+
+    if isinstance(field, serializers.SerializerMethodField):
+        return field.to_representation(value)
+
+    return value
+
+
+class ColumnarExport:
+    """Reads an exporter's rows as typed columns"""
+
+    def __init__(self, exporter: "Exporter") -> None:
+        if pyarrow is None:
+            raise ImportError("Parquet exports need pyarrow to be installed")
+
+        self.exporter = exporter
+        self.serializer = exporter.serializer_class(
+            context=exporter.get_serializer_context()
+        )
+        self.fields = list(self.serializer.fields.values())
+
+        model = exporter.serializer_class.Meta.model
+        model_fields = [get_model_field(model, field.source) for field in self.fields]
+        self.schema = pyarrow.schema(
+            [
+                (
+                    field.field_name,
+                    pyarrow.type_for_alias(exporter.column_types[field.field_name])
+                    if field.field_name in exporter.column_types
+                    else get_arrow_type(field, model_field),
+                )
+                for field, model_field in zip(self.fields, model_fields)
+            ]
+        )
+        # Values that aren't read from text columns are converted to strings
+        # for string columns, such as a relation's primary key
+        self.converted = [
+            arrow_type == pyarrow.string()
+            and not isinstance(model_field, (models.CharField, models.TextField))
+            for arrow_type, model_field in zip(self.schema.types, model_fields)
+        ]
+
+    def get_batch(self, columns: List[List[Any]]) -> "pyarrow.RecordBatch":
+        arrays = []
+
+        for values, arrow_type, converted in zip(
+            columns, self.schema.types, self.converted
+        ):
+            if converted:
+                values = [None if value is None else str(value) for value in values]
+
+            array = pyarrow.array(values, type=arrow_type)
+            if arrow_type == pyarrow.string():
+                # Empty values are written as NA in CSVs, so are null here
+                array = pyarrow.compute.if_else(
+                    pyarrow.compute.equal(array, ""),
+                    pyarrow.scalar(None, type=arrow_type),
+                    array,
+                )
+            arrays.append(array)
+
+        return pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def iter_value_columns(self) -> Optional[Iterator[List[List[Any]]]]:
+        """
+        Yields batches of columns read with values_list, or returns None if
+        the fields can't all be read that way. See Exporter.iter_value_chunks
+        """
+        exporter = self.exporter
+        constant_fields = exporter.get_constant_fields(self.fields)
+        value_fields = [field for field in self.fields if field not in constant_fields]
+
+        lookups = exporter.get_lookups(value_fields)
+        if lookups is None:
+            return None
+
+        model = exporter.serializer_class.Meta.model
+        constants: Dict[Any, List[Any]] = {}
+        if exporter.constant_relation:
+            lookups.append(f"{exporter.constant_relation}_id")
+            constants = {
+                obj.pk: [
+                    get_value(field, model(**{exporter.constant_relation: obj}))
+                    for field in constant_fields
+                ]
+                for obj in exporter.get_constant_objects()
+            }
+
+        positions = [
+            constant_fields.index(field) + len(value_fields)
+            if field in constant_fields
+            else value_fields.index(field)
+            for field in self.fields
+        ]
+
+        def iter_columns() -> Iterator[List[List[Any]]]:
+            rows = exporter.iterate(
+                exporter.get_export_queryset().values_list(*lookups)
+            )
+
+            while chunk := list(islice(rows, BATCH_SIZE)):
+                columns = [list(column) for column in zip(*chunk)]
+                if constants:
+                    # In place of the related objects' IDs
+                    related_ids = columns.pop()
+                    columns.extend(
+                        list(column)
+                        for column in zip(*(constants[pk] for pk in related_ids))
+                    )
+
+                yield [columns[position] for position in positions]
+
+        return iter_columns()
+
+    def iter_instance_columns(self) -> Iterator[List[List[Any]]]:
+        """Yields batches of columns read from model instances"""
+        instances = self.exporter.iterate(self.exporter.get_export_queryset())
+
+        while chunk := list(islice(instances, BATCH_SIZE)):
+            yield [
+                [get_value(field, instance) for instance in chunk]
+                for field in self.fields
+            ]
+
+    def iter_batches(self) -> Iterator["pyarrow.RecordBatch"]:
+        columns = None
+        if self.exporter.use_values:
+            columns = self.iter_value_columns()
+        if columns is None:
+            columns = self.iter_instance_columns()
+
+        for batch_columns in columns:
+            batch = self.get_batch(batch_columns)
+            self.exporter.rows_written += batch.num_rows
+            yield batch
+
+    def get_parquet_writer(self, file: IO) -> "pyarrow.parquet.ParquetWriter":
+        """
+        Returns a writer of the rows into the given file as Parquet, which
+        the record batches can be written with, each as a row group
+        """
+        return pyarrow.parquet.ParquetWriter(
+            file, self.schema, compression=PARQUET_COMPRESSION
+        )
+
+
+class PivotColumnarExport(ColumnarExport):
+    """
+    Reads the columns of an exporter that pivots integer values into a
+    column each, after the participant's ID. See
+    FearConditioningRatingsExporter
+    """
+
+    def __init__(self, exporter: "Exporter") -> None:
+        if pyarrow is None:
+            raise ImportError("Parquet exports need pyarrow to be installed")
+
+        self.exporter = exporter
+        participant_id, *value_fields = exporter.get_fields()
+        self.schema = pyarrow.schema(
+            [
+                (participant_id, pyarrow.string()),
+                *((name, pyarrow.int64()) for name in value_fields),
+            ]
+        )
+        self.converted = [False] * len(self.schema)
+
+    def iter_batches(self) -> Iterator["pyarrow.RecordBatch"]:
+        rows = self.exporter.iter_rows()  # type: ignore
+
+        while chunk := list(islice(rows, BATCH_SIZE)):
+            batch = self.get_batch([list(column) for column in zip(*chunk)])
+            self.exporter.rows_written += batch.num_rows
+            yield batch
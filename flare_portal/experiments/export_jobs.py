@@ -0,0 +1,267 @@
+"""
+Data exports built in the background
+
+Researchers queue an export, and a worker running the run_export_jobs
+command builds the archive and saves it to the default storage. Workers
+claim jobs with SKIP LOCKED row locks, so any number of them can run.
+
+Each job records a fingerprint of the data it exports. Queueing an export
+when nothing has changed since the last one reuses that job's archive, and
+exports queued at the same time share a job.
+
+Incremental exports only include the data added or changed since the
+researcher's last incremental export of the experiment, as recorded by their
+ExportCursor.
+"""
+import logging
+import tempfile
+import time
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth.base_user import AbstractBaseUser
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .exports import ZipExporter
+from .models import Experiment, ExportCursor, ExportJob
+from .tracking import flush_tracking_buffer
+
+logger = logging.getLogger(__name__)
+
+# How often the progress of a running job is saved, in seconds
+PROGRESS_INTERVAL = 2
+# Number of each researcher's incremental exports of an experiment kept
+INCREMENTAL_EXPORTS_KEPT = 10
+
+
+def queue_export(
+    experiment: Experiment,
+    user: Optional[AbstractBaseUser] = None,
+    incremental: bool = False,
+    file_format: str = ExportJob.FILE_FORMATS.csv,
+) -> Tuple[ExportJob, bool]:
+    """
+    Returns a job exporting the experiment's current data, and whether it was
+    queued by this call
+
+    The job is an existing one if the latest one has the same fingerprint, or
+    hasn't started yet, as workers update the fingerprint of jobs they start.
+    Incremental exports are only shared with the user's own queued ones, as
+    each one moves the user's cursor on.
+
+    The experiment's row is locked while its export is queued, so requests
+    made at the same time wait for each other, and share the job rather than
+    each building the same archive.
+    """
+    if not incremental:
+        # Buffered progress is part of the data, so it's fingerprinted too
+        flush_tracking_buffer()
+
+    with transaction.atomic():
+        Experiment.objects.select_for_update(no_key=True).values_list("pk").get(
+            pk=experiment.pk
+        )
+
+        if incremental:
+            cursor, _ = ExportCursor.objects.get_or_create(
+                experiment=experiment, user=user
+            )
+            existing_job = cursor.export_jobs.filter(
+                status=ExportJob.STATUS.queued, file_format=file_format
+            ).first()
+            if existing_job:
+                return existing_job, False
+
+            job = ExportJob.objects.create(
+                experiment=experiment,
+                requested_by=user,
+                cursor=cursor,
+                file_format=file_format,
+            )
+            return job, True
+
+        fingerprint = ZipExporter(experiment, file_format=file_format).get_fingerprint()
+
+        # Only the latest job is reused, as older ones have been replaced and
+        # their archives are about to be deleted
+        existing_job = (
+            experiment.export_jobs.filter(cursor__isnull=True, file_format=file_format)
+            .exclude(status=ExportJob.STATUS.failed)
+            .order_by("-created_at")
+            .first()
+        )
+        if existing_job and (
+            existing_job.fingerprint == fingerprint
+            or existing_job.status == ExportJob.STATUS.queued
+        ):
+            return existing_job, False
+
+        job = ExportJob.objects.create(
+            experiment=experiment,
+            requested_by=user,
+            fingerprint=fingerprint,
+            file_format=file_format,
+        )
+        return job, True
+
+
+def claim_export_job() -> Optional[ExportJob]:
+    """
+    Marks the oldest queued job as running and returns it
+
+    Running jobs that haven't saved any progress for EXPORT_JOB_TIMEOUT
+    seconds are assumed to have lost their worker, and are claimed again.
+    """
+    stalled_before = timezone.now() - timedelta(seconds=settings.EXPORT_JOB_TIMEOUT)
+
+    with transaction.atomic():
+        job = (
+            ExportJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=ExportJob.STATUS.queued)
+                | Q(status=ExportJob.STATUS.running, updated_at__lt=stalled_before)
+            )
+            .order_by("created_at")
+            .first()
+        )
+
+        if job:
+            job.status = ExportJob.STATUS.running
+            job.started_at = timezone.now()
+            job.save(update_fields=["status", "started_at", "updated_at"])
+
+    return job
+
+
+def run_export_job(job: ExportJob) -> None:
+    """
+    Builds the job's archive and saves it, along with the job's progress
+
+    Once the archive is saved, the experiment's previous archives are out of
+    date, and are deleted once their grace period has passed.
+    """
+    experiment = Experiment.objects.get(pk=job.experiment_id)
+    # Export the latest progress of all participants. Flushed before the
+    # positions and fingerprint are read, so they describe the same data as
+    # the archive
+    flush_tracking_buffer()
+    if job.is_incremental:
+        move_cursor(job)
+    exporter = ZipExporter(
+        experiment, since=job.since, until=job.until, file_format=job.file_format
+    )
+
+    try:
+        job.fingerprint = exporter.get_fingerprint()
+        job.progress = exporter.get_progress()
+        job.save(update_fields=["fingerprint", "progress", "updated_at"])
+
+        with tempfile.TemporaryFile() as archive_file:
+            progress_saved_at = time.monotonic()
+
+            for data in exporter.iter_zip():
+                archive_file.write(data)
+
+                if time.monotonic() - progress_saved_at >= PROGRESS_INTERVAL:
+                    job.progress = exporter.get_progress()
+                    job.save(update_fields=["progress", "updated_at"])
+                    progress_saved_at = time.monotonic()
+
+            archive_file.seek(0)
+            job.archive.save(exporter.get_filename(), File(archive_file), save=False)
+    except Exception as e:
+        logger.exception("Export job %s failed", job.pk)
+        job.status = ExportJob.STATUS.failed
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        job.save(update_fields=["status", "error", "finished_at", "updated_at"])
+
+        if job.is_incremental:
+            # Export the data again next time, unless the cursor has moved on
+            ExportCursor.objects.filter(pk=job.cursor_id, positions=job.until).update(
+                positions=job.since, updated_at=timezone.now()
+            )
+        return
+
+    job.status = ExportJob.STATUS.finished
+    job.progress = exporter.get_progress()
+    job.finished_at = timezone.now()
+    job.save(
+        update_fields=["status", "progress", "archive", "finished_at", "updated_at"]
+    )
+
+    delete_replaced_export_jobs([experiment.pk])
+
+
+def delete_replaced_export_jobs(experiment_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Deletes the finished jobs, and their archives, that were replaced by a
+    newer one more than EXPORT_ARCHIVE_GRACE_PERIOD seconds ago, and returns
+    how many were deleted
+
+    Full exports are replaced by the next one in the same format. Incremental
+    exports each have different data, so are only replaced once the cursor has
+    INCREMENTAL_EXPORTS_KEPT newer ones. Archives are kept for a while after
+    they're replaced, so downloads that have already started can finish.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.EXPORT_ARCHIVE_GRACE_PERIOD)
+    jobs = ExportJob.objects.filter(status=ExportJob.STATUS.finished).order_by(
+        "-created_at"
+    )
+    if experiment_ids is not None:
+        jobs = jobs.filter(experiment_id__in=experiment_ids)
+
+    jobs_by_group: Dict[Tuple, List[ExportJob]] = defaultdict(list)
+    for job in jobs:
+        file_format = None if job.is_incremental else job.file_format
+        jobs_by_group[job.experiment_id, job.cursor_id, file_format].append(job)
+
+    count = 0
+
+    for group_jobs in jobs_by_group.values():
+        kept = INCREMENTAL_EXPORTS_KEPT if group_jobs[0].is_incremental else 1
+
+        for replacement, job in zip(group_jobs, group_jobs[kept:]):
+            if replacement.finished_at < cutoff:
+                job.archive.delete(save=False)
+                job.delete()
+                count += 1
+
+    return count
+
+
+def move_cursor(job: ExportJob) -> None:
+    """
+    Sets the positions an incremental job exports since and up to, and moves
+    its cursor on to the positions it exports up to
+
+    The cursor is moved as the job starts, so later jobs don't export the
+    same data. Jobs that have been started before keep their positions.
+    """
+    if job.until is not None:
+        return
+
+    with transaction.atomic():
+        cursor = ExportCursor.objects.select_for_update().get(pk=job.cursor_id)
+        job.since = cursor.positions
+        job.until = ZipExporter(job.experiment).get_positions()
+        cursor.positions = job.until
+
+        cursor.save(update_fields=["positions", "updated_at"])
+        job.save(update_fields=["since", "until", "updated_at"])
+
+
+def run_export_jobs() -> int:
+    """Runs queued jobs until there are none left, and returns how many ran"""
+    count = 0
+
+    while job := claim_export_job():
+        run_export_job(job)
+        count += 1
+
+    return count
@@ -0,0 +1,120 @@
+"""
+Worker processes for building the files of an archive in parallel
+
+Workers are started with spawn, and import this module before Django is set
+up, so anything that uses models is imported once it is.
+"""
+import os
+import tempfile
+import zipfile
+import zlib
+from typing import IO, TYPE_CHECKING, Any, Dict, NamedTuple, Type
+
+import django
+from django.db import connections, transaction
+
+if TYPE_CHECKING:
+    from .exports import Exporter
+
+# Rows written by each of the archive's exporters, shared with the process
+# building the archive
+rows_written: Any = None
+
+
+class ArchiveMember(NamedTuple):
+    # Temporary file of the member's data as it's stored in the archive,
+    # deleted by whoever reads it
+    path: str
+    compress_type: int
+    crc: int
+    file_size: int
+    compress_size: int
+
+
+def init_worker(database_names: Dict[str, str], progress: Any) -> None:
+    """Sets up Django, using the same databases as the parent process"""
+    global rows_written
+
+    django.setup()
+    for alias, name in database_names.items():
+        connections[alias].settings_dict["NAME"] = name
+
+    rows_written = progress
+
+
+def write_csv(exporter: "Exporter", file: IO, index: int) -> ArchiveMember:
+    """Writes the CSV compressed like ZipFile would"""
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    crc = 0
+    file_size = 0
+
+    for chunk in exporter.iter_csv_bytes():
+        crc = zlib.crc32(chunk, crc)
+        file_size += len(chunk)
+        file.write(compressor.compress(chunk))
+        rows_written[index] = exporter.rows_written
+
+    file.write(compressor.flush())
+
+    return ArchiveMember(
+        path=file.name,
+        compress_type=zipfile.ZIP_DEFLATED,
+        crc=crc,
+        file_size=file_size,
+        compress_size=file.tell(),
+    )
+
+
+def write_parquet(exporter: "Exporter", file: IO, index: int) -> ArchiveMember:
+    """Writes the Parquet file, which is stored in the archive as it is"""
+    export = exporter.columnar_export_class(exporter)
+    with export.get_parquet_writer(file) as writer:
+        for batch in export.iter_batches():
+            writer.write_batch(batch)
+            rows_written[index] = exporter.rows_written
+
+    file_size = file.tell()
+    file.seek(0)
+    crc = 0
+    while data := file.read(64 * 1024):
+        crc = zlib.crc32(data, crc)
+
+    return ArchiveMember(
+        path=file.name,
+        compress_type=zipfile.ZIP_STORED,
+        crc=crc,
+        file_size=file_size,
+        compress_size=file_size,
+    )
+
+
+def write_member(
+    exporter_class: Type["Exporter"],
+    experiment_pk: int,
+    index: int,
+    file_format: str = "csv",
+    since: Any = None,
+    until: Any = None,
+) -> ArchiveMember:
+    """
+    Writes the exporter's file as it's stored in the archive, so it can be
+    copied into it as it is
+    """
+    from .models import Experiment
+
+    exporter = exporter_class(
+        Experiment.objects.get(pk=experiment_pk), since=since, until=until
+    )
+    write = write_parquet if file_format == "parquet" else write_csv
+
+    with tempfile.NamedTemporaryFile(suffix=f".{file_format}", delete=False) as file:
+        try:
+            # Server-side cursors opened outside of a transaction are held
+            # past its end, so PostgreSQL stores all of their rows before the
+            # first is read. Within one, the rows are read as they're found
+            with transaction.atomic():
+                return write(exporter, file, index)
+        except BaseException:
+            file.close()
+            os.remove(file.name)
+            raise
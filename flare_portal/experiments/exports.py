@@ -1,28 +1,263 @@
 import csv
-import tempfile
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
 import zipfile
-from collections import OrderedDict
-from datetime import datetime
-from typing import IO, List, Type
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import islice
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
 
-from django.db.models import QuerySet
+from django.conf import settings
+from django.contrib.admin.utils import NotRelationField, get_fields_from_path
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, models
+from django.db.models import (
+    Aggregate,
+    Case,
+    Count,
+    Expression,
+    F,
+    Func,
+    Max,
+    Model,
+    OuterRef,
+    Q,
+    QuerySet,
+    Subquery,
+    Value,
+    When,
+    prefetch_related_objects,
+)
+from django.db.models.functions import Cast, Coalesce, JSONObject, NullIf
 from django.utils import timezone
 
-from rest_framework import serializers
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from flare_portal.utils.db import iter_copy_to, wait_for_transactions
 
+from .columnar import ColumnarExport, PivotColumnarExport
+from .export_workers import ArchiveMember, init_worker, write_member
 from .models import (
     AffectiveRatingData,
     BasicInfoData,
+    BreakEndModule,
     ContingencyAwarenessData,
     CriterionData,
     Experiment,
     FearConditioningData,
+    FearConditioningModule,
     Participant,
     PostExperimentQuestionsData,
     USUnpleasantnessData,
     VolumeCalibrationData,
 )
 
+logger = logging.getLogger(__name__)
+
+# Written in place of empty values
+NA = "NA"
+
+Formatter = Callable[[Any], Any]
+
+
+def format_decimal(value: Decimal) -> str:
+    return f"{value:f}"
+
+
+def get_formatter(field: serializers.Field) -> Optional[Formatter]:
+    """
+    Returns a function that represents database values like the field's
+    to_representation, or None if they're written as they are
+
+    The csv module writes values with str(), so fields that only convert
+    values to strings, integers or booleans don't need formatting.
+    """
+    if isinstance(
+        field,
+        (
+            serializers.BooleanField,
+            serializers.CharField,
+            serializers.ChoiceField,
+            serializers.IntegerField,
+            serializers.ReadOnlyField,
+        ),
+    ):
+        return None
+
+    if isinstance(field, serializers.DateTimeField):
+        output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+        field_timezone = getattr(field, "timezone", field.default_timezone())
+
+        if output_format == ISO_8601 and field_timezone is not None:
+
+            def format_datetime(value: datetime) -> str:
+                value_str = value.astimezone(field_timezone).isoformat()
+                if value_str.endswith("+00:00"):
+                    return value_str[:-6] + "Z"
+                return value_str
+
+            return format_datetime
+
+    if isinstance(field, serializers.DateField):
+        if getattr(field, "format", api_settings.DATE_FORMAT) == ISO_8601:
+            return date.isoformat
+
+    if isinstance(field, serializers.DecimalField):
+        if getattr(
+            field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING
+        ) and not getattr(field, "localize", False):
+            # Values are read with the field's decimal places, so don't need
+            # quantizing
+            return format_decimal
+
+    return field.to_representation
+
+
+def format_column(values: Sequence[Any], formatter: Optional[Formatter]) -> List[Any]:
+    if formatter is None:
+        return [NA if value is None or value == "" else value for value in values]
+
+    return [
+        NA if value is None or value == "" else formatter(value) for value in values
+    ]
+
+
+def represent(field: serializers.Field, instance: Model) -> Any:
+    """Returns the field's CSV value for the instance"""
+    attribute = field.get_attribute(instance)
+    value = None if attribute is None else field.to_representation(attribute)
+
+    return NA if value is None or value == "" else value
+
+
+def csv_text(expression: Any) -> Expression:
+    """Returns the expression's value as text, or NA if it's null or empty"""
+    if isinstance(expression, str):
+        expression = F(expression)
+
+    return Coalesce(
+        NullIf(Cast(expression, models.TextField()), Value("")),
+        Value(NA),
+        output_field=models.TextField(),
+    )
+
+
+def csv_boolean(lookup: str) -> Expression:
+    """Returns the boolean written like the csv module would, or NA if null"""
+    return Case(
+        When(**{lookup: True}, then=Value("True")),
+        When(**{lookup: False}, then=Value("False")),
+        default=Value(NA),
+        output_field=models.TextField(),
+    )
+
+
+class ISODateTime(Func):
+    """
+    Formats a timestamp in the given time zone like DRF's DateTimeField,
+    with microseconds only when there are some, and Z for UTC offsets of zero
+    """
+
+    output_field = models.TextField()
+
+    def __init__(self, expression: Any, timezone_name: str) -> None:
+        super().__init__(expression)
+        self.timezone_name = timezone_name
+
+    def as_sql(  # type: ignore
+        self, compiler: Any, connection: Any
+    ) -> Tuple[str, List[Any]]:
+        value_sql, value_params = compiler.compile(self.source_expressions[0])
+        local_sql = f"({value_sql} AT TIME ZONE %s)"
+        local_params = [*value_params, self.timezone_name]
+        offset_sql = f"({local_sql} - ({value_sql} AT TIME ZONE 'UTC'))"
+        offset_params = [*local_params, *value_params]
+
+        sql = (
+            f"to_char({local_sql}, 'YYYY-MM-DD\"T\"HH24:MI:SS') || "
+            f"CASE WHEN mod(extract(microseconds FROM {value_sql})::bigint, "
+            f"1000000) = 0 THEN '' ELSE to_char({local_sql}, '.US') END || "
+            f"CASE WHEN {offset_sql} = interval '0' THEN 'Z' "
+            f"WHEN {offset_sql} > interval '0' THEN '+' || "
+            f"to_char({offset_sql}, 'HH24:MI') "
+            f"ELSE to_char({offset_sql}, 'HH24:MI') END"
+        )
+        params = [
+            *local_params,
+            *value_params,
+            *local_params,
+            *offset_params,
+            *offset_params,
+            *offset_params,
+            *offset_params,
+        ]
+        return sql, params
+
+
+def get_copy_expression(
+    field: serializers.Field, model_field: models.Field, lookup: str
+) -> Optional[Expression]:
+    """
+    Returns an expression giving the same CSV value as the field would for
+    the model field, or None if the database can't format it the same way
+    """
+    if isinstance(field, serializers.DateTimeField):
+        output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+        field_timezone = getattr(field, "timezone", field.default_timezone())
+
+        if output_format == ISO_8601 and field_timezone is not None:
+            return csv_text(ISODateTime(F(lookup), str(field_timezone)))
+        return None
+
+    if isinstance(field, serializers.DecimalField):
+        if getattr(
+            field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING
+        ) and not getattr(field, "localize", False):
+            # Numeric columns are already written with their decimal places
+            return csv_text(lookup)
+        return None
+
+    if not isinstance(
+        field,
+        (
+            serializers.BooleanField,
+            serializers.CharField,
+            serializers.ChoiceField,
+            serializers.IntegerField,
+            serializers.ReadOnlyField,
+        ),
+    ):
+        return None
+
+    if isinstance(model_field, models.BooleanField):
+        return csv_boolean(lookup)
+    if isinstance(
+        model_field,
+        (models.CharField, models.TextField, models.IntegerField, models.ForeignKey),
+    ):
+        return csv_text(lookup)
+
+    return None
+
 
 class DataSerializer(serializers.ModelSerializer):
     experiment_id = serializers.CharField(source="module.experiment_id")
@@ -46,40 +281,407 @@ class DataSerializer(serializers.ModelSerializer):
 class Exporter:
     serializer_class: Type[serializers.Serializer]
 
-    def __init__(self, experiment: Experiment):
+    # Number of rows fetched from the database at a time
+    chunk_size = 2000
+    # Whether rows are fetched chunk_size at a time with a server-side
+    # cursor, so memory use doesn't grow with the number of rows. Querysets
+    # can't prefetch related objects this way
+    use_server_side_cursor = True
+    # Approximate number of characters of CSV yielded at a time
+    csv_chunk_size = 64 * 1024
+
+    # Whether rows are read with values_list, when the serializer's fields
+    # allow it, rather than serialized from model instances
+    use_values = True
+    # Relation whose fields are the same for all of its rows, such as the
+    # module of data, so are serialized once for each related object
+    constant_relation: Optional[str] = None
+    # Whether the CSV is written by the database with COPY, when the
+    # serializer's fields allow it. See iter_copy_csv
+    use_copy = False
+    # Types of the columns of Parquet exports that can't be found from the
+    # model, by field name. See flare_portal.experiments.columnar
+    column_types: Dict[str, str] = {}
+
+    # Reads the rows of Parquet exports. See flare_portal.experiments.columnar
+    columnar_export_class: Type[ColumnarExport] = ColumnarExport
+
+    # Field whose largest value marks how far an incremental export has got.
+    # Data is only ever added, so later rows have larger primary keys. See
+    # ZipExporter.get_positions for rows that are committed out of order
+    cursor_field = "pk"
+
+    def __init__(
+        self, experiment: Experiment, since: Any = None, until: Any = None
+    ) -> None:
         self.experiment = experiment
+        self.rows_written = 0
+        # Only rows whose cursor_field is after since, and up to until, are
+        # exported, when they're set
+        self.since = since
+        self.until = until
+
+    def get_title(self) -> str:
+        return self.serializer_class.Meta.model._meta.verbose_name_plural.title()
 
     def get_filename(self, current_time: datetime) -> str:
         now = current_time.strftime("%Y%m%dT%H%M%SZ")
         return f"{self.experiment.code}-{now}.csv"
 
+    def get_fields(self) -> List[str]:
+        """Returns the names of the columns"""
+        return self.serializer_class.Meta.fields
+
     def get_queryset(self) -> QuerySet:
         """Returns the queryset used for the export"""
         raise NotImplementedError()
 
-    def write(self, file: IO) -> None:
-        """Writes the CSV into the given file"""
-        serializer = self.serializer_class(self.get_queryset(), many=True)
+    def get_export_queryset(self) -> QuerySet:
+        """Returns the queryset, limited to the rows between since and until"""
+        queryset = self.get_queryset()
+
+        if self.since is not None:
+            queryset = queryset.filter(**{f"{self.cursor_field}__gt": self.since})
+        if self.until is not None:
+            queryset = queryset.filter(**{f"{self.cursor_field}__lte": self.until})
+
+        return queryset
+
+    def get_position(self) -> Any:
+        """
+        Returns the largest value of cursor_field, which an incremental export
+        can be made up to, in a form that can be saved as JSON
+
+        Timestamps are set before rows are saved, so rows with earlier ones
+        can still be being saved. Positions are kept EXPORT_CURSOR_LAG
+        seconds behind, leaving recent changes for the next export.
+        """
+        position = (
+            self.get_queryset()
+            .order_by()
+            .aggregate(position=Max(self.cursor_field))["position"]
+        )
+        if isinstance(position, datetime):
+            position = min(
+                position,
+                timezone.now() - timedelta(seconds=settings.EXPORT_CURSOR_LAG),
+            )
+            # Keeps the microseconds, which DjangoJSONEncoder doesn't
+            return position.isoformat()
 
-        writer = csv.DictWriter(file, self.serializer_class.Meta.fields)
-        writer.writeheader()
+        return position
 
-        # Write serializer data and replace None/'' with 'NA'
-        writer.writerows(
-            OrderedDict(
-                (
-                    field_name,
-                    "NA" if (field_value is None or field_value == "") else field_value,
+    def get_state_aggregates(self) -> Dict[str, Aggregate]:
+        """
+        Returns aggregates of the number of rows to export, along with values
+        that change whenever the rows do
+        """
+        # Data is only ever added or deleted
+        return {"rows": Count("pk"), "last_pk": Max("pk")}
+
+    def get_state(self) -> Dict[str, Any]:
+        return (
+            self.get_export_queryset()
+            .order_by()
+            .aggregate(**self.get_state_aggregates())
+        )
+
+    def get_state_subquery(self) -> Subquery:
+        """
+        Returns a subquery of the state as a JSON object, so the states of
+        several exporters can be read in one query
+        """
+        return Subquery(
+            self.get_export_queryset()
+            .order_by()
+            # Grouped by a constant, so all of the rows are aggregated
+            .annotate(state_group=Value(1))
+            .values("state_group")
+            .annotate(state=JSONObject(**self.get_state_aggregates()))
+            .values("state")
+        )
+
+    def iterate(self, queryset: QuerySet) -> Iterator[Any]:
+        """
+        Iterates over the queryset, chunk_size rows at a time when
+        use_server_side_cursor is set
+        """
+        if self.use_server_side_cursor:
+            return queryset.iterator(chunk_size=self.chunk_size)
+        return iter(queryset)
+
+    def get_serializer_context(self) -> Dict[str, Any]:
+        return {}
+
+    def get_rows(self) -> Iterator[Dict[str, Any]]:
+        """Serializes the queryset, fetching chunk_size rows at a time"""
+        serializer = self.serializer_class(context=self.get_serializer_context())
+
+        for obj in self.iterate(self.get_export_queryset()):
+            yield serializer.to_representation(obj)
+
+    def get_lookups(self, fields: List[serializers.Field]) -> Optional[List[str]]:
+        """
+        Returns the lookups to read the fields' values with, or None if some
+        can only be read from model instances
+        """
+        model = self.serializer_class.Meta.model
+        lookups = []
+
+        for field in fields:
+            lookup = field.source.replace(".", "__")
+            try:
+                get_fields_from_path(model, lookup)
+            except (FieldDoesNotExist, NotRelationField):
+                return None
+            lookups.append(lookup)
+
+        return lookups
+
+    def get_constant_objects(self) -> QuerySet:
+        """
+        Returns the objects of constant_relation that rows can be related to
+        """
+        raise NotImplementedError()
+
+    def get_constant_fields(
+        self, fields: List[serializers.Field]
+    ) -> List[serializers.Field]:
+        """Returns the fields with sources on constant_relation"""
+        return [
+            field
+            for field in fields
+            if field.source.split(".")[0] == self.constant_relation
+        ]
+
+    def get_constants(
+        self, constant_fields: List[serializers.Field]
+    ) -> Dict[Any, List[Any]]:
+        """
+        Returns the CSV values of the constant fields for each of the
+        constant objects, by primary key
+        """
+        model = self.serializer_class.Meta.model
+
+        return {
+            obj.pk: [
+                represent(field, model(**{self.constant_relation: obj}))
+                for field in constant_fields
+            ]
+            for obj in self.get_constant_objects()
+        }
+
+    def iter_serialized_chunks(self) -> Iterator[List[Sequence[Any]]]:
+        """Yields chunks of rows of CSV values, serialized from model instances"""
+        rows = self.get_rows()
+
+        while chunk := list(islice(rows, self.chunk_size)):
+            yield [
+                [
+                    NA if field_value is None or field_value == "" else field_value
+                    for field_value in row.values()
+                ]
+                for row in chunk
+            ]
+
+    def iter_value_chunks(self) -> Optional[Iterator[List[Sequence[Any]]]]:
+        """
+        Yields chunks of rows of CSV values, read with values_list, or returns
+        None if the serializer's fields can't all be read that way
+
+        This gives the same CSV values as the serializer, much faster.
+        Fields with sources on constant_relation are only serialized once for
+        each related object, and the others are formatted a column at a time.
+        """
+        fields = list(self.serializer_class().fields.values())
+        constant_fields = self.get_constant_fields(fields)
+        value_fields = [field for field in fields if field not in constant_fields]
+
+        lookups = self.get_lookups(value_fields)
+        if lookups is None:
+            return None
+
+        constants = {}
+        if self.constant_relation:
+            lookups.append(f"{self.constant_relation}_id")
+            constants = self.get_constants(constant_fields)
+
+        formatters = [get_formatter(field) for field in value_fields]
+        # Where each of the CSV's fields is taken from, as its index in the
+        # formatted values followed by the constant values
+        positions = [
+            constant_fields.index(field) + len(value_fields)
+            if field in constant_fields
+            else value_fields.index(field)
+            for field in fields
+        ]
+
+        def iter_chunks() -> Iterator[List[Sequence[Any]]]:
+            rows = self.iterate(self.get_export_queryset().values_list(*lookups))
+
+            while chunk := list(islice(rows, self.chunk_size)):
+                columns = list(zip(*chunk))
+                output_columns = [
+                    format_column(column, formatter)
+                    for column, formatter in zip(columns, formatters)
+                ]
+                if constants:
+                    output_columns.extend(
+                        zip(*(constants[pk] for pk in columns[len(value_fields)]))
+                    )
+
+                yield list(zip(*(output_columns[position] for position in positions)))
+
+        return iter_chunks()
+
+    def iter_csv(self) -> Iterator[str]:
+        """Yields the CSV in chunks of about csv_chunk_size characters"""
+        buffer = io.StringIO()
+
+        writer = csv.writer(buffer)
+        writer.writerow(self.serializer_class.Meta.fields)
+
+        chunks = None
+        if self.use_values:
+            chunks = self.iter_value_chunks()
+        if chunks is None:
+            chunks = self.iter_serialized_chunks()
+
+        for chunk in chunks:
+            writer.writerows(chunk)
+            self.rows_written += len(chunk)
+
+            if buffer.tell() >= self.csv_chunk_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+        yield buffer.getvalue()
+
+    def get_copy_expression(self, field: serializers.Field) -> Optional[Expression]:
+        """
+        Returns an expression for the field's CSV value, or None if it can
+        only be read from model instances
+        """
+        lookups = self.get_lookups([field])
+        if lookups is None:
+            return None
+
+        model = self.serializer_class.Meta.model
+        model_field = get_fields_from_path(model, lookups[0])[-1]
+        return get_copy_expression(field, model_field, lookups[0])
+
+    def get_copy_queryset(self) -> Optional[QuerySet]:
+        """
+        Returns the queryset's rows as a list of CSV values, or None if the
+        serializer's fields can't all be formatted by the database
+
+        Fields with sources on constant_relation are serialized once for
+        each related object, and picked by the related object's ID.
+        """
+        fields = self.serializer_class().fields
+        constant_fields = self.get_constant_fields(list(fields.values()))
+        constants = {}
+        if self.constant_relation:
+            constants = self.get_constants(constant_fields)
+
+        expressions = {}
+        for name, field in fields.items():
+            if field in constant_fields:
+                position = constant_fields.index(field)
+                expression = Case(
+                    *[
+                        When(
+                            **{f"{self.constant_relation}_id": pk},
+                            then=Value(str(values[position])),
+                        )
+                        for pk, values in constants.items()
+                    ],
+                    default=Value(NA),
+                    output_field=models.TextField(),
                 )
-                for field_name, field_value in row.items()
-            )
-            for row in serializer.data
+            else:
+                expression = self.get_copy_expression(field)
+                if expression is None:
+                    return None
+
+            # Prefixed so they don't clash with the model's fields
+            expressions[f"csv_{name}"] = expression
+
+        return (
+            self.get_export_queryset().annotate(**expressions).values_list(*expressions)
         )
 
+    def iter_copy_csv(self) -> Optional[Iterator[bytes]]:
+        """
+        Yields the CSV as it's written by the database with COPY, or returns
+        None if the serializer's fields can't all be formatted by the database
+
+        This gives the same CSV as iter_csv without handling each row in
+        Python, apart from counting them. COPY ends lines with LF, so those
+        outside of quoted values are replaced with the CRLF the csv module
+        uses.
+        """
+        queryset = self.get_copy_queryset()
+        if queryset is None:
+            return None
+
+        def iter_chunks() -> Iterator[bytes]:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(self.serializer_class.Meta.fields)
+            yield buffer.getvalue().encode()
+
+            sql, params = queryset.query.sql_with_params()
+            quoted = False
+
+            for chunk in iter_copy_to(sql, params, using=queryset.db):
+                # Every other part is inside quotes, which are escaped by
+                # doubling them
+                parts = chunk.split(b'"')
+                for i in range(1 if quoted else 0, len(parts), 2):
+                    self.rows_written += parts[i].count(b"\n")
+                    parts[i] = parts[i].replace(b"\n", b"\r\n")
+
+                if len(parts) % 2 == 0:
+                    quoted = not quoted
+
+                yield b'"'.join(parts)
+
+        return iter_chunks()
+
+    def iter_csv_bytes(self) -> Iterator[bytes]:
+        """Yields the encoded CSV, written with COPY when use_copy is set"""
+        chunks = None
+        if self.use_copy:
+            chunks = self.iter_copy_csv()
+
+        if chunks is None:
+            chunks = (chunk.encode() for chunk in self.iter_csv())
+
+        yield from chunks
+
+    def write(self, file: IO) -> None:
+        """Writes the CSV into the given file"""
+        for chunk in self.iter_csv():
+            file.write(chunk)
+
         file.seek(0)
 
 
 class DataExporter(Exporter):
+    constant_relation = "module"
+
+    def get_title(self) -> str:
+        return self.serializer_class.Meta.model.get_module_name()
+
+    def get_constant_objects(self) -> QuerySet:
+        module_model = self.serializer_class.Meta.model._meta.get_field(
+            "module"
+        ).related_model
+        return module_model.objects.filter(experiment=self.experiment).select_related(
+            "experiment"
+        )
+
     def get_filename(self, current_time: datetime) -> str:
         now = current_time.strftime("%Y%m%dT%H%M%SZ")
         return (
@@ -113,6 +715,7 @@ class FearConditioningDataSerializer(DataSerializer):
 
 class FearConditioningDataExporter(DataExporter):
     serializer_class = FearConditioningDataSerializer
+    use_copy = True
 
     def get_queryset(self) -> QuerySet[FearConditioningData]:
         return (
@@ -122,6 +725,176 @@ class FearConditioningDataExporter(DataExporter):
         )
 
 
+class FearConditioningRatingsExporter(Exporter):
+    """
+    Exports the fear conditioning ratings with one row per participant, and
+    a column for each trial of each stimulus of each module
+
+    The columns are laid out from the modules' phases, trials per stimulus
+    and generalisation stimuli. The database works out each rating's column,
+    and aggregates each participant's columns and ratings into arrays, which
+    are placed into rows without handling the trials one at a time.
+    """
+
+    use_values = False
+    columnar_export_class = PivotColumnarExport
+
+    def get_title(self) -> str:
+        return "Fear Conditioning Ratings"
+
+    def get_filename(self, current_time: datetime) -> str:
+        now = current_time.strftime("%Y%m%dT%H%M%SZ")
+        return f"{self.experiment.code}-{now}-fear-conditioning-ratings.csv"
+
+    def get_stimuli(self, module: FearConditioningModule) -> List[str]:
+        """
+        Returns the stimuli shown in the module, as they're normalised in the
+        data
+        """
+        stimuli = ["CS+", "CS-"]
+        if module.generalisation_stimuli_enabled:
+            # Generalisation stimuli are those the experiment has images for
+            stimuli.extend(
+                field_name.upper()
+                for field_name in ["gsa", "gsb", "gsc", "gsd"]
+                if getattr(self.experiment, field_name)
+            )
+        return stimuli
+
+    def get_column_groups(self) -> List[Tuple[str, FearConditioningModule, str]]:
+        """
+        Returns the name prefix, module and stimulus of each group of columns,
+        which has a column for each of the stimulus' trials in the module
+        """
+        modules = FearConditioningModule.objects.filter(experiment=self.experiment)
+        groups = []
+        phase_counts: Dict[str, int] = {}
+
+        for module in modules:
+            # Phases that are repeated are numbered from their second module
+            phase_counts[module.phase] = phase_counts.get(module.phase, 0) + 1
+            prefix = module.phase
+            if phase_counts[module.phase] > 1:
+                prefix += str(phase_counts[module.phase])
+
+            for stimulus in self.get_stimuli(module):
+                groups.append((f"{prefix}_{stimulus}", module, stimulus))
+
+        return groups
+
+    def get_fields(self) -> List[str]:
+        return [
+            "participant_id",
+            *(
+                f"{prefix}_{trial}"
+                for prefix, module, _ in self.get_column_groups()
+                for trial in range(1, module.trials_per_stimulus + 1)
+            ),
+        ]
+
+    def get_column_index(self) -> Expression:
+        """
+        Returns an expression for the index of each rating's column among the
+        ratings, which is null for trials outside of the layout
+        """
+        whens = []
+        offset = 0
+
+        for _, module, stimulus in self.get_column_groups():
+            whens.append(
+                When(
+                    Q(
+                        module=module,
+                        trial_by_stimulus__range=(1, module.trials_per_stimulus),
+                    )
+                    & (
+                        Q(normalised_stimulus=stimulus)
+                        | Q(normalised_stimulus="", stimulus=stimulus)
+                    ),
+                    then=F("trial_by_stimulus") + (offset - 1),
+                )
+            )
+            offset += module.trials_per_stimulus
+
+        if not whens:
+            # Typed, so the arrays of indexes are
+            return Cast(Value(None), output_field=models.IntegerField())
+        return Case(*whens, default=None, output_field=models.IntegerField())
+
+    def get_queryset(self) -> QuerySet[FearConditioningData]:
+        return FearConditioningData.objects.filter(module__experiment=self.experiment)
+
+    def get_export_queryset(self) -> QuerySet[FearConditioningData]:
+        """
+        Returns the data up to until, of the participants with data after
+        since, so incremental exports have all of their ratings so far
+        """
+        queryset = self.get_queryset()
+
+        if self.until is not None:
+            queryset = queryset.filter(pk__lte=self.until)
+        if self.since is not None:
+            queryset = queryset.filter(
+                participant__in=queryset.filter(pk__gt=self.since).values("participant")
+            )
+
+        return queryset
+
+    def get_state_aggregates(self) -> Dict[str, Aggregate]:
+        return {
+            "rows": Count("participant", distinct=True),
+            "data": Count("pk"),
+            "last_pk": Max("pk"),
+        }
+
+    def iter_rows(self) -> Iterator[List[Any]]:
+        """
+        Yields each participant's ID followed by their ratings, in the order
+        of the columns
+        """
+        column_count = len(self.get_fields()) - 1
+        in_layout = Q(column_index__isnull=False)
+        rows = self.iterate(
+            self.get_export_queryset()
+            .annotate(column_index=self.get_column_index())
+            .values("participant_id", "participant__participant_id")
+            .annotate(
+                column_indexes=ArrayAgg(
+                    "column_index", filter=in_layout, ordering="trial"
+                ),
+                ratings=ArrayAgg("rating", filter=in_layout, ordering="trial"),
+            )
+            .order_by("participant_id")
+            .values_list("participant__participant_id", "column_indexes", "ratings")
+        )
+
+        for participant_id, column_indexes, ratings in rows:
+            row = [None] * column_count
+            for index, rating in zip(column_indexes, ratings):
+                row[index] = rating
+            yield [participant_id, *row]
+
+    def iter_csv(self) -> Iterator[str]:
+        buffer = io.StringIO()
+
+        writer = csv.writer(buffer)
+        writer.writerow(self.get_fields())
+
+        rows = self.iter_rows()
+        while chunk := list(islice(rows, self.chunk_size)):
+            writer.writerows(
+                [NA if value is None else value for value in row] for row in chunk
+            )
+            self.rows_written += len(chunk)
+
+            if buffer.tell() >= self.csv_chunk_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+        yield buffer.getvalue()
+
+
 class AffectiveRatingDataSerializer(DataSerializer):
     class Meta:
         model = AffectiveRatingData
@@ -209,6 +982,30 @@ class CriterionDataSerializer(DataSerializer):
 
 class CriterionDataExporter(DataExporter):
     serializer_class = CriterionDataSerializer
+    use_copy = True
+    column_types = {"passed": "bool"}
+
+    def get_copy_expression(self, field: serializers.Field) -> Optional[Expression]:
+        if field.field_name == "question_id":
+            return csv_text("question_id")
+
+        if field.field_name == "passed":
+            # As CriterionData.passed
+            return Case(
+                When(
+                    Q(answer__isnull=True, question__required=False)
+                    | Q(
+                        question__correct_answer__isnull=False,
+                        answer=F("question__correct_answer"),
+                    )
+                    | Q(question__correct_answer__isnull=True, answer__isnull=False),
+                    then=Value("True"),
+                ),
+                default=Value("False"),
+                output_field=models.TextField(),
+            )
+
+        return super().get_copy_expression(field)
 
     def get_queryset(self) -> QuerySet[CriterionData]:
         return (
@@ -277,6 +1074,8 @@ class ParticipantSerializer(serializers.ModelSerializer):
     experiment_code = serializers.CharField(source="experiment.code")
     voucher = serializers.CharField(source="get_voucher_display")
     current_module = serializers.SerializerMethodField()
+    # Annotated by ParticipantExporter, in place of the property on the model
+    reinforced_stimulus = serializers.ReadOnlyField(source="first_reinforced_stimulus")
 
     class Meta:
         model = Participant
@@ -296,26 +1095,58 @@ class ParticipantSerializer(serializers.ModelSerializer):
         ]
 
     def get_current_module(self, obj: Participant) -> str:
-        if obj.current_module:
-            return obj.current_module.specific.get_module_title()
-
-        return ""
+        # The module may have been deleted since the participant's last update
+        return self.context.get("module_titles", {}).get(obj.current_module_id, "")
 
 
 class ParticipantExporter(Exporter):
     serializer_class = ParticipantSerializer
+    # Participants are updated as they progress and claim vouchers
+    cursor_field = "udpated_at"
 
     def get_filename(self, current_time: datetime) -> str:
         now = current_time.strftime("%Y%m%dT%H%M%SZ")
         return f"{self.experiment.code}-{now}-participants.csv"
 
     def get_queryset(self) -> QuerySet[Participant]:
+        # The reinforced stimulus of each participant's first trial
+        first_trials = FearConditioningData.objects.filter(
+            participant=OuterRef("pk")
+        ).order_by("pk")
+
         return (
             Participant.objects.filter(experiment=self.experiment)
             .order_by("pk")
-            .select_related("voucher", "current_module", "experiment")
+            .select_related("voucher", "experiment")
+            .annotate(
+                first_reinforced_stimulus=Subquery(
+                    first_trials.values("reinforced_stimulus")[:1]
+                )
+            )
         )
 
+    def get_serializer_context(self) -> Dict[str, Any]:
+        modules = list(self.experiment.modules.select_subclasses())  # type: ignore
+        # Break ends are titled after their start modules
+        prefetch_related_objects(
+            [module for module in modules if isinstance(module, BreakEndModule)],
+            "start_module",
+        )
+
+        return {
+            "module_titles": {
+                module.pk: module.get_module_title() for module in modules
+            }
+        }
+
+    def get_state_aggregates(self) -> Dict[str, Aggregate]:
+        return {
+            "rows": Count("pk"),
+            "last_pk": Max("pk"),
+            "last_updated_at": Max("udpated_at"),
+            "vouchers": Count("voucher"),
+        }
+
 
 class CompletedParticipantIDsSerializer(serializers.ModelSerializer):
     class Meta:
@@ -327,6 +1158,10 @@ class CompletedParticipantIDsSerializer(serializers.ModelSerializer):
 
 class CompletedParticipantIDsExporter(Exporter):
     serializer_class = CompletedParticipantIDsSerializer
+    cursor_field = "finished_at"
+
+    def get_title(self) -> str:
+        return "Completed Participant IDs"
 
     def get_filename(self, current_time: datetime) -> str:
         now = current_time.strftime("%Y%m%dT%H%M%SZ")
@@ -338,11 +1173,82 @@ class CompletedParticipantIDsExporter(Exporter):
         ).order_by("pk")
 
 
+class ZipStream:
+    """
+    A file that ZipFile can write to without seeking, whose contents are
+    taken as they're written
+    """
+
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def pop(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+class ArchiveZipFile(zipfile.ZipFile):
+    """
+    A ZipFile that members compressed elsewhere can be copied into
+
+    ZipFile can't add compressed data, so members are written like
+    ZipFile.open writes them, using its private state: _writing, which stops
+    members being written at the same time, _didModify, which makes close
+    write the central directory, and _writecheck, which validates members.
+    The central directory is written from filelist, NameToInfo and start_dir,
+    and members are written at the position of fp, which ZipFile wraps to
+    count what's written when it can't tell. This was checked against CPython
+    3.8 to 3.12. ArchiveZipFileTest fails if any of these change.
+    """
+
+    # Private state of ZipFile this depends on
+    private_attributes = ("_writing", "_didModify", "_writecheck", "start_dir")
+
+    def iter_write_compressed(
+        self, info: zipfile.ZipInfo, file: IO, chunk_size: int
+    ) -> Iterator[None]:
+        """
+        Copies a member's compressed data from the file, whose compression,
+        CRC and sizes are set on info, yielding after each chunk
+        """
+        if self._writing:  # type: ignore
+            raise ValueError("Can't add a member while another is being written")
+
+        # The sizes are known, so they're in the header rather than a data
+        # descriptor after the data. It has ZIP64 fields if they need them
+        info.flag_bits &= ~0x08
+        info.header_offset = self.fp.tell()  # type: ignore
+        self._writecheck(info)  # type: ignore
+        self._didModify = True  # type: ignore
+        self._writing = True  # type: ignore
+
+        try:
+            self.fp.write(info.FileHeader())  # type: ignore
+            while data := file.read(chunk_size):
+                self.fp.write(data)  # type: ignore
+                yield
+        finally:
+            self._writing = False  # type: ignore
+
+        self.filelist.append(info)
+        self.NameToInfo[info.filename] = info
+        self.start_dir = self.fp.tell()  # type: ignore
+
+
 class ZipExporter:
     exporters: List[Type[Exporter]] = [
         AffectiveRatingDataExporter,
         BasicInfoDataExporter,
         FearConditioningDataExporter,
+        FearConditioningRatingsExporter,
         CriterionDataExporter,
         ContingencyAwarenessDataExporter,
         VolumeCalibrationDataExporter,
@@ -350,27 +1256,280 @@ class ZipExporter:
         CompletedParticipantIDsExporter,
         PostExperimentQuestionsDataExporter,
         USUnpleasantnessDataExporter,
-        VolumeCalibrationDataExporter,
     ]
 
-    def __init__(self, experiment: Experiment):
+    # How often progress is read from the workers of parallel exports, in
+    # seconds
+    progress_interval = 1
+
+    def __init__(
+        self,
+        experiment: Experiment,
+        parallelism: Optional[int] = None,
+        since: Optional[Dict[str, Any]] = None,
+        until: Optional[Dict[str, Any]] = None,
+        file_format: str = "csv",
+    ):
         self.experiment = experiment
         self.now = timezone.now()
+        # Format of the archive's files, which are either CSVs, or Parquet
+        # files with typed columns. See flare_portal.experiments.columnar
+        self.file_format = file_format
+        # Incremental exports only include the rows after the positions in
+        # since, up to the ones in until. See get_positions
+        self.since = since
+        self.until = until
+        self.csv_exporters = [
+            exporter_class(
+                experiment,
+                since=(since or {}).get(exporter_class.__name__),
+                until=(until or {}).get(exporter_class.__name__),
+            )
+            for exporter_class in self.exporters
+        ]
+        self.states: List[Dict[str, Any]] = []
+        # Number of CSVs generated at once, each in its own process
+        self.parallelism = (
+            settings.EXPORT_PARALLELISM if parallelism is None else parallelism
+        )
+
+    @property
+    def is_incremental(self) -> bool:
+        return self.since is not None
 
     def get_filename(self) -> str:
         now = self.now.strftime("%Y%m%dT%H%M%SZ")
+        if self.is_incremental:
+            return f"{self.experiment.code}-{now}-incremental.zip"
         return f"{self.experiment.code}-{now}.zip"
 
-    def write(self, content: IO) -> str:
-        with zipfile.ZipFile(
-            content, mode="w", compression=zipfile.ZIP_DEFLATED
+    def get_positions(self) -> Dict[str, Any]:
+        """
+        Returns the current position of each CSV, which incremental exports
+        can be made since or up to
+
+        Primary keys are assigned before rows are committed, so rows with
+        smaller ones than a position can still be being saved. Once the
+        positions are read, this waits up to EXPORT_CURSOR_LAG seconds for the
+        transactions in progress to finish, so exports up to the positions
+        include those rows.
+        """
+        positions = {
+            type(exporter).__name__: exporter.get_position()
+            for exporter in self.csv_exporters
+        }
+
+        if not wait_for_transactions(settings.EXPORT_CURSOR_LAG):
+            logger.warning(
+                "Transactions in progress when reading the export positions of "
+                "experiment %s didn't finish, so their rows may be missed",
+                self.experiment.pk,
+            )
+
+        return positions
+
+    def get_fingerprint(self) -> str:
+        """
+        Returns a hash that changes whenever the contents of the archive
+        would, apart from the timestamps in its file names
+
+        The experiment's config version covers changes to the experiment and
+        its modules. It's read along with the state of each file, in one
+        query.
+        """
+        states = {
+            f"state_{index}": exporter.get_state_subquery()
+            for index, exporter in enumerate(self.csv_exporters)
+        }
+        config_version, *self.states = (
+            Experiment.objects.filter(pk=self.experiment.pk)
+            .annotate(**states)
+            .values_list("config_version", *states)
+            .get()
+        )
+        fingerprint = {
+            "config_version": config_version,
+            "since": self.since,
+            "until": self.until,
+            "file_format": self.file_format,
+            "files": [
+                {
+                    "exporter": type(exporter).__name__,
+                    "fields": exporter.get_fields(),
+                    **state,
+                }
+                for exporter, state in zip(self.csv_exporters, self.states)
+            ],
+        }
+
+        return hashlib.sha256(
+            json.dumps(fingerprint, cls=DjangoJSONEncoder, sort_keys=True).encode()
+        ).hexdigest()
+
+    def get_progress(self) -> List[Dict[str, Any]]:
+        """
+        Returns the number of rows written out of the total for each file,
+        once get_fingerprint has counted them
+        """
+        return [
+            {
+                "title": exporter.get_title(),
+                "rows": state["rows"],
+                "rows_written": exporter.rows_written,
+            }
+            for exporter, state in zip(self.csv_exporters, self.states)
+        ]
+
+    def get_zip_info(self, exporter: Exporter) -> zipfile.ZipInfo:
+        filename = exporter.get_filename(self.now)
+        if self.file_format == "parquet":
+            # Parquet files are already compressed
+            filename = f"{os.path.splitext(filename)[0]}.parquet"
+
+        info = zipfile.ZipInfo(filename, date_time=self.now.timetuple()[:6])
+        info.compress_type = (
+            zipfile.ZIP_STORED
+            if self.file_format == "parquet"
+            else zipfile.ZIP_DEFLATED
+        )
+        info.external_attr = 0o600 << 16
+        return info
+
+    def iter_zip(self) -> Iterator[bytes]:
+        """
+        Yields the archive as it's written, so it can be streamed while the
+        CSVs are generated
+
+        Only a chunk of each CSV is held in memory at a time. As the sizes of
+        the CSVs aren't known in advance, they're written with ZIP64 headers.
+        """
+        stream = ZipStream()
+
+        with ArchiveZipFile(
+            stream, mode="w", compression=zipfile.ZIP_DEFLATED
         ) as archive_file:
-            for exporter_class in self.exporters:
-                with tempfile.NamedTemporaryFile(mode="w") as csv_export:
-                    exporter = exporter_class(self.experiment)
-                    exporter.write(csv_export)
-                    archive_file.write(
-                        csv_export.name, arcname=exporter.get_filename(self.now)
-                    )
+            if self.parallelism > 1:
+                yield from self.iter_parallel_zip(archive_file, stream)
+            else:
+                for exporter in self.csv_exporters:
+                    with archive_file.open(
+                        self.get_zip_info(exporter), mode="w", force_zip64=True
+                    ) as file:
+                        if self.file_format == "parquet":
+                            yield from self.iter_parquet(exporter, file, stream)
+                        else:
+                            for chunk in exporter.iter_csv_bytes():
+                                file.write(chunk)
+                                if data := stream.pop():
+                                    yield data
+
+        if data := stream.pop():
+            yield data
+
+    def iter_parquet(
+        self, exporter: Exporter, file: IO, stream: ZipStream
+    ) -> Iterator[bytes]:
+        """Writes the exporter's rows into the file as Parquet, a batch at a time"""
+        export = exporter.columnar_export_class(exporter)
+
+        with export.get_parquet_writer(file) as writer:
+            for batch in export.iter_batches():
+                writer.write_batch(batch)
+                if data := stream.pop():
+                    yield data
+
+    def iter_parallel_zip(
+        self, archive_file: ArchiveZipFile, stream: ZipStream
+    ) -> Iterator[bytes]:
+        """
+        Generates and compresses the files in worker processes, with their
+        own database connections, and adds them to the archive in order
+
+        The largest files are started first, going by the row counts of
+        get_fingerprint. Empty chunks are yielded while waiting for workers,
+        so the progress can be saved.
+        """
+        context = multiprocessing.get_context("spawn")
+        progress = context.Array("q", len(self.csv_exporters))
+        database_names = {
+            alias: connections[alias].settings_dict["NAME"] for alias in connections
+        }
+        order = sorted(
+            range(len(self.csv_exporters)),
+            key=lambda index: -self.states[index]["rows"] if self.states else 0,
+        )
+
+        with ProcessPoolExecutor(
+            max_workers=min(self.parallelism, len(self.csv_exporters)),
+            mp_context=context,
+            initializer=init_worker,
+            initargs=(database_names, progress),
+        ) as executor:
+            futures: Dict[int, Future] = {
+                index: executor.submit(
+                    write_member,
+                    type(self.csv_exporters[index]),
+                    self.experiment.pk,
+                    index,
+                    file_format=self.file_format,
+                    since=self.csv_exporters[index].since,
+                    until=self.csv_exporters[index].until,
+                )
+                for index in order
+            }
+
+            try:
+                for index, exporter in enumerate(self.csv_exporters):
+                    future = futures.pop(index)
+
+                    while not wait([future], timeout=self.progress_interval).done:
+                        for other, other_exporter in enumerate(self.csv_exporters):
+                            other_exporter.rows_written = progress[other]
+                        yield b""
+
+                    member = future.result()
+                    exporter.rows_written = progress[index]
+                    try:
+                        yield from self.iter_member(
+                            archive_file, stream, exporter, member
+                        )
+                    finally:
+                        os.remove(member.path)
+            finally:
+                # Executor.shutdown only cancels futures itself from Python 3.9
+                for future in futures.values():
+                    future.cancel()
+                executor.shutdown(wait=True)
+                for future in futures.values():
+                    if (
+                        future.done()
+                        and not future.cancelled()
+                        and future.exception() is None
+                    ):
+                        os.remove(future.result().path)
+
+    def iter_member(
+        self,
+        archive_file: ArchiveZipFile,
+        stream: ZipStream,
+        exporter: Exporter,
+        member: ArchiveMember,
+    ) -> Iterator[bytes]:
+        """Adds a file written by a worker to the archive, as it's copied"""
+        info = self.get_zip_info(exporter)
+        info.compress_type = member.compress_type
+        info.CRC = member.crc
+        info.file_size = member.file_size
+        info.compress_size = member.compress_size
+
+        with open(member.path, "rb") as file:
+            for _ in archive_file.iter_write_compressed(
+                info, file, Exporter.csv_chunk_size
+            ):
+                yield stream.pop()
+
+    def write(self, content: IO) -> str:
+        for data in self.iter_zip():
+            content.write(data)
 
         return self.get_filename()
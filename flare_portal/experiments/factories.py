@@ -37,7 +37,7 @@ class ExperimentFactory(factory.django.DjangoModelFactory):
 
     name = factory.Sequence(lambda n: f"experiment{n}")
     description = factory.Faker("paragraph")
-    code = factory.Sequence(lambda n: f"CODE{n:02}")
+    code = factory.Sequence(lambda n: f"C{n:05}")
     owner = factory.SubFactory(UserFactory)
     project = factory.SubFactory(ProjectFactory)
     trial_length = 10.0
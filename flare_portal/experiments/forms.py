@@ -21,6 +21,7 @@ from .models import (
     Participant,
     Project,
 )
+from .participants import invalidate_participant_ids
 
 
 class ExperimentForm(forms.ModelForm):
@@ -122,6 +123,7 @@ class ParticipantBatchForm(forms.Form):
             )
             for n in range(self.cleaned_data["participant_count"])
         )
+        invalidate_participant_ids()
 
 
 class ParticipantUploadForm(forms.Form):
@@ -178,6 +180,7 @@ class ParticipantUploadForm(forms.Form):
             )
             for pid in self.cleaned_data["pids"]
         )
+        invalidate_participant_ids()
 
         # Return objects create and how many rows in file
         return participants, self.cleaned_data["row_count"]
@@ -0,0 +1,194 @@
+import hashlib
+import io
+import time
+import zlib
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+from typing import Any, Iterator, Tuple, Type
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import transaction
+from django.utils import timezone
+
+from flare_portal.experiments import columnar
+from flare_portal.experiments.exports import (
+    Exporter,
+    FearConditioningDataExporter,
+    FearConditioningRatingsExporter,
+)
+from flare_portal.experiments.models import (
+    Experiment,
+    FearConditioningData,
+    FearConditioningModule,
+    Participant,
+    Project,
+)
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the speed of exporting fear conditioning data with the "
+        "serializer, with values_list and with COPY, and checks the CSVs are "
+        "identical, then as Parquet if pyarrow is installed, and pivoted with "
+        "a row per participant. Sizes are as stored in the archive. The "
+        "experiment used is created in a transaction that's rolled back."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--participants", type=int, default=1000)
+        parser.add_argument(
+            "--trials",
+            type=int,
+            default=1000,
+            help="Number of trials for each participant",
+        )
+
+    def handle(
+        self, *args: Any, participants: int, trials: int, **options: Any
+    ) -> None:
+        with transaction.atomic():
+            experiment = self.create_experiment(participants, trials)
+            rows = participants * trials
+
+            self.stdout.write(f"{'':12} {'seconds':>8} {'rows/s':>8} {'MB':>8}  sha256")
+
+            hashes = set()
+            for name, use_values, use_copy in [
+                ("serializer", False, False),
+                ("values", True, False),
+                ("copy", True, True),
+            ]:
+                exporter_class: Type[Exporter] = type(
+                    "BenchmarkExporter",
+                    (FearConditioningDataExporter,),
+                    {"use_values": use_values, "use_copy": use_copy},
+                )
+                duration, size, csv_hash = self.export(exporter_class(experiment))
+                hashes.add(csv_hash)
+
+                self.stdout.write(
+                    f"{name:12} {duration:>8.1f} {rows / duration:>8.0f} "
+                    f"{size / 1e6:>8.1f}  {csv_hash[:16]}"
+                )
+
+            if len(hashes) > 1:
+                self.stderr.write("The CSVs are different")
+
+            if columnar.pyarrow is not None:
+                duration, size = self.export_parquet(
+                    FearConditioningDataExporter(experiment)
+                )
+                self.stdout.write(
+                    f"{'parquet':12} {duration:>8.1f} {rows / duration:>8.0f} "
+                    f"{size / 1e6:>8.1f}"
+                )
+
+            duration, size, _ = self.export(FearConditioningRatingsExporter(experiment))
+            self.stdout.write(
+                f"{'wide':12} {duration:>8.1f} {rows / duration:>8.0f} "
+                f"{size / 1e6:>8.1f}"
+            )
+
+            transaction.set_rollback(True)
+
+    def export(self, exporter: Exporter) -> Tuple[float, int, str]:
+        sha256 = hashlib.sha256()
+        # Compressed as ZipExporter does
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        size = 0
+        start = time.perf_counter()
+
+        for chunk in exporter.iter_csv_bytes():
+            sha256.update(chunk)
+            size += len(compressor.compress(chunk))
+        size += len(compressor.flush())
+
+        return time.perf_counter() - start, size, sha256.hexdigest()
+
+    def export_parquet(self, exporter: Exporter) -> Tuple[float, int]:
+        file = io.BytesIO()
+        start = time.perf_counter()
+
+        export = columnar.ColumnarExport(exporter)
+        with export.get_parquet_writer(file) as writer:
+            for batch in export.iter_batches():
+                writer.write_batch(batch)
+
+        return time.perf_counter() - start, file.tell()
+
+    def create_experiment(self, participant_count: int, trials: int) -> Experiment:
+        self.stdout.write(
+            f"Creating {participant_count} participants with {trials} trials each"
+        )
+
+        user = User.objects.create(username="benchmark-exports")
+        project = Project.objects.create(name="Benchmark", owner=user)
+        experiment = Experiment.objects.create(
+            name="Benchmark",
+            code="BENCHX",
+            owner=user,
+            project=project,
+            trial_length=1,
+        )
+        # Trials are split between the phases, as they would be
+        phases = ["habituation", "acquisition", "extinction"]
+        modules = [
+            FearConditioningModule.objects.create(
+                experiment=experiment,
+                phase=phase,
+                trials_per_stimulus=trials // len(phases) // 2 + 1,
+                reinforcement_rate=6,
+            )
+            for phase in phases
+        ]
+
+        trial_modules = [
+            modules[trial * len(modules) // trials] for trial in range(trials)
+        ]
+        # Each stimulus' trials are numbered from 1 in each module
+        trials_by_stimulus = [
+            (trial - trial_modules.index(module)) // 2 + 1
+            for trial, module in enumerate(trial_modules)
+        ]
+
+        participants = Participant.objects.bulk_create(
+            Participant(participant_id=f"BENCHX.{i}", experiment=experiment)
+            for i in range(participant_count)
+        )
+
+        def iter_data() -> Iterator[FearConditioningData]:
+            started_at = timezone.now()
+
+            for participant in participants:
+                for trial in range(trials):
+                    yield FearConditioningData(
+                        participant=participant,
+                        module=trial_modules[trial],
+                        trial=trial,
+                        trial_by_stimulus=trials_by_stimulus[trial],
+                        rating=trial % 10 if trial % 7 else None,
+                        stimulus="CSA" if trial % 2 else "CSB",
+                        normalised_stimulus="CS+" if trial % 2 else "CS-",
+                        reinforced_stimulus="CS+",
+                        unconditional_stimulus=trial % 4 == 1,
+                        trial_started_at=started_at + timedelta(seconds=trial * 8),
+                        response_recorded_at=(
+                            started_at + timedelta(seconds=trial * 8 + 3)
+                            if trial % 7
+                            else None
+                        ),
+                        volume_level=Decimal("0.75"),
+                        calibrated_volume_level=Decimal("0.50"),
+                        headphones=True,
+                    )
+
+        # In batches, as bulk_create makes a list of all of the objects
+        data = iter_data()
+        while batch := list(islice(data, 10000)):
+            FearConditioningData.objects.bulk_create(batch)
+
+        return experiment
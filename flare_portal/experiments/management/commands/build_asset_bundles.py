@@ -0,0 +1,23 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from flare_portal.experiments.assets import build_asset_bundle
+from flare_portal.experiments.models import Experiment
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the asset bundles that are missing or out of date, and deletes "
+        "replaced bundles once their grace period has passed"
+    )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        count = 0
+
+        for experiment in Experiment.objects.iterator():
+            previous_bundle = experiment.asset_bundle.name
+            build_asset_bundle(experiment)
+            count += experiment.asset_bundle.name != previous_bundle
+
+        self.stdout.write(f"Built {count} asset bundles")
@@ -0,0 +1,13 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from flare_portal.experiments.tracking import flush_tracking_buffer
+
+
+class Command(BaseCommand):
+    help = "Writes buffered participant progress updates to the database"
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        count = flush_tracking_buffer()
+        self.stdout.write(f"Updated {count} participants")
@@ -0,0 +1,57 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import close_old_connections
+
+from flare_portal.experiments.assets import build_outdated_asset_bundles
+from flare_portal.experiments.export_jobs import (
+    delete_replaced_export_jobs,
+    run_export_jobs,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds queued data exports and out of date asset bundles, checking for "
+        "new ones every few seconds"
+    )
+
+    # How often archives that were replaced are checked for deletion, in
+    # seconds. Archives are also deleted when a newer export of the same
+    # experiment is built.
+    sweep_interval = 60
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Number of seconds to wait between checks for new exports",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Exit once there are no queued exports left",
+        )
+
+    def handle(self, *args: Any, interval: float, burst: bool, **options: Any) -> None:
+        next_sweep_at = 0.0
+
+        while True:
+            if count := run_export_jobs():
+                self.stdout.write(f"Built {count} exports")
+
+            if count := build_outdated_asset_bundles():
+                self.stdout.write(f"Built {count} asset bundles")
+
+            if time.monotonic() >= next_sweep_at:
+                delete_replaced_export_jobs()
+                next_sweep_at = time.monotonic() + self.sweep_interval
+
+            if burst:
+                return
+
+            time.sleep(interval)
+            # As between requests, so lost connections are replaced
+            close_old_connections()
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-17 07:51
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0062_rename_was_alone_field'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='experiment',
+            name='config_version',
+            field=models.UUIDField(default=uuid.uuid4, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 08:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0063_experiment_config_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='experiment',
+            name='asset_hashes',
+            field=models.JSONField(default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-17 08:03
+
+from django.db import migrations, models
+import flare_portal.experiments.models.core
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0064_experiment_asset_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='experiment',
+            name='asset_bundle',
+            field=models.FileField(blank=True, editable=False, upload_to=flare_portal.experiments.models.core.experiment_asset_bundle_path),
+        ),
+    ]
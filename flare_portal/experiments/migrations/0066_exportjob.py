@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-17 08:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import flare_portal.experiments.models.exports
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('experiments', '0065_experiment_asset_bundle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('finished', 'Finished'), ('failed', 'Failed')], default='queued', max_length=8)),
+                ('fingerprint', models.CharField(blank=True, max_length=64)),
+                ('progress', models.JSONField(default=list)),
+                ('archive', models.FileField(blank=True, upload_to=flare_portal.experiments.models.exports.export_job_archive_path)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('started_at', models.DateTimeField(null=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('experiment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to='experiments.experiment')),
+                ('requested_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='exportjob',
+            index=models.Index(condition=models.Q(('status__in', ['queued', 'running'])), fields=['created_at'], name='exportjob_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 09:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('experiments', '0067_exportcursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='file_format',
+            field=models.CharField(choices=[('csv', 'CSV'), ('parquet', 'Parquet')], default='csv', max_length=8),
+        ),
+    ]
@@ -10,6 +10,7 @@ from .data import (
     USUnpleasantnessData,
     VolumeCalibrationData,
 )
+from .exports import ExportCursor, ExportJob
 from .modules import (
     AffectiveRatingModule,
     BaseModule,
@@ -44,6 +45,8 @@ __all__ = [
     "ContingencyAwarenessData",
     "ContingencyAwarenessModule",
     "Experiment",
+    "ExportCursor",
+    "ExportJob",
     "FearConditioningData",
     "FearConditioningModule",
     "InstructionsModule",
@@ -1,5 +1,7 @@
+import hashlib
 import string
-from typing import Any, List, Tuple
+import uuid
+from typing import Any, Dict, List, Tuple
 
 from django.contrib.auth import get_user_model
 from django.core import validators
@@ -11,6 +13,7 @@ from django.core.validators import (
 )
 from django.db import models
 from django.db.models import Q, QuerySet
+from django.db.models.fields.files import FieldFile
 from django.urls import reverse
 from django.utils.text import camel_case_to_spaces, slugify
 
@@ -43,7 +46,24 @@ def experiment_assets_path(instance: "Experiment", filename: str) -> str:
     return f"experiment_assets/{instance.pk}/{filename}"
 
 
+def experiment_asset_bundle_path(instance: "Experiment", filename: str) -> str:
+    return f"experiment_assets/{instance.pk}/bundles/{filename}"
+
+
 class Experiment(models.Model):
+    ASSET_FIELDS = (
+        "us",
+        "csa",
+        "csb",
+        "context_a",
+        "context_b",
+        "context_c",
+        "gsa",
+        "gsb",
+        "gsc",
+        "gsd",
+    )
+
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     contact_email = models.EmailField(blank=True)
@@ -148,6 +168,18 @@ class Experiment(models.Model):
         validators=[FileExtensionValidator(["png"])],
     )
 
+    # SHA-256 hashes of the asset files, keyed by field name. See
+    # update_asset_hashes
+    asset_hashes = models.JSONField(default=dict, editable=False)
+    # Zip archive of all the assets. See flare_portal.experiments.assets
+    asset_bundle = models.FileField(
+        upload_to=experiment_asset_bundle_path, blank=True, editable=False
+    )
+
+    # Changes whenever anything included in the configuration API payload
+    # changes. See flare_portal.experiments.signals
+    config_version = models.UUIDField(default=uuid.uuid4, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -173,6 +205,40 @@ class Experiment(models.Model):
         if validation_errors:
             raise ValidationError(validation_errors)
 
+    def get_assets(self) -> Dict[str, FieldFile]:
+        """
+        Returns the asset files that have been uploaded, keyed by field name
+        """
+        return {
+            field_name: getattr(self, field_name)
+            for field_name in self.ASSET_FIELDS
+            if getattr(self, field_name)
+        }
+
+    def update_asset_hashes(self) -> bool:
+        """
+        Hashes the assets that have changed since they were last hashed
+
+        Returns whether asset_hashes has changed. The new hashes are not saved.
+        """
+        asset_hashes = {}
+
+        for field_name, field_file in self.get_assets().items():
+            asset_hash = self.asset_hashes.get(field_name)
+
+            if not asset_hash or asset_hash["name"] != field_file.name:
+                sha256 = hashlib.sha256()
+                with field_file.storage.open(field_file.name, "rb") as f:
+                    for chunk in f.chunks():
+                        sha256.update(chunk)
+                asset_hash = {"name": field_file.name, "sha256": sha256.hexdigest()}
+
+            asset_hashes[field_name] = asset_hash
+
+        changed = asset_hashes != self.asset_hashes
+        self.asset_hashes = asset_hashes
+        return changed
+
     def __str__(self) -> str:
         return self.name
 
@@ -267,7 +267,7 @@ class CriterionData(BaseData):
         unique_together = ("participant", "question")
 
     def clean(self) -> None:
-        if self.question.module != self.module:  # type: ignore
+        if self.question.module_id != self.module_id:  # type: ignore
             raise ValidationError(
                 {"question": "This question does not belong to that module."}
             )
@@ -0,0 +1,129 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.db import models
+
+from model_utils import Choices
+
+User = get_user_model()
+
+
+def export_job_archive_path(instance: "ExportJob", filename: str) -> str:
+    return f"exports/{instance.experiment_id}/{instance.pk}/{filename}"
+
+
+class ExportCursor(models.Model):
+    """
+    How far a researcher's incremental exports of an experiment have got,
+    so the next one only includes data added or changed since
+    """
+
+    experiment = models.ForeignKey(
+        "experiments.Experiment",
+        on_delete=models.CASCADE,
+        related_name="export_cursors",
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    # The last position exported of each CSV, by exporter. See
+    # ZipExporter.get_positions
+    positions = models.JSONField(default=dict)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("experiment", "user")
+
+    def __str__(self) -> str:
+        return f"Export cursor of {self.user} for {self.experiment}"
+
+
+class ExportJob(models.Model):
+    """
+    A data export of an experiment, built in the background by the
+    run_export_jobs command. See flare_portal.experiments.export_jobs
+    """
+
+    STATUS = Choices(
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("finished", "Finished"),
+        ("failed", "Failed"),
+    )
+
+    FILE_FORMATS = Choices(
+        ("csv", "CSV"),
+        ("parquet", "Parquet"),
+    )
+
+    experiment = models.ForeignKey(
+        "experiments.Experiment", on_delete=models.CASCADE, related_name="export_jobs"
+    )
+    requested_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, related_name="+", null=True
+    )
+    status = models.CharField(max_length=8, choices=STATUS, default=STATUS.queued)
+    file_format = models.CharField(
+        max_length=8, choices=FILE_FORMATS, default=FILE_FORMATS.csv
+    )
+    # Set for incremental exports, which only include the data after the
+    # cursor's positions, and move the cursor on as they start
+    cursor = models.ForeignKey(
+        ExportCursor,
+        on_delete=models.CASCADE,
+        related_name="export_jobs",
+        null=True,
+        blank=True,
+    )
+    # The positions exported after and up to by incremental exports
+    since = models.JSONField(null=True, blank=True)
+    until = models.JSONField(null=True, blank=True)
+
+    # Changes whenever the exported data does. See ZipExporter.get_fingerprint
+    fingerprint = models.CharField(max_length=64, blank=True)
+    # Rows written out of the total for each file in the archive
+    progress = models.JSONField(default=list)
+    archive = models.FileField(upload_to=export_job_archive_path, blank=True)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Also updated as progress is made, so jobs whose worker has stopped can
+    # be picked up again
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            # Used by workers to find the next job
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(status__in=["queued", "running"]),
+                name="exportjob_pending_idx",
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"Export of {self.experiment} ({self.get_status_display()})"
+
+    @property
+    def is_incremental(self) -> bool:
+        return self.cursor_id is not None
+
+    @property
+    def is_pending(self) -> bool:
+        return self.status in (self.STATUS.queued, self.STATUS.running)
+
+    def get_archive_filename(self) -> str:
+        return os.path.basename(self.archive.name)
+
+    def get_percent_complete(self) -> int:
+        rows = sum(item["rows"] for item in self.progress)
+        rows_written = sum(item["rows_written"] for item in self.progress)
+
+        if self.status == self.STATUS.finished:
+            return 100
+        if not rows:
+            return 0
+
+        return min(rows_written * 100 // rows, 100)
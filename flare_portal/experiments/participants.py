@@ -0,0 +1,227 @@
+"""
+Lookups of participants by participant ID
+
+Participant IDs are typed in by participants, so the API gets a lot of
+mistyped and guessed ones. Each process keeps a Bloom filter of the valid IDs
+to reject unknown ones without querying the database. The filter is rebuilt
+when its version, which is kept in the cache and changed whenever participant
+IDs are added or changed, no longer matches. It's also rebuilt every
+API_PARTICIPANT_FILTER_MAX_AGE seconds, to drop the IDs of deleted
+participants.
+
+Participants that send data are also cached in each process for
+API_PARTICIPANT_CACHE_TIMEOUT seconds, as they're looked up for every trial.
+"""
+import copy
+import hashlib
+import math
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from flare_portal.utils.cache import LocalCache
+
+from .models import Participant
+
+VERSION_CACHE_KEY = "participants:id-filter-version"
+
+_participant_filter: Optional["ParticipantIDFilter"] = None
+_participant_filter_lock = threading.Lock()
+_participant_cache = LocalCache("API_PARTICIPANT_CACHE_SIZE")
+
+
+class BloomFilter:
+    """
+    A set of strings that can have false positives, but no false negatives,
+    and takes up about 10 bits per string for a 1% error rate
+    """
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        capacity = max(capacity, 1)
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray(math.ceil(self.size / 8))
+
+    def get_positions(self, value: str) -> Iterator[int]:
+        # Uses double hashing to derive the positions from a single hash
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+
+        for i in range(self.hash_count):
+            yield (first + i * second) % self.size
+
+    def add(self, value: str) -> None:
+        for position in self.get_positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self.get_positions(value)
+        )
+
+
+class ParticipantIDFilter:
+    def __init__(self, version: str) -> None:
+        self.version = version
+        self.expires_at = time.monotonic() + settings.API_PARTICIPANT_FILTER_MAX_AGE
+
+        participant_ids = Participant.objects.values_list("participant_id", flat=True)
+        self.bloom_filter = BloomFilter(
+            participant_ids.count(), settings.API_PARTICIPANT_FILTER_ERROR_RATE
+        )
+        for participant_id in participant_ids.iterator(chunk_size=10000):
+            self.bloom_filter.add(participant_id)
+
+    def is_expired(self) -> bool:
+        return self.expires_at <= time.monotonic()
+
+    def __contains__(self, participant_id: str) -> bool:
+        return participant_id in self.bloom_filter
+
+
+def get_participant_ids_version() -> str:
+    version = cache.get(VERSION_CACHE_KEY)
+
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_CACHE_KEY)
+
+    return version
+
+
+def invalidate_participant_ids() -> None:
+    """
+    Makes processes rebuild their filters, when participant IDs have been
+    added or changed
+
+    The version is changed straight away, so the transaction's own process
+    sees the new IDs, and again on commit, so other processes don't keep
+    filters built before the new IDs were visible to them.
+    """
+
+    def set_version() -> None:
+        cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+    set_version()
+    transaction.on_commit(set_version)
+
+
+def participant_id_may_exist(participant_id: str) -> bool:
+    """
+    Returns False if there's no participant with the ID, and True if there
+    may be
+
+    Only unknown IDs cost a cache lookup, to check the filter is up to date.
+    Always returns True if API_PARTICIPANT_FILTER isn't set.
+    """
+    global _participant_filter
+
+    if not settings.API_PARTICIPANT_FILTER:
+        return True
+
+    participant_filter = _participant_filter
+    if (
+        participant_filter is not None
+        and not participant_filter.is_expired()
+        and participant_id in participant_filter
+    ):
+        return True
+
+    version = get_participant_ids_version()
+
+    if (
+        participant_filter is None
+        or participant_filter.is_expired()
+        or participant_filter.version != version
+    ):
+        with _participant_filter_lock:
+            # Another thread may have rebuilt it while this one waited
+            if _participant_filter is participant_filter:
+                _participant_filter = ParticipantIDFilter(version)
+            participant_filter = _participant_filter
+
+    return participant_id in participant_filter  # type: ignore
+
+
+def get_participants(participant_ids: Iterable[str]) -> Dict[str, Participant]:
+    """
+    Returns the participants with the IDs, along with their experiments, keyed
+    by participant ID
+
+    Participants are cached for API_PARTICIPANT_CACHE_TIMEOUT seconds, so they
+    and their experiments can be out of date by that long. Only use this
+    where just their primary keys and experiments are needed.
+    """
+    participants: Dict[str, Participant] = {}
+    missing = []
+
+    for participant_id in participant_ids:
+        if participant := _participant_cache.get(participant_id):
+            participants[participant_id] = participant
+        elif participant_id_may_exist(participant_id):
+            missing.append(participant_id)
+
+    if missing:
+        for participant in Participant.objects.select_related("experiment").filter(
+            participant_id__in=missing
+        ):
+            participants[participant.participant_id] = participant
+
+            if settings.API_PARTICIPANT_CACHE_TIMEOUT:
+                cached_participant = copy.copy(participant)
+                cached_participant._from_participant_cache = True  # type: ignore
+                _participant_cache.set(
+                    participant.participant_id,
+                    cached_participant,
+                    settings.API_PARTICIPANT_CACHE_TIMEOUT,
+                )
+
+    return participants
+
+
+def is_cached_participant(participant: Participant) -> bool:
+    """
+    Returns whether get_participants returned the participant from the cache,
+    in which case it may have been deleted since
+    """
+    return getattr(participant, "_from_participant_cache", False)
+
+
+def evict_deleted_participants(
+    participants: Iterable[Participant],
+) -> List[Participant]:
+    """
+    Drops the participants that have been deleted from this process's cache,
+    and returns them
+
+    Participants returned by get_participants can have been deleted since they
+    were cached, which is found out when data for them fails to save.
+    """
+    participants_by_pk = {participant.pk: participant for participant in participants}
+    deleted = set(participants_by_pk) - set(
+        Participant.objects.filter(pk__in=participants_by_pk).values_list(
+            "pk", flat=True
+        )
+    )
+
+    for pk in deleted:
+        _participant_cache.delete(participants_by_pk[pk].participant_id)
+
+    return [participants_by_pk[pk] for pk in deleted]
+
+
+def clear_participant_caches() -> None:
+    """Drops this process's filter and cached participants"""
+    global _participant_filter
+
+    with _participant_filter_lock:
+        _participant_filter = None
+
+    _participant_cache.clear()
@@ -0,0 +1,67 @@
+import uuid
+from typing import Any, FrozenSet, Optional
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from flare_portal.reimbursement.models import VoucherPool
+from flare_portal.site_config.models import SiteConfiguration
+
+from .assets import save_asset_hashes
+from .models import BaseModule, CriterionQuestion, Experiment, Participant
+from .models.modules import InstructionsScreen
+from .participants import invalidate_participant_ids
+
+
+@receiver(pre_save, sender=Experiment)
+def update_experiment_config_version(instance: Experiment, **kwargs: Any) -> None:
+    instance.config_version = uuid.uuid4()
+
+
+@receiver(post_save, sender=Experiment)
+def update_experiment_asset_hashes(instance: Experiment, **kwargs: Any) -> None:
+    # Hashing happens after saving so the hashes are stored against the final
+    # names of uploaded files. The export worker rebuilds the asset bundle once
+    # the hashes change. See build_outdated_asset_bundles
+    save_asset_hashes(instance)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_experiment_config(sender: Any, instance: Any, **kwargs: Any) -> None:
+    """Bumps the config version when a module or module inline changes"""
+    if isinstance(instance, BaseModule):
+        experiments = Experiment.objects.filter(pk=instance.experiment_id)
+    elif isinstance(instance, (CriterionQuestion, InstructionsScreen)):
+        experiments = Experiment.objects.filter(modules__pk=instance.module_id)
+    else:
+        return
+
+    experiments.update(config_version=uuid.uuid4())
+
+
+@receiver(post_save, sender=Participant)
+def invalidate_participant_id_filters(
+    created: bool, update_fields: Optional[FrozenSet[str]], **kwargs: Any
+) -> None:
+    # The API saves participants with update_fields, so doesn't end up here.
+    # Deleted participants are left in the filters until they're rebuilt.
+    if created or update_fields is None or "participant_id" in update_fields:
+        invalidate_participant_ids()
+
+
+@receiver(pre_delete, sender=VoucherPool)
+def invalidate_voucher_pool_experiments_config(
+    instance: VoucherPool, **kwargs: Any
+) -> None:
+    # Experiments are unassigned from the pool with an UPDATE, which doesn't
+    # send any signals for the experiments themselves.
+    Experiment.objects.filter(voucher_pool=instance).update(config_version=uuid.uuid4())
+
+
+@receiver(post_save, sender=SiteConfiguration)
+def invalidate_all_experiments_config(created: bool, **kwargs: Any) -> None:
+    # get_solo() creates the configuration with its defaults on first access,
+    # which is what any cached payload was already built with.
+    if not created:
+        Experiment.objects.update(config_version=uuid.uuid4())
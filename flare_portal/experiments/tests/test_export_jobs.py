@@ -0,0 +1,438 @@
+import csv
+import io
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock, skipIf
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from flare_portal.users.factories import UserFactory
+from flare_portal.users.models import User
+
+from .. import columnar, tracking
+from ..export_jobs import (
+    claim_export_job,
+    delete_replaced_export_jobs,
+    queue_export,
+    run_export_jobs,
+)
+from ..exports import ZipExporter
+from ..factories import (
+    ExperimentFactory,
+    FearConditioningDataFactory,
+    FearConditioningModuleFactory,
+    ParticipantFactory,
+)
+from ..models import ExportCursor, ExportJob, FearConditioningData
+
+
+class ExportJobTest(TestCase):
+    def setUp(self) -> None:
+        media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(media_dir.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = UserFactory()
+        self.experiment = ExperimentFactory(code="DEMO1")
+        self.module = FearConditioningModuleFactory(experiment=self.experiment)
+        self.participant = ParticipantFactory(experiment=self.experiment)
+        FearConditioningDataFactory.create_batch(
+            5, participant=self.participant, module=self.module
+        )
+
+    def test_run_export_jobs(self) -> None:
+        job, created = queue_export(self.experiment, self.user)
+
+        self.assertTrue(created)
+        self.assertEqual(job.status, ExportJob.STATUS.queued)
+        self.assertEqual(job.requested_by, self.user)
+
+        self.assertEqual(run_export_jobs(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS.finished)
+        self.assertEqual(job.get_percent_complete(), 100)
+        self.assertIn(
+            {"title": "Fear Conditioning Data", "rows": 5, "rows_written": 5},
+            job.progress,
+        )
+
+        with job.archive.open("rb") as archive_file:
+            archive = zipfile.ZipFile(archive_file)
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(len(archive.namelist()), len(ZipExporter.exporters))
+
+        self.assertEqual(run_export_jobs(), 0)
+
+    def test_queued_job_is_reused(self) -> None:
+        job, _ = queue_export(self.experiment, self.user)
+        FearConditioningDataFactory(participant=self.participant, module=self.module)
+
+        self.assertEqual(queue_export(self.experiment, self.user), (job, False))
+
+        # The worker exports the data as it was when the job started
+        run_export_jobs()
+        job.refresh_from_db()
+        self.assertEqual(
+            job.fingerprint, ZipExporter(self.experiment).get_fingerprint()
+        )
+
+    def test_unchanged_data_is_reused(self) -> None:
+        job, _ = queue_export(self.experiment, self.user)
+        run_export_jobs()
+
+        self.assertEqual(queue_export(self.experiment, self.user), (job, False))
+
+    def test_changed_data(self) -> None:
+        previous_job, _ = queue_export(self.experiment, self.user)
+        run_export_jobs()
+        previous_job.refresh_from_db()
+
+        FearConditioningDataFactory(participant=self.participant, module=self.module)
+        job, created = queue_export(self.experiment, self.user)
+
+        self.assertTrue(created)
+        self.assertNotEqual(job, previous_job)
+
+        # The previous archive is kept for a while once the new one is built,
+        # so downloads in progress can finish
+        run_export_jobs()
+        job.refresh_from_db()
+        self.assertTrue(ExportJob.objects.filter(pk=previous_job.pk).exists())
+        self.assertTrue(previous_job.archive.storage.exists(previous_job.archive.name))
+
+        self.assertEqual(queue_export(self.experiment, self.user), (job, False))
+
+        # Replaced jobs aren't reused, as their archives are about to be deleted
+        ExportJob.objects.filter(pk=previous_job.pk).update(fingerprint=job.fingerprint)
+        ExportJob.objects.filter(pk=job.pk).update(fingerprint={})
+        self.assertTrue(queue_export(self.experiment, self.user)[1])
+
+        self.assertEqual(delete_replaced_export_jobs(), 0)
+
+        with mock.patch(
+            "django.utils.timezone.now",
+            return_value=job.finished_at + timedelta(hours=1, seconds=1),
+        ):
+            self.assertEqual(delete_replaced_export_jobs(), 1)
+
+        self.assertFalse(ExportJob.objects.filter(pk=previous_job.pk).exists())
+        self.assertFalse(previous_job.archive.storage.exists(previous_job.archive.name))
+        self.assertTrue(ExportJob.objects.filter(pk=job.pk).exists())
+
+    def buffer_tracking(self, current_trial_index: int) -> None:
+        settings_override = override_settings(PARTICIPANT_TRACKING_BUFFER="local")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        tracking._get_tracking_buffer.cache_clear()
+        self.addCleanup(tracking._get_tracking_buffer.cache_clear)
+
+        tracking.get_tracking_buffer().set(
+            self.participant.pk,
+            tracking.TrackingState(
+                current_module_id=self.module.pk,
+                current_trial_index=current_trial_index,
+                lock_reason="",
+                updated_at=timezone.now().isoformat(),
+            ),
+        )
+
+    def test_buffered_tracking_is_exported(self) -> None:
+        self.buffer_tracking(3)
+        job, _ = queue_export(self.experiment, self.user)
+        run_export_jobs()
+
+        job.refresh_from_db()
+        with job.archive.open("rb") as archive_file:
+            archive = zipfile.ZipFile(archive_file)
+            filename = next(
+                name
+                for name in archive.namelist()
+                if name.endswith("-participants.csv")
+            )
+            rows = list(csv.DictReader(io.StringIO(archive.read(filename).decode())))
+
+        self.assertEqual(rows[0]["current_trial_index"], "3")
+        # The fingerprint describes the flushed data in the archive
+        self.assertEqual(
+            job.fingerprint, ZipExporter(self.experiment).get_fingerprint()
+        )
+
+    def test_buffered_tracking_changes_data(self) -> None:
+        previous_job, _ = queue_export(self.experiment, self.user)
+        run_export_jobs()
+
+        self.buffer_tracking(3)
+        job, created = queue_export(self.experiment, self.user)
+
+        self.assertTrue(created)
+        self.assertNotEqual(job, previous_job)
+
+        # Once built, the archive is reused until the data changes again
+        run_export_jobs()
+        self.assertEqual(queue_export(self.experiment, self.user), (job, False))
+
+    def test_claim_stalled_job(self) -> None:
+        job, _ = queue_export(self.experiment, self.user)
+        self.assertEqual(claim_export_job(), job)
+        self.assertIsNone(claim_export_job())
+
+        ExportJob.objects.filter(pk=job.pk).update(
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(claim_export_job(), job)
+
+    def test_failed_job(self) -> None:
+        job, _ = queue_export(self.experiment, self.user)
+
+        with mock.patch.object(
+            ZipExporter, "iter_zip", side_effect=ValueError("Out of space")
+        ):
+            run_export_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS.failed)
+        self.assertEqual(job.error, "Out of space")
+
+        # Failed jobs are retried by queueing another one
+        self.assertTrue(queue_export(self.experiment, self.user)[1])
+
+    @skipIf(columnar.pyarrow is None, "pyarrow isn't installed")
+    def test_file_formats(self) -> None:
+        csv_job, _ = queue_export(self.experiment, self.user)
+        run_export_jobs()
+
+        job, created = queue_export(
+            self.experiment, self.user, file_format=ExportJob.FILE_FORMATS.parquet
+        )
+        self.assertTrue(created)
+        run_export_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS.finished)
+        with job.archive.open("rb") as archive_file:
+            archive = zipfile.ZipFile(archive_file)
+            self.assertTrue(
+                all(name.endswith(".parquet") for name in archive.namelist())
+            )
+
+        # Archives in each format are kept
+        self.assertTrue(ExportJob.objects.filter(pk=csv_job.pk).exists())
+        self.assertEqual(
+            queue_export(
+                self.experiment, self.user, file_format=ExportJob.FILE_FORMATS.parquet
+            ),
+            (job, False),
+        )
+
+
+# Leaving out recent updates is tested separately
+@override_settings(EXPORT_CURSOR_LAG=0)
+class IncrementalExportJobTest(TestCase):
+    def setUp(self) -> None:
+        media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(media_dir.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = UserFactory()
+        self.experiment = ExperimentFactory(code="DEMO1")
+        self.module = FearConditioningModuleFactory(experiment=self.experiment)
+        self.participant = ParticipantFactory(experiment=self.experiment)
+
+    def get_rows(self, job: ExportJob, title: str) -> list:
+        """Returns the rows of the CSV with the given title in the job's archive"""
+        job.refresh_from_db()
+        exporter = ZipExporter(self.experiment)
+        titles = {
+            csv_exporter.get_filename(exporter.now).split("-", 2)[2]: (
+                csv_exporter.get_title()
+            )
+            for csv_exporter in exporter.csv_exporters
+        }
+
+        with job.archive.open("rb") as archive_file:
+            archive = zipfile.ZipFile(archive_file)
+            name = next(
+                name
+                for name in archive.namelist()
+                if titles[name.split("-", 2)[2]] == title
+            )
+            return list(csv.DictReader(io.StringIO(archive.read(name).decode())))
+
+    def test_incremental_exports(self) -> None:
+        first_trials = FearConditioningDataFactory.create_batch(
+            3, participant=self.participant, module=self.module
+        )
+        job, created = queue_export(self.experiment, self.user, incremental=True)
+        self.assertTrue(created)
+        run_export_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS.finished)
+        self.assertTrue(job.archive.name.endswith("-incremental.zip"))
+        self.assertEqual(
+            [row["trial"] for row in self.get_rows(job, "Fear Conditioning Data")],
+            [str(trial.trial) for trial in first_trials],
+        )
+
+        # Only data added since is exported next time, along with the
+        # participant whose progress changed
+        new_trial = FearConditioningDataFactory(
+            participant=self.participant, module=self.module
+        )
+        other_participant = ParticipantFactory(experiment=self.experiment)
+        next_job, created = queue_export(self.experiment, self.user, incremental=True)
+        self.assertTrue(created)
+        run_export_jobs()
+
+        self.assertEqual(
+            [row["trial"] for row in self.get_rows(next_job, "Fear Conditioning Data")],
+            [str(new_trial.trial)],
+        )
+        self.assertEqual(
+            [row["participant_id"] for row in self.get_rows(next_job, "Participants")],
+            [other_participant.participant_id],
+        )
+
+        # Earlier incremental exports are kept, as they have different data
+        self.assertTrue(ExportJob.objects.filter(pk=job.pk).exists())
+
+    @override_settings(EXPORT_CURSOR_LAG=60)
+    def test_recent_updates_are_left_for_the_next_export(self) -> None:
+        job, _ = queue_export(self.experiment, self.user, incremental=True)
+        run_export_jobs()
+
+        # The participant may still have data being saved
+        self.assertEqual(self.get_rows(job, "Participants"), [])
+
+        later = timezone.now() + timedelta(minutes=2)
+        with mock.patch("django.utils.timezone.now", return_value=later):
+            next_job, _ = queue_export(self.experiment, self.user, incremental=True)
+            run_export_jobs()
+
+        self.assertEqual(
+            [row["participant_id"] for row in self.get_rows(next_job, "Participants")],
+            [self.participant.participant_id],
+        )
+
+    def test_cursors_are_per_user(self) -> None:
+        FearConditioningDataFactory(participant=self.participant, module=self.module)
+        job, _ = queue_export(self.experiment, self.user, incremental=True)
+        run_export_jobs()
+
+        other_job, _ = queue_export(self.experiment, UserFactory(), incremental=True)
+        run_export_jobs()
+
+        self.assertEqual(len(self.get_rows(job, "Fear Conditioning Data")), 1)
+        self.assertEqual(len(self.get_rows(other_job, "Fear Conditioning Data")), 1)
+
+    def test_full_export_is_unaffected(self) -> None:
+        FearConditioningDataFactory(participant=self.participant, module=self.module)
+        full_job, _ = queue_export(self.experiment, self.user)
+        job, _ = queue_export(self.experiment, self.user, incremental=True)
+        self.assertNotEqual(job, full_job)
+        run_export_jobs()
+
+        # Neither replaces the other
+        self.assertEqual(
+            set(self.experiment.export_jobs.values_list("status", flat=True)),
+            {ExportJob.STATUS.finished},
+        )
+        self.assertEqual(self.experiment.export_jobs.count(), 2)
+        self.assertEqual(queue_export(self.experiment, self.user), (full_job, False))
+
+    def test_failed_job_restores_cursor(self) -> None:
+        FearConditioningDataFactory(participant=self.participant, module=self.module)
+        job, _ = queue_export(self.experiment, self.user, incremental=True)
+
+        with mock.patch.object(
+            ZipExporter, "iter_zip", side_effect=ValueError("Out of space")
+        ):
+            run_export_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS.failed)
+        self.assertEqual(ExportCursor.objects.get().positions, {})
+
+        # The data is exported by the next one instead
+        next_job, _ = queue_export(self.experiment, self.user, incremental=True)
+        run_export_jobs()
+        self.assertEqual(len(self.get_rows(next_job, "Fear Conditioning Data")), 1)
+
+
+class ConcurrentExportJobTest(TransactionTestCase):
+    def test_simultaneous_requests_share_a_job(self) -> None:
+        experiment = ExperimentFactory()
+        module = FearConditioningModuleFactory(experiment=experiment)
+        participant = ParticipantFactory(experiment=experiment)
+        FearConditioningDataFactory.create_batch(
+            5, participant=participant, module=module
+        )
+        users = UserFactory.create_batch(4)
+        barrier = threading.Barrier(len(users))
+
+        def request_export(user: User) -> ExportJob:
+            try:
+                barrier.wait()
+                return queue_export(experiment, user)[0]
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(len(users)) as executor:
+            jobs = list(executor.map(request_export, users))
+
+        self.assertEqual(len(set(jobs)), 1)
+        self.assertEqual(experiment.export_jobs.count(), 1)
+
+    def test_late_commits_are_exported(self) -> None:
+        media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(media_dir.cleanup)
+        experiment = ExperimentFactory()
+        module = FearConditioningModuleFactory(experiment=experiment)
+        participant = ParticipantFactory(experiment=experiment)
+        saved = threading.Event()
+        commit = threading.Event()
+
+        def save_slowly() -> None:
+            try:
+                with transaction.atomic():
+                    FearConditioningDataFactory(
+                        participant=participant, module=module, trial=1
+                    )
+                    saved.set()
+                    commit.wait()
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=save_slowly)
+        thread.start()
+        saved.wait()
+
+        # A row with a larger primary key is committed first
+        FearConditioningDataFactory(participant=participant, module=module, trial=2)
+        timer = threading.Timer(0.5, commit.set)
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        with override_settings(MEDIA_ROOT=media_dir.name, EXPORT_CURSOR_LAG=5):
+            job, _ = queue_export(experiment, UserFactory(), incremental=True)
+            run_export_jobs()
+            thread.join()
+
+            job.refresh_from_db()
+            with job.archive.open("rb") as archive_file:
+                archive = zipfile.ZipFile(archive_file)
+                slug = FearConditioningData.get_module_slug()
+                name = next(name for name in archive.namelist() if slug in name)
+                rows = list(csv.DictReader(io.StringIO(archive.read(name).decode())))
+
+        self.assertEqual(sorted(row["trial"] for row in rows), ["1", "2"])
@@ -1,18 +1,46 @@
 import csv
+import datetime
 import io
+import zipfile
+import zlib
 from decimal import Decimal
+from typing import List
+from unittest import mock, skipIf
 
-from django.test import TestCase
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
 
+import pytz
 from rest_framework.serializers import DateTimeField
 
-from ..exports import FearConditioningDataExporter
+from .. import columnar, tracking
+from ..exports import (
+    ArchiveZipFile,
+    CriterionDataExporter,
+    FearConditioningDataExporter,
+    FearConditioningRatingsExporter,
+    ParticipantExporter,
+    ParticipantSerializer,
+    ZipExporter,
+    ZipStream,
+)
 from ..factories import (
+    BreakStartModuleFactory,
+    CriterionModuleFactory,
+    CriterionQuestionFactory,
     ExperimentFactory,
     FearConditioningDataFactory,
     FearConditioningModuleFactory,
     ParticipantFactory,
 )
+from ..models import (
+    BasicInfoData,
+    BasicInfoModule,
+    CriterionData,
+    Experiment,
+    FearConditioningData,
+)
 
 
 class ModuleExportTest(TestCase):
@@ -68,3 +96,754 @@ class ModuleExportTest(TestCase):
                 row["calibrated_volume_level"], str(fc_data.calibrated_volume_level)
             )
             self.assertEqual(row["headphones"], str(fc_data.headphones))
+
+    def test_iter_csv(self) -> None:
+        experiment = ExperimentFactory()
+        module = FearConditioningModuleFactory(experiment=experiment)
+        participant = ParticipantFactory(experiment=experiment)
+        FearConditioningDataFactory.create_batch(
+            10, participant=participant, module=module
+        )
+
+        csv_export = io.StringIO()
+        FearConditioningDataExporter(experiment).write(csv_export)
+
+        exporter = FearConditioningDataExporter(experiment)
+        exporter.chunk_size = 3
+        exporter.csv_chunk_size = 500
+        chunks = list(exporter.iter_csv())
+
+        self.assertGreater(len(chunks), 2)
+        self.assertEqual("".join(chunks), csv_export.getvalue())
+
+    def test_values_match_serializer(self) -> None:
+        experiment = ExperimentFactory()
+        modules = [
+            FearConditioningModuleFactory(experiment=experiment, label="Acquisition"),
+            FearConditioningModuleFactory(experiment=experiment, label=""),
+        ]
+        basic_info_module = BasicInfoModule.objects.create(experiment=experiment)
+        participants = ParticipantFactory.create_batch(2, experiment=experiment)
+        participants[0].finished_at = timezone.now()
+        participants[0].save()
+
+        for participant in participants:
+            for module in modules:
+                FearConditioningDataFactory(
+                    participant=participant,
+                    module=module,
+                    normalised_stimulus="",
+                    trial_started_at=datetime.datetime(
+                        2021, 1, 5, 12, 30, 15, 123456, tzinfo=pytz.utc
+                    ),
+                    response_recorded_at=datetime.datetime(
+                        2021, 7, 5, 12, 30, tzinfo=pytz.utc
+                    ),
+                    volume_level=Decimal("0.5"),
+                )
+                FearConditioningDataFactory(
+                    participant=participant,
+                    module=module,
+                    rating=None,
+                    response_recorded_at=None,
+                )
+
+            BasicInfoData.objects.create(
+                participant=participant,
+                module=basic_info_module,
+                date_of_birth=datetime.date(1990, 1, 1) if participant.pk % 2 else None,
+                gender="",
+                device_make="Example",
+                device_model="Phone",
+                headphone_type=BasicInfoData.HEADPHONE_TYPES.in_ear,
+                os_name="Android",
+                os_version="11",
+            )
+
+        for exporter_class in ZipExporter.exporters:
+            with self.subTest(exporter=exporter_class.__name__):
+                exporter = exporter_class(experiment)
+                serializer_export = io.StringIO()
+                exporter.use_values = False
+                exporter.write(serializer_export)
+
+                values_export = io.StringIO()
+                exporter_class(experiment).write(values_export)
+
+                self.assertEqual(values_export.getvalue(), serializer_export.getvalue())
+
+    def test_copy_matches_serializer(self) -> None:
+        experiment = ExperimentFactory()
+        modules = [
+            FearConditioningModuleFactory(experiment=experiment, label="Acquisition"),
+            FearConditioningModuleFactory(experiment=experiment, label=""),
+        ]
+        criterion_module = CriterionModuleFactory(experiment=experiment)
+        questions = [
+            CriterionQuestionFactory(
+                module=criterion_module,
+                question_text='Did you hear "the tone", at all?\nAnswer yes',
+                correct_answer=True,
+            ),
+            CriterionQuestionFactory(
+                module=criterion_module, correct_answer=None, required=False
+            ),
+            CriterionQuestionFactory(module=criterion_module, correct_answer=False),
+        ]
+        participants = ParticipantFactory.create_batch(2, experiment=experiment)
+        answers = [[False, None, False], [True, True, None]]
+
+        for participant, participant_answers in zip(participants, answers):
+            for module in modules:
+                FearConditioningDataFactory(
+                    participant=participant,
+                    module=module,
+                    normalised_stimulus="",
+                    # In GMT and BST, with and without microseconds
+                    trial_started_at=datetime.datetime(
+                        2021, 1, 5, 12, 30, 15, 123456, tzinfo=pytz.utc
+                    ),
+                    response_recorded_at=datetime.datetime(
+                        2021, 7, 5, 12, 30, tzinfo=pytz.utc
+                    ),
+                    volume_level=Decimal("0.5"),
+                )
+                FearConditioningDataFactory(
+                    participant=participant,
+                    module=module,
+                    rating=None,
+                    response_recorded_at=None,
+                )
+
+            for question, answer in zip(questions, participant_answers):
+                CriterionData.objects.create(
+                    participant=participant,
+                    module=criterion_module,
+                    question=question,
+                    answer=answer,
+                )
+
+        for exporter_class in [FearConditioningDataExporter, CriterionDataExporter]:
+            with self.subTest(exporter=exporter_class.__name__):
+                exporter = exporter_class(experiment)
+                copy_export = b"".join(exporter.iter_copy_csv())
+
+                serializer_exporter = exporter_class(experiment)
+                serializer_exporter.use_values = False
+                serializer_export = b"".join(
+                    chunk.encode() for chunk in serializer_exporter.iter_csv()
+                )
+
+                self.assertEqual(copy_export, serializer_export)
+                self.assertEqual(
+                    exporter.rows_written,
+                    6 if exporter_class is CriterionDataExporter else 8,
+                )
+
+    def test_server_side_cursor(self) -> None:
+        experiment = ExperimentFactory()
+        module = FearConditioningModuleFactory(experiment=experiment)
+        participant = ParticipantFactory(experiment=experiment)
+        FearConditioningDataFactory.create_batch(
+            5, participant=participant, module=module
+        )
+
+        for use_values in [True, False]:
+            with self.subTest(use_values=use_values), mock.patch.object(
+                connection, "chunked_cursor", wraps=connection.chunked_cursor
+            ) as chunked_cursor:
+                exporter = FearConditioningDataExporter(experiment)
+                exporter.use_values = use_values
+                exporter.chunk_size = 2
+                csv_export = "".join(exporter.iter_csv())
+
+                chunked_cursor.assert_called_once()
+
+                exporter = FearConditioningDataExporter(experiment)
+                exporter.use_values = use_values
+                exporter.use_server_side_cursor = False
+                self.assertEqual("".join(exporter.iter_csv()), csv_export)
+                chunked_cursor.assert_called_once()
+
+    def test_copy_closed_early(self) -> None:
+        experiment = ExperimentFactory()
+        module = FearConditioningModuleFactory(experiment=experiment)
+        participant = ParticipantFactory(experiment=experiment)
+        FearConditioningDataFactory.create_batch(
+            3, participant=participant, module=module
+        )
+
+        with transaction.atomic():
+            chunks = FearConditioningDataExporter(experiment).iter_copy_csv()
+            next(chunks)
+            next(chunks)
+            chunks.close()
+
+        # The connection can still be used
+        self.assertEqual(experiment.participants.count(), 1)
+
+
+class FearConditioningRatingsExportTest(TestCase):
+    def setUp(self) -> None:
+        self.experiment = ExperimentFactory()
+        # Without saving, which would read the image
+        Experiment.objects.filter(pk=self.experiment.pk).update(gsa="gsa.png")
+        self.experiment.refresh_from_db()
+        modules = [
+            FearConditioningModuleFactory(
+                experiment=self.experiment,
+                phase="acquisition",
+                trials_per_stimulus=2,
+                sortorder=0,
+            ),
+            FearConditioningModuleFactory(
+                experiment=self.experiment,
+                phase="generalisation",
+                trials_per_stimulus=1,
+                generalisation_stimuli_enabled=True,
+                sortorder=1,
+            ),
+            FearConditioningModuleFactory(
+                experiment=self.experiment,
+                phase="acquisition",
+                trials_per_stimulus=1,
+                sortorder=2,
+            ),
+        ]
+        self.participants = [
+            ParticipantFactory(experiment=self.experiment, participant_id="DEMO.1"),
+            ParticipantFactory(experiment=self.experiment, participant_id="DEMO.2"),
+        ]
+
+        trials = [
+            (modules[0], "CS+", 1, 3),
+            (modules[0], "CS-", 1, 4),
+            (modules[0], "CS+", 2, None),
+            (modules[0], "CS-", 2, 5),
+            (modules[1], "GSA", 1, 6),
+            (modules[2], "CS+", 1, 7),
+        ]
+        for participant in self.participants:
+            for trial, (module, stimulus, trial_by_stimulus, rating) in enumerate(
+                trials
+            ):
+                if participant == self.participants[1] and trial > 1:
+                    break
+                FearConditioningDataFactory(
+                    participant=participant,
+                    module=module,
+                    trial=trial,
+                    trial_by_stimulus=trial_by_stimulus,
+                    rating=rating,
+                    # Generalisation stimuli aren't normalised
+                    stimulus="CSA" if stimulus.startswith("CS") else stimulus,
+                    normalised_stimulus=stimulus if stimulus.startswith("CS") else "",
+                )
+
+    def get_rows(self, exporter: FearConditioningRatingsExporter) -> List[List[str]]:
+        return list(csv.reader(io.StringIO("".join(exporter.iter_csv()))))
+
+    def test_export(self) -> None:
+        exporter = FearConditioningRatingsExporter(self.experiment)
+        rows = self.get_rows(exporter)
+
+        self.assertEqual(
+            rows,
+            [
+                [
+                    "participant_id",
+                    "acquisition_CS+_1",
+                    "acquisition_CS+_2",
+                    "acquisition_CS-_1",
+                    "acquisition_CS-_2",
+                    "generalisation_CS+_1",
+                    "generalisation_CS-_1",
+                    "generalisation_GSA_1",
+                    "acquisition2_CS+_1",
+                    "acquisition2_CS-_1",
+                ],
+                ["DEMO.1", "3", "NA", "4", "5", "NA", "NA", "6", "7", "NA"],
+                ["DEMO.2", "3", "NA", "4", "NA", "NA", "NA", "NA", "NA", "NA"],
+            ],
+        )
+        self.assertEqual(exporter.rows_written, 2)
+        self.assertEqual(exporter.get_state()["rows"], 2)
+
+    def test_incremental(self) -> None:
+        # The second participant's data is after the first's
+        since = (
+            FearConditioningData.objects.filter(participant=self.participants[0])
+            .latest("pk")
+            .pk
+        )
+        exporter = FearConditioningRatingsExporter(self.experiment, since=since)
+
+        self.assertEqual(
+            self.get_rows(exporter)[1:],
+            [["DEMO.2", "3", "NA", "4", "NA", "NA", "NA", "NA", "NA", "NA"]],
+        )
+
+
+class ParticipantExportTest(TestCase):
+    def test_export(self) -> None:
+        experiment = ExperimentFactory()
+        module = FearConditioningModuleFactory(
+            experiment=experiment, phase="acquisition", label=""
+        )
+        break_start = BreakStartModuleFactory(experiment=experiment, label="Lunch")
+        current_modules = [module, break_start, break_start.end_module, None]
+
+        for current_module in current_modules:
+            participant = ParticipantFactory(
+                experiment=experiment, current_module=current_module
+            )
+            if current_module:
+                FearConditioningDataFactory(
+                    participant=participant,
+                    module=module,
+                    trial=2,
+                    reinforced_stimulus="CSB",
+                )
+                FearConditioningDataFactory(
+                    participant=participant,
+                    module=module,
+                    trial=1,
+                    reinforced_stimulus="CSA",
+                )
+
+        csv_export = io.StringIO()
+        # The modules, their break start modules, then the participants
+        with self.assertNumQueries(3):
+            ParticipantExporter(experiment).write(csv_export)
+
+        rows = list(csv.DictReader(csv_export))
+        self.assertEqual(
+            [row["current_module"] for row in rows],
+            ["Acquisition", "Break start - Lunch", "Break end - Lunch", "NA"],
+        )
+        self.assertEqual(
+            [row["reinforced_stimulus"] for row in rows], ["CSB", "CSB", "CSB", "NA"]
+        )
+
+        # The same values as the model gives
+        for row, participant in zip(rows, experiment.participants.order_by("pk")):
+            self.assertEqual(
+                row["reinforced_stimulus"], participant.reinforced_stimulus or "NA"
+            )
+
+    def test_current_module_without_title(self) -> None:
+        experiment = ExperimentFactory()
+        module = FearConditioningModuleFactory(experiment=experiment)
+        participant = ParticipantFactory(experiment=experiment, current_module=module)
+
+        # Serialized without the exporter's context
+        self.assertEqual(ParticipantSerializer().get_current_module(participant), "")
+        # Or the module isn't one of the experiment's any more
+        serializer = ParticipantSerializer(context={"module_titles": {}})
+        self.assertEqual(serializer.get_current_module(participant), "")
+
+    @override_settings(PARTICIPANT_TRACKING_BUFFER="local")
+    def test_does_not_flush_tracking_buffer(self) -> None:
+        experiment = ExperimentFactory()
+        module = FearConditioningModuleFactory(experiment=experiment)
+        participant = ParticipantFactory(experiment=experiment)
+        tracking._get_tracking_buffer.cache_clear()
+        self.addCleanup(tracking._get_tracking_buffer.cache_clear)
+        tracking.get_tracking_buffer().set(
+            participant.pk,
+            tracking.TrackingState(
+                current_module_id=module.pk,
+                current_trial_index=3,
+                lock_reason="",
+                updated_at=timezone.now().isoformat(),
+            ),
+        )
+
+        # Exporting doesn't write the buffer, which its callers flush first
+        exporter = ZipExporter(experiment)
+        exporter.get_fingerprint()
+        for _ in exporter.iter_zip():
+            pass
+
+        participant.refresh_from_db()
+        self.assertIsNone(participant.current_module_id)
+
+
+class ZipExportTest(TestCase):
+    def test_iter_zip(self) -> None:
+        experiment = ExperimentFactory(code="DEMO1")
+        module = FearConditioningModuleFactory(experiment=experiment)
+        participant = ParticipantFactory(experiment=experiment)
+        FearConditioningDataFactory.create_batch(
+            10, participant=participant, module=module
+        )
+
+        exporter = ZipExporter(experiment)
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(exporter.iter_zip())))
+
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(
+            archive.namelist(),
+            [
+                exporter_class(experiment).get_filename(exporter.now)
+                for exporter_class in ZipExporter.exporters
+            ],
+        )
+
+        csv_export = io.StringIO()
+        FearConditioningDataExporter(experiment).write(csv_export)
+        self.assertEqual(
+            archive.read(
+                FearConditioningDataExporter(experiment).get_filename(exporter.now)
+            ).decode(),
+            csv_export.getvalue(),
+        )
+
+    def test_fingerprint(self) -> None:
+        experiment = ExperimentFactory()
+        module = FearConditioningModuleFactory(experiment=experiment)
+        participant = ParticipantFactory(experiment=experiment)
+        FearConditioningDataFactory(participant=participant, module=module)
+
+        fingerprint = ZipExporter(experiment).get_fingerprint()
+        self.assertEqual(ZipExporter(experiment).get_fingerprint(), fingerprint)
+
+        FearConditioningDataFactory(participant=participant, module=module)
+        self.assertNotEqual(ZipExporter(experiment).get_fingerprint(), fingerprint)
+        fingerprint = ZipExporter(experiment).get_fingerprint()
+
+        participant.current_trial_index = 5
+        participant.save()
+        self.assertNotEqual(ZipExporter(experiment).get_fingerprint(), fingerprint)
+        fingerprint = ZipExporter(experiment).get_fingerprint()
+
+        module.label = "Acquisition"
+        module.save()
+        experiment.refresh_from_db()
+        self.assertNotEqual(ZipExporter(experiment).get_fingerprint(), fingerprint)
+
+    def test_fingerprint_queries(self) -> None:
+        experiment = ExperimentFactory()
+        module = FearConditioningModuleFactory(experiment=experiment)
+        participant = ParticipantFactory(experiment=experiment)
+        FearConditioningDataFactory(participant=participant, module=module)
+
+        exporter = ZipExporter(experiment)
+        # The states of all the files, and the columns of the ratings
+        with self.assertNumQueries(2):
+            exporter.get_fingerprint()
+
+        self.assertEqual(
+            [state["rows"] for state in exporter.states],
+            [exporter.get_state()["rows"] for exporter in exporter.csv_exporters],
+        )
+
+    def test_progress(self) -> None:
+        experiment = ExperimentFactory()
+        ParticipantFactory.create_batch(3, experiment=experiment)
+
+        exporter = ZipExporter(experiment)
+        exporter.get_fingerprint()
+        progress = {item["title"]: item for item in exporter.get_progress()}
+
+        self.assertEqual(
+            progress["Participants"],
+            {"title": "Participants", "rows": 3, "rows_written": 0},
+        )
+
+        for _ in exporter.iter_zip():
+            pass
+
+        progress = {item["title"]: item for item in exporter.get_progress()}
+        self.assertEqual(progress["Participants"]["rows_written"], 3)
+        self.assertEqual(progress["Fear Conditioning Data"]["rows"], 0)
+
+
+@skipIf(columnar.pyarrow is None, "pyarrow isn't installed")
+class ParquetExportTest(TestCase):
+    def test_iter_zip(self) -> None:
+        experiment = ExperimentFactory()
+        module = FearConditioningModuleFactory(experiment=experiment)
+        criterion_module = CriterionModuleFactory(experiment=experiment)
+        questions = [
+            CriterionQuestionFactory(module=criterion_module, correct_answer=True),
+            CriterionQuestionFactory(module=criterion_module, correct_answer=None),
+        ]
+        participants = ParticipantFactory.create_batch(2, experiment=experiment)
+        participants[0].finished_at = timezone.now()
+        participants[0].save()
+
+        for participant in participants:
+            FearConditioningDataFactory(
+                participant=participant,
+                module=module,
+                normalised_stimulus="",
+                trial_started_at=datetime.datetime(
+                    2021, 7, 5, 12, 30, 15, 123456, tzinfo=pytz.utc
+                ),
+                volume_level=Decimal("0.5"),
+            )
+            FearConditioningDataFactory(
+                participant=participant,
+                module=module,
+                rating=None,
+                response_recorded_at=None,
+            )
+            for question in questions:
+                CriterionData.objects.create(
+                    participant=participant,
+                    module=criterion_module,
+                    question=question,
+                    answer=participant == participants[0],
+                )
+
+        csv_exporter = ZipExporter(experiment)
+        csv_archive = zipfile.ZipFile(io.BytesIO(b"".join(csv_exporter.iter_zip())))
+        exporter = ZipExporter(experiment, file_format="parquet")
+        exporter.now = csv_exporter.now
+        exporter.get_fingerprint()
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(exporter.iter_zip())))
+
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(
+            archive.namelist(),
+            [name.replace(".csv", ".parquet") for name in csv_archive.namelist()],
+        )
+
+        tables = {}
+        for csv_name, name in zip(csv_archive.namelist(), archive.namelist()):
+            with self.subTest(name=name):
+                self.assertEqual(
+                    archive.getinfo(name).compress_type, zipfile.ZIP_STORED
+                )
+                table = columnar.pyarrow.parquet.read_table(
+                    io.BytesIO(archive.read(name))
+                )
+                reader = csv.DictReader(
+                    io.StringIO(csv_archive.read(csv_name).decode())
+                )
+                rows = list(reader)
+
+                self.assertEqual(table.column_names, reader.fieldnames)
+                self.assertEqual(table.num_rows, len(rows))
+                # Values that are NA in the CSV are null
+                for row, values in zip(rows, table.to_pylist()):
+                    self.assertEqual(
+                        [key for key, value in row.items() if value == "NA"],
+                        [key for key, value in values.items() if value is None],
+                    )
+
+                tables[name.split("-", 2)[2]] = table
+
+        fc_data = tables["fear-conditioning-data.parquet"]
+        self.assertEqual(
+            fc_data.schema.field("trial_started_at").type,
+            columnar.pyarrow.timestamp("us", tz="UTC"),
+        )
+        self.assertEqual(
+            fc_data.column("trial_started_at")[0].as_py(),
+            datetime.datetime(2021, 7, 5, 12, 30, 15, 123456, tzinfo=pytz.utc),
+        )
+        self.assertEqual(fc_data.column("volume_level")[0].as_py(), Decimal("0.50"))
+        self.assertEqual(fc_data.schema.field("rating").type, columnar.pyarrow.int64())
+        self.assertEqual(
+            fc_data.schema.field("unconditional_stimulus").type,
+            columnar.pyarrow.bool_(),
+        )
+        self.assertEqual(
+            fc_data.column("participant_id").to_pylist(),
+            [
+                participant.participant_id
+                for participant in participants
+                for _ in range(2)
+            ],
+        )
+
+        criterion_data = tables["criterion-data.parquet"]
+        self.assertEqual(
+            criterion_data.column("passed").to_pylist(), [True, True, False, True]
+        )
+
+        progress = {item["title"]: item for item in exporter.get_progress()}
+        self.assertEqual(progress["Fear Conditioning Data"]["rows_written"], 4)
+
+        # Columns read from instances have the same values
+        for exporter_class in ZipExporter.exporters:
+            with self.subTest(exporter=exporter_class.__name__):
+                instance_exporter = exporter_class(experiment)
+                instance_exporter.use_values = False
+                export = instance_exporter.columnar_export_class(instance_exporter)
+                table = columnar.pyarrow.Table.from_batches(
+                    list(export.iter_batches()), schema=export.schema
+                )
+
+                self.assertTrue(
+                    table.equals(
+                        tables[
+                            instance_exporter.get_filename(exporter.now)
+                            .split("-", 2)[2]
+                            .replace(".csv", ".parquet")
+                        ]
+                    )
+                )
+
+
+class ArchiveZipFileTest(SimpleTestCase):
+    def write_archive(self) -> zipfile.ZipFile:
+        stream = ZipStream()
+        content = b"participant_id,rating\n" + b"DEMO1,3\n" * 1000
+
+        with ArchiveZipFile(stream, mode="w") as archive_file:
+            archive_file.writestr("first.csv", content)
+
+            for name, compress_type in [
+                ("deflated.csv", zipfile.ZIP_DEFLATED),
+                ("stored.csv", zipfile.ZIP_STORED),
+            ]:
+                if compress_type == zipfile.ZIP_DEFLATED:
+                    compressor = zlib.compressobj(
+                        zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15
+                    )
+                    data = compressor.compress(content) + compressor.flush()
+                else:
+                    data = content
+
+                info = zipfile.ZipInfo(name, date_time=(2021, 1, 1, 0, 0, 0))
+                info.compress_type = compress_type
+                info.CRC = zlib.crc32(content)
+                info.file_size = len(content)
+                info.compress_size = len(data)
+                chunks = list(
+                    archive_file.iter_write_compressed(info, io.BytesIO(data), 1024)
+                )
+                self.assertEqual(len(chunks), -(-len(data) // 1024))
+
+            archive_file.writestr("last.csv", content)
+
+        archive = zipfile.ZipFile(io.BytesIO(stream.pop()))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(
+            archive.namelist(), ["first.csv", "deflated.csv", "stored.csv", "last.csv"]
+        )
+        for name in archive.namelist():
+            self.assertEqual(archive.read(name), content)
+
+        return archive
+
+    def test_iter_write_compressed(self) -> None:
+        archive = self.write_archive()
+
+        self.assertEqual(archive.getinfo("deflated.csv").extra, b"")
+
+    def test_iter_write_compressed_zip64(self) -> None:
+        # Members larger than the limit have ZIP64 headers
+        with mock.patch("zipfile.ZIP64_LIMIT", 1024):
+            archive = self.write_archive()
+
+        # The ZIP64 extra field's header ID
+        self.assertEqual(archive.getinfo("deflated.csv").extra[:2], b"\x01\x00")
+
+    def test_iter_write_compressed_while_writing(self) -> None:
+        with ArchiveZipFile(ZipStream(), mode="w") as archive_file:
+            with archive_file.open("open.csv", mode="w"):
+                with self.assertRaises(ValueError):
+                    next(
+                        archive_file.iter_write_compressed(
+                            zipfile.ZipInfo("added.csv"), io.BytesIO(b""), 1024
+                        )
+                    )
+
+    def test_private_attributes(self) -> None:
+        with ArchiveZipFile(ZipStream(), mode="w") as archive_file:
+            for name in ArchiveZipFile.private_attributes:
+                self.assertTrue(hasattr(archive_file, name), name)
+            # ZipFile wraps streams it can't seek so it can tell their position
+            self.assertEqual(archive_file.fp.tell(), 0)
+
+
+class ParallelZipExportTest(TransactionTestCase):
+    def test_iter_zip(self) -> None:
+        experiment = ExperimentFactory(code="DEMO1")
+        module = FearConditioningModuleFactory(experiment=experiment)
+        participants = ParticipantFactory.create_batch(2, experiment=experiment)
+        for participant in participants:
+            FearConditioningDataFactory.create_batch(
+                10, participant=participant, module=module
+            )
+
+        exporter = ZipExporter(experiment, parallelism=1)
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(exporter.iter_zip())))
+
+        parallel_exporter = ZipExporter(experiment, parallelism=3)
+        parallel_exporter.now = exporter.now
+        parallel_exporter.get_fingerprint()
+        parallel_archive = zipfile.ZipFile(
+            io.BytesIO(b"".join(parallel_exporter.iter_zip()))
+        )
+
+        self.assertIsNone(parallel_archive.testzip())
+        self.assertEqual(parallel_archive.namelist(), archive.namelist())
+        for name in archive.namelist():
+            self.assertEqual(parallel_archive.read(name), archive.read(name))
+
+        progress = {item["title"]: item for item in parallel_exporter.get_progress()}
+        self.assertEqual(progress["Participants"]["rows_written"], 2)
+        self.assertEqual(progress["Fear Conditioning Data"]["rows_written"], 20)
+
+    def test_iter_zip_zip64(self) -> None:
+        experiment = ExperimentFactory()
+        module = FearConditioningModuleFactory(experiment=experiment)
+        participant = ParticipantFactory(experiment=experiment)
+        FearConditioningDataFactory.create_batch(
+            10, participant=participant, module=module
+        )
+
+        # Members larger than the limit are added with ZIP64 headers. Workers
+        # only compress the files, so the limit is only needed in this process
+        with mock.patch("zipfile.ZIP64_LIMIT", 64):
+            exporter = ZipExporter(experiment, parallelism=2)
+            archive = zipfile.ZipFile(io.BytesIO(b"".join(exporter.iter_zip())))
+
+            self.assertIsNone(archive.testzip())
+
+        filename = FearConditioningDataExporter(experiment).get_filename(exporter.now)
+        # The ZIP64 extra field's header ID
+        self.assertEqual(archive.getinfo(filename).extra[:2], b"\x01\x00")
+        self.assertEqual(
+            len(list(csv.DictReader(io.StringIO(archive.read(filename).decode())))),
+            10,
+        )
+
+    @skipIf(columnar.pyarrow is None, "pyarrow isn't installed")
+    def test_iter_zip_parquet(self) -> None:
+        experiment = ExperimentFactory()
+        module = FearConditioningModuleFactory(experiment=experiment)
+        participant = ParticipantFactory(experiment=experiment)
+        FearConditioningDataFactory.create_batch(
+            10, participant=participant, module=module
+        )
+
+        exporter = ZipExporter(experiment, parallelism=1, file_format="parquet")
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(exporter.iter_zip())))
+
+        parallel_exporter = ZipExporter(
+            experiment, parallelism=2, file_format="parquet"
+        )
+        parallel_exporter.now = exporter.now
+        parallel_archive = zipfile.ZipFile(
+            io.BytesIO(b"".join(parallel_exporter.iter_zip()))
+        )
+
+        self.assertIsNone(parallel_archive.testzip())
+        self.assertEqual(parallel_archive.namelist(), archive.namelist())
+        for name in archive.namelist():
+            self.assertEqual(
+                parallel_archive.getinfo(name).compress_type, zipfile.ZIP_STORED
+            )
+            self.assertTrue(
+                columnar.pyarrow.parquet.read_table(
+                    io.BytesIO(parallel_archive.read(name))
+                ).equals(
+                    columnar.pyarrow.parquet.read_table(io.BytesIO(archive.read(name)))
+                )
+            )
@@ -1,4 +1,7 @@
+import hashlib
+
 from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
 from django.utils import timezone
 
@@ -103,6 +106,47 @@ class ExperimentTest(TestCase):
             experiment.modules.select_subclasses().first(), module  # type: ignore
         )
 
+    def test_asset_hashes(self) -> None:
+        experiment = ExperimentFactory(
+            us=SimpleUploadedFile("us.wav", b"us content"),
+            csa=SimpleUploadedFile("csa.png", b"csa content"),
+        )
+
+        self.assertEqual(
+            experiment.asset_hashes,
+            {
+                "us": {
+                    "name": experiment.us.name,
+                    "sha256": hashlib.sha256(b"us content").hexdigest(),
+                },
+                "csa": {
+                    "name": experiment.csa.name,
+                    "sha256": hashlib.sha256(b"csa content").hexdigest(),
+                },
+            },
+        )
+        experiment.refresh_from_db()
+        self.assertEqual(set(experiment.asset_hashes), {"us", "csa"})
+
+        # Replace one asset and remove the other
+        experiment.us = SimpleUploadedFile("us.wav", b"new us content")
+        experiment.csa = None
+        experiment.save()
+        experiment.refresh_from_db()
+
+        self.assertEqual(
+            experiment.asset_hashes,
+            {
+                "us": {
+                    "name": experiment.us.name,
+                    "sha256": hashlib.sha256(b"new us content").hexdigest(),
+                },
+            },
+        )
+
+        # Unchanged assets aren't hashed again
+        self.assertFalse(experiment.update_asset_hashes())
+
 
 class ParticipantTest(TestCase):
     def test_model(self) -> None:
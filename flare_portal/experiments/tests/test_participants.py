@@ -0,0 +1,126 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import participants
+from ..factories import ExperimentFactory, ParticipantFactory
+from ..forms import ParticipantBatchForm
+from ..models import Participant
+from ..participants import BloomFilter, get_participants, participant_id_may_exist
+
+LOCAL_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class BloomFilterTest(TestCase):
+    def test_filter(self) -> None:
+        bloom_filter = BloomFilter(1000, 0.01)
+        values = [f"EXAMPLE.{i}" for i in range(1000)]
+
+        for value in values:
+            bloom_filter.add(value)
+
+        self.assertTrue(all(value in bloom_filter for value in values))
+        false_positives = sum(f"OTHER.{i}" in bloom_filter for i in range(10000))
+        self.assertLess(false_positives, 200)
+
+
+@override_settings(
+    API_PARTICIPANT_FILTER=True,
+    API_PARTICIPANT_CACHE_TIMEOUT=60,
+    CACHES=LOCAL_CACHES,
+)
+class ParticipantLookupTest(TestCase):
+    def setUp(self) -> None:
+        participants.clear_participant_caches()
+        self.experiment = ExperimentFactory()
+        # A fixed ID, as the unknown IDs below could be false positives for
+        # some of the generated ones
+        self.participant: Participant = ParticipantFactory(
+            experiment=self.experiment, participant_id="EXAMPLE.1"
+        )
+
+    def tearDown(self) -> None:
+        participants.clear_participant_caches()
+
+    def test_participant_id_may_exist(self) -> None:
+        self.assertTrue(participant_id_may_exist(self.participant.participant_id))
+
+        with self.assertNumQueries(0):
+            self.assertFalse(participant_id_may_exist("UNKNOWN"))
+            self.assertTrue(participant_id_may_exist(self.participant.participant_id))
+
+    def test_created_participant(self) -> None:
+        self.assertFalse(participant_id_may_exist("NEW"))
+
+        ParticipantFactory(experiment=self.experiment, participant_id="NEW")
+
+        self.assertTrue(participant_id_may_exist("NEW"))
+
+    def test_changed_participant_id(self) -> None:
+        self.assertFalse(participant_id_may_exist("CHANGED"))
+
+        self.participant.participant_id = "CHANGED"
+        self.participant.save()
+
+        self.assertTrue(participant_id_may_exist("CHANGED"))
+
+    def test_bulk_created_participants(self) -> None:
+        self.assertTrue(participant_id_may_exist(self.participant.participant_id))
+
+        form = ParticipantBatchForm({"participant_count": 5})
+        form.save(experiment=self.experiment)
+
+        for participant in self.experiment.participants.all():
+            self.assertTrue(participant_id_may_exist(participant.participant_id))
+
+    def test_get_participants(self) -> None:
+        participant_id = self.participant.participant_id
+        participant_id_may_exist(participant_id)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                get_participants([participant_id, "UNKNOWN"]),
+                {participant_id: self.participant},
+            )
+
+        with self.assertNumQueries(0):
+            participant = get_participants([participant_id])[participant_id]
+            self.assertEqual(participant.experiment, self.experiment)
+
+    @override_settings(API_PARTICIPANT_FILTER=False)
+    def test_filter_disabled(self) -> None:
+        self.assertTrue(participant_id_may_exist("UNKNOWN"))
+
+    def test_api(self) -> None:
+        participant_id_may_exist(self.participant.participant_id)
+
+        with self.assertNumQueries(0):
+            resp = self.client.post(
+                reverse("api:tracking"),
+                {"participant": "UNKNOWN"},
+                content_type="application/json",
+            )
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(
+            resp.json(),
+            {
+                "participant": [
+                    "Select a valid choice. That choice is not one of the "
+                    "available choices."
+                ]
+            },
+        )
+
+        # Just the savepoint of the view's transaction
+        with self.assertNumQueries(2):
+            resp = self.client.post(
+                reverse("api:fear_conditioning_data"),
+                {"participant": "UNKNOWN"},
+                content_type="application/json",
+            )
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(
+            resp.json()["participant"],
+            ["Object with participant_id=UNKNOWN does not exist."],
+        )
@@ -0,0 +1,287 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from flare_portal.users.factories import UserFactory
+
+from .. import tracking
+from ..factories import (
+    ExperimentFactory,
+    FearConditioningModuleFactory,
+    ParticipantFactory,
+)
+from ..models import Participant
+from ..tracking import (
+    TrackingState,
+    apply_buffered_tracking,
+    flush_tracking_buffer,
+    get_tracking_buffer,
+)
+
+
+@override_settings(PARTICIPANT_TRACKING_BUFFER="local")
+class TrackingBufferTest(TestCase):
+    def setUp(self) -> None:
+        tracking._get_tracking_buffer.cache_clear()
+        self.buffer = get_tracking_buffer()
+
+        self.experiment = ExperimentFactory()
+        self.module = FearConditioningModuleFactory(experiment=self.experiment)
+        self.participant: Participant = ParticipantFactory(experiment=self.experiment)
+        self.updated_at = timezone.now().replace(microsecond=0)
+        self.state = TrackingState(
+            current_module_id=self.module.pk,
+            current_trial_index=3,
+            lock_reason="TIMEOUT",
+            updated_at=self.updated_at.isoformat(),
+        )
+
+    def tearDown(self) -> None:
+        tracking._get_tracking_buffer.cache_clear()
+
+    def test_apply_buffered_tracking(self) -> None:
+        other_participant = ParticipantFactory(experiment=self.experiment)
+        self.buffer.set(self.participant.pk, self.state)
+
+        with self.assertNumQueries(1):
+            apply_buffered_tracking([self.participant, other_participant])
+
+        self.assertEqual(self.participant.current_module_id, self.module.pk)
+        self.assertEqual(self.participant.current_trial_index, 3)
+        self.assertEqual(self.participant.lock_reason, "TIMEOUT")
+        self.assertEqual(self.participant.udpated_at, self.updated_at)
+        self.assertIsNone(other_participant.current_module)
+
+    def test_flush(self) -> None:
+        other_participant = ParticipantFactory(experiment=self.experiment)
+        deleted_module = FearConditioningModuleFactory(experiment=self.experiment)
+        self.buffer.set(self.participant.pk, self.state)
+        self.buffer.set(
+            other_participant.pk,
+            {**self.state, "current_module_id": deleted_module.pk},
+        )
+        deleted_module.delete()
+
+        with self.assertNumQueries(2):
+            self.assertEqual(flush_tracking_buffer(), 2)
+
+        self.participant.refresh_from_db()
+        self.assertEqual(self.participant.current_module_id, self.module.pk)
+        self.assertEqual(self.participant.current_trial_index, 3)
+        self.assertEqual(self.participant.lock_reason, "TIMEOUT")
+        self.assertEqual(self.participant.udpated_at, self.updated_at)
+
+        other_participant.refresh_from_db()
+        self.assertIsNone(other_participant.current_module_id)
+
+        self.assertEqual(self.buffer.get_many([self.participant.pk]), {})
+        self.assertEqual(flush_tracking_buffer(), 0)
+
+    def test_flush_skips_finished_participants(self) -> None:
+        self.buffer.set(self.participant.pk, self.state)
+        # The participant finishes after their state was buffered
+        Participant.objects.filter(pk=self.participant.pk).update(
+            finished_at=timezone.now()
+        )
+
+        flush_tracking_buffer()
+
+        self.participant.refresh_from_db()
+        self.assertIsNone(self.participant.current_module_id)
+        self.assertEqual(self.participant.lock_reason, "")
+        self.assertEqual(self.buffer.get_many([self.participant.pk]), {})
+
+    def test_compare_and_set(self) -> None:
+        new_state = {**self.state, "updated_at": timezone.now().isoformat()}
+
+        self.assertFalse(
+            self.buffer.compare_and_set(
+                self.participant.pk, self.state, self.state["updated_at"]
+            )
+        )
+        self.assertTrue(
+            self.buffer.compare_and_set(self.participant.pk, self.state, None)
+        )
+        self.assertFalse(
+            self.buffer.compare_and_set(self.participant.pk, new_state, None)
+        )
+        self.assertFalse(
+            self.buffer.compare_and_set(
+                self.participant.pk, new_state, new_state["updated_at"]
+            )
+        )
+        self.assertEqual(
+            self.buffer.get_many([self.participant.pk]),
+            {self.participant.pk: self.state},
+        )
+
+        self.assertTrue(
+            self.buffer.compare_and_set(
+                self.participant.pk, new_state, self.state["updated_at"]
+            )
+        )
+        self.assertEqual(
+            self.buffer.get_many([self.participant.pk]),
+            {self.participant.pk: new_state},
+        )
+
+    def test_participant_detail_view(self) -> None:
+        user = UserFactory()
+        user.grant_role("RESEARCHER")
+        user.save()
+        self.client.force_login(user)
+        self.experiment.project.owner = user
+        self.experiment.project.save()
+        self.buffer.set(self.participant.pk, self.state)
+
+        resp = self.client.get(
+            reverse(
+                "experiments:participant_detail",
+                kwargs={
+                    "project_pk": self.experiment.project_id,
+                    "experiment_pk": self.experiment.pk,
+                    "participant_pk": self.participant.pk,
+                },
+            )
+        )
+
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(resp.context["participant"].lock_reason, "TIMEOUT")
+        self.assertEqual(resp.context["participant"].current_trial_index, 3)
+
+
+@override_settings(PARTICIPANT_TRACKING_BUFFER="local")
+class TrackingAPITest(TestCase):
+    def setUp(self) -> None:
+        tracking._get_tracking_buffer.cache_clear()
+        self.buffer = get_tracking_buffer()
+        # Hold the flush lock so updates stay in the buffer
+        cache.set("tracking:flush-lock", True)
+        tracking._next_flush_at = float("inf")
+
+        self.experiment = ExperimentFactory()
+        self.module = FearConditioningModuleFactory(experiment=self.experiment)
+        self.participant: Participant = ParticipantFactory(
+            experiment=self.experiment, started_at=timezone.now()
+        )
+
+    def tearDown(self) -> None:
+        tracking._get_tracking_buffer.cache_clear()
+        cache.delete("tracking:flush-lock")
+        tracking._next_flush_at = 0
+
+    def post_tracking(self, **data: object) -> dict:
+        resp = self.client.post(
+            reverse("api:tracking"),
+            {"participant": self.participant.participant_id, **data},
+            content_type="application/json",
+        )
+        self.assertEqual(200, resp.status_code)
+        return resp.json()
+
+    def test_buffered_updates(self) -> None:
+        # Participant and module lookups only
+        with self.assertNumQueries(2):
+            self.post_tracking(module=self.module.pk, trial_index=1)
+
+        data = self.post_tracking(lock_reason="TIMEOUT")
+
+        # The update was applied on top of the buffered state
+        self.assertEqual(
+            data,
+            {
+                "participant": self.participant.participant_id,
+                "current_module": self.module.pk,
+                "current_trial": None,
+                "lock_reason": "TIMEOUT",
+            },
+        )
+
+        # Nothing has been written to the database yet
+        self.participant.refresh_from_db()
+        self.assertIsNone(self.participant.current_module)
+
+        flush_tracking_buffer()
+
+        self.participant.refresh_from_db()
+        self.assertEqual(self.participant.current_module_id, self.module.pk)
+        self.assertEqual(self.participant.lock_reason, "TIMEOUT")
+
+    def test_concurrent_updates(self) -> None:
+        self.post_tracking(module=self.module.pk, trial_index=1)
+        get_many = self.buffer.get_many
+
+        def get_many_then_update(pks: list) -> dict:
+            # Another request buffers an update after this one has read the
+            # buffered state
+            states = get_many(pks)
+            if get_many_mock.call_count == 1:
+                self.buffer.set(
+                    self.participant.pk,
+                    {
+                        **states[self.participant.pk],
+                        "lock_reason": "QUIT",
+                        "updated_at": timezone.now().isoformat(),
+                    },
+                )
+            return states
+
+        with mock.patch.object(
+            self.buffer, "get_many", side_effect=get_many_then_update
+        ) as get_many_mock:
+            data = self.post_tracking(trial_index=2)
+
+        # The update was applied again on top of the other one
+        self.assertEqual(get_many_mock.call_count, 2)
+        self.assertEqual(data["lock_reason"], "QUIT")
+        self.assertEqual(data["current_trial"], 2)
+
+    def test_periodic_flush(self) -> None:
+        cache.delete("tracking:flush-lock")
+        tracking._next_flush_at = 0
+
+        self.post_tracking(module=self.module.pk, trial_index=1)
+
+        self.participant.refresh_from_db()
+        self.assertEqual(self.participant.current_module_id, self.module.pk)
+        self.assertEqual(self.participant.current_trial_index, 1)
+
+    def test_periodic_flush_failure(self) -> None:
+        cache.delete("tracking:flush-lock")
+        tracking._next_flush_at = 0
+
+        with mock.patch.object(
+            QuerySet, "bulk_update", side_effect=DatabaseError("Lock timeout")
+        ), self.assertLogs("flare_portal.experiments.tracking", "ERROR"):
+            data = self.post_tracking(module=self.module.pk, trial_index=1)
+
+        # The participant's update is kept in the buffer
+        self.assertEqual(data["current_trial"], 1)
+        self.assertEqual(
+            self.buffer.get_many([self.participant.pk])[self.participant.pk][
+                "current_trial_index"
+            ],
+            1,
+        )
+
+    def test_submission_clears_buffer(self) -> None:
+        self.post_tracking(module=self.module.pk, trial_index=1, lock_reason="QUIT")
+
+        resp = self.client.post(
+            reverse("api:submission"),
+            {"participant": self.participant.participant_id},
+            content_type="application/json",
+        )
+        self.assertEqual(200, resp.status_code)
+
+        self.assertEqual(self.buffer.get_many([self.participant.pk]), {})
+
+        self.participant.refresh_from_db()
+        self.assertIsNone(self.participant.current_module)
+        self.assertEqual(self.participant.lock_reason, "QUIT")
+        self.assertIsNotNone(self.participant.finished_at)
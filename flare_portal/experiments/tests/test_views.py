@@ -1,5 +1,7 @@
 import csv
 import io
+import tempfile
+import zipfile
 from typing import Any, Dict, List
 
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -12,6 +14,7 @@ from rest_framework.test import APITestCase
 from flare_portal.users.factories import UserFactory
 from flare_portal.users.models import User
 
+from ..export_jobs import run_export_jobs
 from ..factories import (
     BreakStartModuleFactory,
     ExperimentFactory,
@@ -26,6 +29,7 @@ from ..models import (
     BreakStartModule,
     CriterionModule,
     Experiment,
+    ExportJob,
     FearConditioningData,
     FearConditioningModule,
     Participant,
@@ -1214,7 +1218,7 @@ class ParticipantFormSetViewTest(TestCase):
 
         self.assertRedirects(resp, url)
 
-        result = experiment.participants.all()
+        result = experiment.participants.order_by("pk")
 
         self.assertEqual(3, len(result))
         self.assertEqual(result[0].participant_id, participants[0].participant_id)
@@ -1543,19 +1547,149 @@ class ExportViewTest(TestCase):
 
         self.assertEqual(200, resp.status_code)
 
+    def test_post(self) -> None:
+        url = reverse(
+            "experiments:export",
+            kwargs={"project_pk": self.project.pk, "experiment_pk": self.experiment.pk},
+        )
+
+        resp = self.client.post(url)
+
+        self.assertRedirects(resp, url)
+        job = self.experiment.export_jobs.get()
+        self.assertEqual(job.status, ExportJob.STATUS.queued)
+        self.assertEqual(job.requested_by, self.user)
+
+        resp = self.client.get(url)
+        self.assertContains(resp, "Export queued")
+
+        # Exporting again before the data changes reuses the job
+        self.client.post(url)
+        self.assertEqual(self.experiment.export_jobs.count(), 1)
+
+    def test_post_incremental(self) -> None:
+        url = reverse(
+            "experiments:export",
+            kwargs={"project_pk": self.project.pk, "experiment_pk": self.experiment.pk},
+        )
+
+        resp = self.client.post(url, {"incremental": "1"})
+
+        self.assertRedirects(resp, url)
+        job = self.experiment.export_jobs.get()
+        self.assertTrue(job.is_incremental)
+        self.assertEqual(job.cursor.user, self.user)
+
+        resp = self.client.get(url)
+        self.assertEqual(resp.context["incremental_jobs"], [job])
+        self.assertIsNone(resp.context["export_job"])
+
+    def test_post_unknown_file_format(self) -> None:
+        url = reverse(
+            "experiments:export",
+            kwargs={"project_pk": self.project.pk, "experiment_pk": self.experiment.pk},
+        )
+
+        resp = self.client.post(url, {"file_format": "xlsx"}, follow=True)
+
+        self.assertRedirects(resp, url)
+        self.assertFalse(self.experiment.export_jobs.exists())
+        self.assertEqual(
+            str(list(resp.context["messages"])[0]),
+            "Exports can't be generated in that format.",
+        )
+
     def test_download(self) -> None:
         url = reverse(
-            "experiments:export_download",
+            "experiments:export",
             kwargs={"project_pk": self.project.pk, "experiment_pk": self.experiment.pk},
         )
 
+        with tempfile.TemporaryDirectory() as media_dir, self.settings(
+            MEDIA_ROOT=media_dir
+        ):
+            with freeze_time("20210101T1200"):
+                self.client.post(url)
+                run_export_jobs()
+
+            job = self.experiment.export_jobs.get()
+            resp = self.client.get(url)
+            download_url = reverse(
+                "experiments:export_download",
+                kwargs={
+                    "project_pk": self.project.pk,
+                    "experiment_pk": self.experiment.pk,
+                    "job_pk": job.pk,
+                },
+            )
+            self.assertContains(resp, download_url)
+
+            resp = self.client.get(download_url)
+
+            self.assertEqual(200, resp.status_code)
+            self.assertEqual(resp["Content-Type"], "application/zip")
+            self.assertEqual(
+                resp.get("Content-Disposition"),
+                'attachment; filename="DEMO1-20210101T120000Z.zip"',
+            )
+
+            archive = zipfile.ZipFile(io.BytesIO(b"".join(resp.streaming_content)))
+            self.assertIn("DEMO1-20210101T120000Z-participants.csv", archive.namelist())
+
+    def test_stream(self) -> None:
+        url = reverse(
+            "experiments:export_stream",
+            kwargs={"project_pk": self.project.pk, "experiment_pk": self.experiment.pk},
+        )
+
+        resp = self.client.get(
+            reverse(
+                "experiments:export",
+                kwargs={
+                    "project_pk": self.project.pk,
+                    "experiment_pk": self.experiment.pk,
+                },
+            )
+        )
+        self.assertContains(resp, url)
+
         with freeze_time("20210101T1200"):
             resp = self.client.get(url)
 
-        # Not actually checking the contents of the zip because it's hard to
-        # test
         self.assertEqual(200, resp.status_code)
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp["Content-Type"], "application/zip")
         self.assertEqual(
             resp.get("Content-Disposition"),
             "attachment; filename=DEMO1-20210101T120000Z.zip",
         )
+
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(resp.streaming_content)))
+        self.assertIn("DEMO1-20210101T120000Z-participants.csv", archive.namelist())
+
+        # No job is queued
+        self.assertFalse(self.experiment.export_jobs.exists())
+
+        resp = self.client.get(url, {"file_format": "xlsx"})
+        self.assertEqual(404, resp.status_code)
+
+    def test_download_other_experiment(self) -> None:
+        other_experiment = ExperimentFactory(project=self.project)
+        job = ExportJob.objects.create(
+            experiment=other_experiment,
+            status=ExportJob.STATUS.finished,
+            archive="exports/example.zip",
+        )
+
+        resp = self.client.get(
+            reverse(
+                "experiments:export_download",
+                kwargs={
+                    "project_pk": self.project.pk,
+                    "experiment_pk": self.experiment.pk,
+                    "job_pk": job.pk,
+                },
+            )
+        )
+
+        self.assertEqual(404, resp.status_code)
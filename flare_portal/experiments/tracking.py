@@ -0,0 +1,317 @@
+"""
+Buffering of participant progress updates
+
+The app reports the participant's current module, trial and lock reason to the
+tracking API many times per session. Rather than writing each update to the
+database, the latest state of each participant is kept in a buffer, which is
+flushed to the database in batches. Portal views merge the buffered state into
+the participants they display.
+"""
+import json
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, TypedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import BaseModule, Participant
+
+logger = logging.getLogger(__name__)
+
+TrackingState = TypedDict(
+    "TrackingState",
+    {
+        "current_module_id": Optional[int],
+        "current_trial_index": Optional[int],
+        "lock_reason": str,
+        "updated_at": str,
+    },
+)
+
+TRACKING_FIELDS = ["current_module", "current_trial_index", "lock_reason", "udpated_at"]
+
+
+class TrackingBuffer:
+    """Holds the latest tracking state of participants, keyed by their pk"""
+
+    def get_many(self, pks: Iterable[int]) -> Dict[int, TrackingState]:
+        raise NotImplementedError()
+
+    def set(self, pk: int, state: TrackingState) -> None:
+        raise NotImplementedError()
+
+    def compare_and_set(
+        self, pk: int, state: TrackingState, updated_at: Optional[str]
+    ) -> bool:
+        """
+        Sets the participant's state if the buffered one was updated at
+        updated_at, or if there's none when updated_at is None, and returns
+        whether it was set
+        """
+        raise NotImplementedError()
+
+    def delete(self, pk: int) -> None:
+        raise NotImplementedError()
+
+    def pop_all(self) -> Dict[int, TrackingState]:
+        """Removes and returns the state of all participants"""
+        raise NotImplementedError()
+
+    def restore(self, states: Dict[int, TrackingState]) -> None:
+        """
+        Puts states back into the buffer after a failed flush, unless they
+        have been superseded in the meantime
+        """
+        raise NotImplementedError()
+
+
+class LocalTrackingBuffer(TrackingBuffer):
+    """
+    Buffers updates in the current process. Only suitable when the site is
+    served by a single process, like in development and tests.
+    """
+
+    def __init__(self) -> None:
+        self.states: Dict[int, TrackingState] = {}
+        self.lock = threading.Lock()
+
+    def get_many(self, pks: Iterable[int]) -> Dict[int, TrackingState]:
+        with self.lock:
+            return {pk: self.states[pk] for pk in pks if pk in self.states}
+
+    def set(self, pk: int, state: TrackingState) -> None:
+        with self.lock:
+            self.states[pk] = state
+
+    def compare_and_set(
+        self, pk: int, state: TrackingState, updated_at: Optional[str]
+    ) -> bool:
+        with self.lock:
+            current = self.states.get(pk)
+            if (current and current["updated_at"]) != updated_at:
+                return False
+
+            self.states[pk] = state
+            return True
+
+    def delete(self, pk: int) -> None:
+        with self.lock:
+            self.states.pop(pk, None)
+
+    def pop_all(self) -> Dict[int, TrackingState]:
+        with self.lock:
+            states, self.states = self.states, {}
+            return states
+
+    def restore(self, states: Dict[int, TrackingState]) -> None:
+        with self.lock:
+            self.states = {**states, **self.states}
+
+
+class RedisTrackingBuffer(TrackingBuffer):
+    """Buffers updates in a hash in the Redis instance used for the cache"""
+
+    key = "tracking:participants"
+
+    # Compares the buffered state's updated_at (ARGV[3], empty if there
+    # shouldn't be one) and sets the new state in a single step
+    compare_and_set_script = """
+    local current = redis.call("HGET", KEYS[1], ARGV[1])
+    local updated_at = ""
+    if current then
+        updated_at = cjson.decode(current)["updated_at"]
+    end
+    if updated_at ~= ARGV[3] then
+        return 0
+    end
+    redis.call("HSET", KEYS[1], ARGV[1], ARGV[2])
+    return 1
+    """
+
+    def __init__(self) -> None:
+        from django_redis import get_redis_connection
+
+        self.client = get_redis_connection("default")
+        self.compare_and_set_command = self.client.register_script(
+            self.compare_and_set_script
+        )
+
+    def get_many(self, pks: Iterable[int]) -> Dict[int, TrackingState]:
+        pks = list(pks)
+        if not pks:
+            return {}
+
+        return {
+            pk: json.loads(value)
+            for pk, value in zip(pks, self.client.hmget(self.key, pks))
+            if value is not None
+        }
+
+    def set(self, pk: int, state: TrackingState) -> None:
+        self.client.hset(self.key, pk, json.dumps(state))
+
+    def compare_and_set(
+        self, pk: int, state: TrackingState, updated_at: Optional[str]
+    ) -> bool:
+        return bool(
+            self.compare_and_set_command(
+                keys=[self.key], args=[pk, json.dumps(state), updated_at or ""]
+            )
+        )
+
+    def delete(self, pk: int) -> None:
+        self.client.hdel(self.key, pk)
+
+    def pop_all(self) -> Dict[int, TrackingState]:
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.hgetall(self.key)
+        pipeline.delete(self.key)
+        states, _ = pipeline.execute()
+
+        return {int(pk): json.loads(value) for pk, value in states.items()}
+
+    def restore(self, states: Dict[int, TrackingState]) -> None:
+        pipeline = self.client.pipeline(transaction=True)
+        for pk, state in states.items():
+            pipeline.hsetnx(self.key, pk, json.dumps(state))
+        pipeline.execute()
+
+
+BUFFER_CLASSES = {
+    "local": LocalTrackingBuffer,
+    "redis": RedisTrackingBuffer,
+}
+
+
+@lru_cache(maxsize=None)
+def _get_tracking_buffer(backend: str) -> TrackingBuffer:
+    return BUFFER_CLASSES[backend]()
+
+
+def get_tracking_buffer() -> Optional[TrackingBuffer]:
+    """
+    Returns the configured tracking buffer, or None if tracking updates are
+    written to the database straight away
+    """
+    if not settings.PARTICIPANT_TRACKING_BUFFER:
+        return None
+
+    return _get_tracking_buffer(settings.PARTICIPANT_TRACKING_BUFFER)
+
+
+def get_tracking_state(participant: Participant) -> TrackingState:
+    return TrackingState(
+        current_module_id=participant.current_module_id,
+        current_trial_index=participant.current_trial_index,
+        lock_reason=participant.lock_reason,
+        updated_at=participant.udpated_at.isoformat(),
+    )
+
+
+def apply_buffered_tracking(participants: List[Participant]) -> None:
+    """Updates the participants with their buffered tracking state"""
+    buffer = get_tracking_buffer()
+    if buffer is None:
+        return
+
+    states = buffer.get_many(participant.pk for participant in participants)
+    if not states:
+        return
+
+    modules = BaseModule.objects.in_bulk(
+        {state["current_module_id"] for state in states.values()} - {None}
+    )
+
+    for participant in participants:
+        if state := states.get(participant.pk):
+            participant.current_module = modules.get(state["current_module_id"])
+            participant.current_trial_index = state["current_trial_index"]
+            participant.lock_reason = state["lock_reason"]
+            participant.udpated_at = parse_datetime(state["updated_at"])
+
+
+def flush_tracking_buffer() -> int:
+    """
+    Writes the buffered tracking state to the database
+
+    Participants that have finished are left as they are, as their state is
+    reset when they finish, and may have been buffered before that. Returns
+    the number of participants in the buffer.
+    """
+    buffer = get_tracking_buffer()
+    if buffer is None:
+        return 0
+
+    states = buffer.pop_all()
+    if not states:
+        return 0
+
+    try:
+        # Modules may have been deleted since the updates were buffered
+        module_ids = set(
+            BaseModule.objects.filter(
+                pk__in={state["current_module_id"] for state in states.values()}
+            ).values_list("pk", flat=True)
+        )
+
+        # The condition is part of the UPDATE, so it also skips participants
+        # that finish while the buffer is flushed
+        Participant.objects.filter(finished_at__isnull=True).bulk_update(
+            [
+                Participant(
+                    pk=pk,
+                    current_module_id=state["current_module_id"]
+                    if state["current_module_id"] in module_ids
+                    else None,
+                    current_trial_index=state["current_trial_index"],
+                    lock_reason=state["lock_reason"],
+                    # auto_now isn't applied by bulk_update
+                    udpated_at=parse_datetime(state["updated_at"]),
+                )
+                for pk, state in states.items()
+            ],
+            TRACKING_FIELDS,
+            batch_size=500,
+        )
+    except Exception:
+        buffer.restore(states)
+        raise
+
+    return len(states)
+
+
+_next_flush_at = 0.0
+
+
+def maybe_flush_tracking_buffer() -> None:
+    """
+    Flushes the tracking buffer if it hasn't been flushed (by any process)
+    in the last PARTICIPANT_TRACKING_FLUSH_INTERVAL seconds
+
+    This runs within a participant's request, whose own update is already
+    buffered, so failures are logged rather than failing the request. The
+    buffer is restored, and flushed again later.
+    """
+    global _next_flush_at
+
+    interval = settings.PARTICIPANT_TRACKING_FLUSH_INTERVAL
+    now = time.monotonic()
+
+    # Avoid hitting the cache on every update
+    if now < _next_flush_at:
+        return
+
+    _next_flush_at = now + interval
+
+    if cache.add("tracking:flush-lock", True, interval):
+        try:
+            # A savepoint, so a failure doesn't break the request's transaction
+            with transaction.atomic():
+                flush_tracking_buffer()
+        except Exception:
+            logger.exception("Flushing the participant tracking buffer failed")
@@ -54,10 +54,16 @@ project_urlpatterns = [
         name="export",
     ),
     path(
-        "projects/<int:project_pk>/experiments/<int:experiment_pk>/export/download/",
+        "projects/<int:project_pk>/experiments/<int:experiment_pk>/export/"
+        "<int:job_pk>/download/",
         views.export_download_view,
         name="export_download",
     ),
+    path(
+        "projects/<int:project_pk>/experiments/<int:experiment_pk>/export/stream/",
+        views.export_stream_view,
+        name="export_stream",
+    ),
     path(
         "projects/<int:project_pk>/experiments/<int:experiment_pk>/sort-modules/",
         views.module_sort_view,
@@ -1,3 +1,4 @@
+import tempfile
 from itertools import combinations
 from typing import Any, Dict
 
@@ -5,9 +6,16 @@ from django import forms
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIRequest
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.db.models import QuerySet
-from django.http import HttpRequest, HttpResponse
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpRequest,
+    HttpResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect
 from django.template.defaultfilters import pluralize
 from django.urls import reverse, reverse_lazy
@@ -19,6 +27,8 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from . import columnar
+from .export_jobs import INCREMENTAL_EXPORTS_KEPT, queue_export
 from .exports import ZipExporter
 from .forms import (
     ExperimentCreateForm,
@@ -31,7 +41,8 @@ from .forms import (
     ProjectResearcherAddForm,
     ProjectResearcherDeleteForm,
 )
-from .models import BreakEndModule, Experiment, Participant, Project
+from .models import BreakEndModule, Experiment, ExportJob, Participant, Project
+from .tracking import apply_buffered_tracking, flush_tracking_buffer
 
 
 class ProjectListView(ListView):
@@ -114,7 +125,7 @@ class ExperimentListView(ListView):
         return super().dispatch(*args, **kwargs)
 
     def get_queryset(self) -> QuerySet[Experiment]:
-        return Experiment.objects.filter(project=self.project)
+        return Experiment.objects.filter(project=self.project).order_by("pk")
 
     def get_context_data(self, **kwargs: Any) -> dict:
         context = super().get_context_data(**kwargs)
@@ -513,6 +524,7 @@ class ParticipantDetailView(DetailView):
 
     def get_context_data(self, **kwargs: Any) -> dict:
         context = super().get_context_data(**kwargs)
+        apply_buffered_tracking([self.participant])
         context["participant"] = self.participant
         context["experiment"] = self.experiment
         return context
@@ -572,6 +584,7 @@ class ParticipantFormSetView(FormView):
     def get_context_data(self, **kwargs: Any) -> dict:
         context = super().get_context_data(**kwargs)
         context["experiment"] = self.experiment
+        apply_buffered_tracking([form.instance for form in context["form"].forms])
 
         # pagination extra context
         num_pages = self.paginator_page.paginator.num_pages
@@ -722,6 +735,14 @@ class ModuleSortView(APIView):
 module_sort_view = ModuleSortView.as_view()
 
 
+def get_export_file_formats() -> Dict[str, str]:
+    """Returns the formats exports can be made in"""
+    file_formats = dict(ExportJob.FILE_FORMATS)
+    if columnar.pyarrow is None:
+        del file_formats[ExportJob.FILE_FORMATS.parquet]
+    return file_formats
+
+
 class ExportView(DetailView):
     context_object_name = "experiment"
     pk_url_kwarg = "experiment_pk"
@@ -729,24 +750,116 @@ class ExportView(DetailView):
     object: Experiment
     template_name = "experiments/export.html"
 
+    def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
+        context = super().get_context_data(**kwargs)
+        context["export_job"] = (
+            self.object.export_jobs.filter(cursor__isnull=True)
+            .order_by("-created_at")
+            .first()
+        )
+        context["incremental_jobs"] = list(
+            self.object.export_jobs.filter(cursor__user=self.request.user).order_by(
+                "-created_at"
+            )[:INCREMENTAL_EXPORTS_KEPT]
+        )
+        jobs = [context["export_job"], *context["incremental_jobs"]]
+        context["is_pending"] = any(job and job.is_pending for job in jobs)
+        context["file_formats"] = self.get_file_formats()
+        return context
+
+    def get_file_formats(self) -> Dict[str, str]:
+        return get_export_file_formats()
+
+    def post(self, request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+        self.object = self.get_object()
+        file_format = request.POST.get("file_format", ExportJob.FILE_FORMATS.csv)
+
+        if file_format not in self.get_file_formats():
+            messages.error(request, "Exports can't be generated in that format.")
+        else:
+            job, created = queue_export(
+                self.object,
+                request.user,
+                incremental="incremental" in request.POST,
+                file_format=file_format,
+            )
+
+            if not created and job.status == ExportJob.STATUS.finished:
+                messages.info(
+                    request,
+                    "No data has changed since the last export was generated.",
+                )
+
+        return redirect(
+            "experiments:export",
+            project_pk=self.object.project_id,
+            experiment_pk=self.object.pk,
+        )
+
 
 export_view = ExportView.as_view()
 
 
 class ExportDownloadView(View):
+    def get(
+        self, request: HttpRequest, project_pk: int, experiment_pk: int, job_pk: int
+    ) -> FileResponse:
+        job = get_object_or_404(
+            ExportJob.objects.exclude(archive=""),
+            pk=job_pk,
+            experiment_id=experiment_pk,
+            experiment__project_id=project_pk,
+            status=ExportJob.STATUS.finished,
+        )
+
+        return FileResponse(
+            job.archive.open("rb"),
+            as_attachment=True,
+            filename=job.get_archive_filename(),
+            content_type="application/zip",
+        )
+
+
+export_download_view = ExportDownloadView.as_view()
+
+
+class ExportStreamView(View):
     def get(
         self, request: HttpRequest, project_pk: int, experiment_pk: int
-    ) -> HttpResponse:
-        experiment = get_object_or_404(Experiment, pk=experiment_pk)
+    ) -> StreamingHttpResponse:
+        """
+        Streams an archive of the current data as it's generated, without
+        queueing a job
+
+        Django 3.2 iterates streaming responses in the event loop when served
+        with ASGI, where the database can't be used, so the archive is written
+        to a temporary file first instead.
+        """
+        experiment = get_object_or_404(
+            Experiment, pk=experiment_pk, project_id=project_pk
+        )
+        file_format = request.GET.get("file_format", ExportJob.FILE_FORMATS.csv)
+
+        if file_format not in get_export_file_formats():
+            raise Http404("Exports can't be generated in that format.")
 
-        response = HttpResponse()
+        # Export the latest progress of all participants
+        flush_tracking_buffer()
+        exporter = ZipExporter(experiment, file_format=file_format)
+        filename = exporter.get_filename()
 
-        exporter = ZipExporter(experiment)
-        filename = exporter.write(response)  # type: ignore
+        if isinstance(request, ASGIRequest):
+            file = tempfile.TemporaryFile()
+            exporter.write(file)
+            file.seek(0)
+            response: StreamingHttpResponse = FileResponse(file)
+        else:
+            response = StreamingHttpResponse(exporter.iter_zip())
 
+        response["Content-Type"] = "application/zip"
         response["Content-Disposition"] = f"attachment; filename={filename}"
 
         return response
 
 
-export_download_view = ExportDownloadView.as_view()
+export_stream_view = ExportStreamView.as_view()
@@ -0,0 +1,119 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import connection
+from django.utils import timezone
+
+from flare_portal.api.forms import VoucherForm, VoucherPoolEmpty
+from flare_portal.experiments.models import Experiment, Participant, Project
+from flare_portal.experiments.participants import invalidate_participant_ids
+from flare_portal.reimbursement.models import Voucher, VoucherPool
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Claims vouchers from a single pool in parallel and reports the claim "
+        "throughput. The data used is created and deleted by the command."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--vouchers", type=int, default=1000)
+        parser.add_argument(
+            "--participants",
+            type=int,
+            help="Defaults to the number of vouchers",
+        )
+        parser.add_argument("--threads", type=int, default=16)
+
+    def handle(
+        self,
+        *args: Any,
+        vouchers: int,
+        participants: Optional[int],
+        threads: int,
+        **options: Any,
+    ) -> None:
+        participants = vouchers if participants is None else participants
+        suffix = uuid.uuid4().hex[:6]
+
+        user = User.objects.create(username=f"benchmark-{suffix}")
+        project = Project.objects.create(name=f"Benchmark {suffix}", owner=user)
+        pool = VoucherPool.objects.create(name=f"Benchmark {suffix}")
+        experiment = Experiment.objects.create(
+            name=f"Benchmark {suffix}",
+            code=suffix,
+            owner=user,
+            project=project,
+            trial_length=1,
+            voucher_pool=pool,
+        )
+
+        try:
+            Voucher.objects.bulk_create(
+                Voucher(code=f"voucher-{i}", pool=pool) for i in range(vouchers)
+            )
+            now = timezone.now()
+            participant_ids = [
+                participant.participant_id
+                for participant in Participant.objects.bulk_create(
+                    Participant(
+                        participant_id=f"{suffix}.{i}",
+                        experiment=experiment,
+                        started_at=now,
+                        finished_at=now,
+                    )
+                    for i in range(participants)
+                )
+            ]
+            invalidate_participant_ids()
+
+            claimed = 0
+            claimed_lock = threading.Lock()
+
+            def claim(participant_id: str) -> None:
+                nonlocal claimed
+
+                form = VoucherForm({"participant": participant_id})
+                try:
+                    if not form.is_valid():
+                        raise ValueError(form.errors)
+                    form.save()
+                except VoucherPoolEmpty:
+                    return
+                finally:
+                    connection.close()
+
+                with claimed_lock:
+                    claimed += 1
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                list(executor.map(claim, participant_ids))
+            elapsed = time.perf_counter() - started
+
+            assigned = pool.vouchers.filter(participant__isnull=False).count()
+            if assigned != claimed or claimed != min(vouchers, participants):
+                self.stderr.write(
+                    f"{claimed} claims succeeded but {assigned} vouchers were "
+                    "assigned"
+                )
+
+            self.stdout.write(
+                f"{claimed} vouchers claimed by {participants} participants with "
+                f"{threads} threads in {elapsed:.2f}s "
+                f"({participants / elapsed:.0f} claims/s)"
+            )
+        finally:
+            pool.vouchers.all().delete()
+            experiment.participants.all().delete()
+            experiment.delete()
+            project.delete()
+            pool.delete()
+            user.delete()
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-17 07:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reimbursement', '0003_voucher_code_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='voucher',
+            index=models.Index(condition=models.Q(('participant__isnull', True)), fields=['pool', 'id'], name='voucher_unassigned_idx'),
+        ),
+    ]
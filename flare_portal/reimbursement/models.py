@@ -22,6 +22,14 @@ class Voucher(models.Model):
             "code",
             "pool",
         )
+        indexes = [
+            # Used to claim the next unassigned voucher in a pool
+            models.Index(
+                fields=["pool", "id"],
+                condition=models.Q(participant__isnull=True),
+                name="voucher_unassigned_idx",
+            )
+        ]
 
     def __str__(self) -> str:
         return self.code
@@ -80,7 +80,7 @@ MIDDLEWARE = [
     # According to the official documentation it should be listed underneath
     # SecurityMiddleware.
     # http://whitenoise.evans.io/en/stable/#quickstart-for-django-apps
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "flare_portal.utils.middleware.AsyncWhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -165,6 +165,76 @@ else:
     }
 
 
+# Compiled configuration API payloads are cached per experiment config
+# version, so the timeout only controls how long unused payloads are kept.
+API_CONFIGURATION_CACHE_TIMEOUT = int(
+    env.get("API_CONFIGURATION_CACHE_TIMEOUT", 60 * 60)
+)
+# Maximum number of payloads kept in each process on top of the cache above
+API_CONFIGURATION_LOCAL_CACHE_SIZE = int(
+    env.get("API_CONFIGURATION_LOCAL_CACHE_SIZE", 100)
+)
+# Maximum number of experiments whose modules and criterion questions are
+# indexed in each process, to resolve the data API's foreign keys
+API_EXPERIMENT_INDEX_CACHE_SIZE = int(env.get("API_EXPERIMENT_INDEX_CACHE_SIZE", 100))
+# How long asset URLs and hashes are cached for. When S3 URLs are signed, they
+# are also refreshed while they're still valid for at least
+# API_ASSET_URL_MIN_VALIDITY seconds.
+API_ASSET_MANIFEST_CACHE_TIMEOUT = int(
+    env.get("API_ASSET_MANIFEST_CACHE_TIMEOUT", 60 * 60)
+)
+API_ASSET_URL_MIN_VALIDITY = int(env.get("API_ASSET_URL_MIN_VALIDITY", 60 * 10))
+# Asset bundles are built when the assets change, or by the build_asset_bundles
+# command. Replaced bundles are kept for this many seconds, so downloads in
+# progress can finish.
+ASSET_BUNDLE_GRACE_PERIOD = int(env.get("ASSET_BUNDLE_GRACE_PERIOD", 60 * 60))
+# Progress updates from the tracking API are buffered and written to the
+# database in batches, every PARTICIPANT_TRACKING_FLUSH_INTERVAL seconds or
+# when the flush_participant_tracking command is run. The "redis" buffer uses
+# the Redis cache instance. Updates are written straight away when this is
+# empty. The "local" buffer is only suitable for a single process.
+PARTICIPANT_TRACKING_BUFFER = env.get(
+    "PARTICIPANT_TRACKING_BUFFER", "redis" if "REDIS_URL" in env else ""
+)
+PARTICIPANT_TRACKING_FLUSH_INTERVAL = int(
+    env.get("PARTICIPANT_TRACKING_FLUSH_INTERVAL", 10)
+)
+# Run the participant API views in a thread pool, so a process can serve many
+# participants at once. Only for use under ASGI, where flare_portal.asgi sets
+# this by default.
+API_ASYNC_VIEWS = env.get("API_ASYNC_VIEWS", "false").lower() == "true"
+# How long responses to data submissions with an Idempotency-Key header are
+# kept for replaying
+API_IDEMPOTENCY_KEY_TIMEOUT = int(env.get("API_IDEMPOTENCY_KEY_TIMEOUT", 60 * 60 * 24))
+# Unknown participant IDs are rejected using a Bloom filter of the valid ones
+# in each process, with the given false positive rate, which is rebuilt at
+# least every API_PARTICIPANT_FILTER_MAX_AGE seconds. The filters are kept up
+# to date through the cache, so it's only used with Redis by default.
+API_PARTICIPANT_FILTER = (
+    env.get("API_PARTICIPANT_FILTER", "true" if "REDIS_URL" in env else "false")
+).lower() == "true"
+API_PARTICIPANT_FILTER_ERROR_RATE = float(
+    env.get("API_PARTICIPANT_FILTER_ERROR_RATE", 0.01)
+)
+API_PARTICIPANT_FILTER_MAX_AGE = int(env.get("API_PARTICIPANT_FILTER_MAX_AGE", 60 * 60))
+# How long, and how many, participants sending data are cached in each process
+API_PARTICIPANT_CACHE_TIMEOUT = int(env.get("API_PARTICIPANT_CACHE_TIMEOUT", 5))
+API_PARTICIPANT_CACHE_SIZE = int(env.get("API_PARTICIPANT_CACHE_SIZE", 10000))
+# Export jobs that haven't saved any progress for this many seconds are assumed
+# to have lost their worker, and are picked up by another one
+EXPORT_JOB_TIMEOUT = int(env.get("EXPORT_JOB_TIMEOUT", 60 * 10))
+# Archives of exports replaced by a newer one are kept for this many seconds, so
+# downloads in progress can finish
+EXPORT_ARCHIVE_GRACE_PERIOD = int(env.get("EXPORT_ARCHIVE_GRACE_PERIOD", 60 * 60))
+# How long saving data is assumed to take at most, in seconds. Incremental
+# exports leave out participants updated more recently than this, and wait up to
+# this long for data being saved when they start
+EXPORT_CURSOR_LAG = int(env.get("EXPORT_CURSOR_LAG", 30))
+# Number of an export's CSVs generated at once, each in its own process with its
+# own database connection. 1 generates them one after another in the job's process
+EXPORT_PARALLELISM = int(env.get("EXPORT_PARALLELISM", 1))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/stable/ref/settings/#auth-password-validators
 
@@ -575,7 +645,18 @@ if env.get("BASIC_AUTH_ENABLED", "false").lower().strip() == "true":
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework.authentication.SessionAuthentication",
-    )
+    ),
+    # These use orjson when it's installed, and can be overridden per view
+    # with renderer_classes and parser_classes
+    "DEFAULT_RENDERER_CLASSES": (
+        "flare_portal.api.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "flare_portal.api.parsers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
 }
 
 # Default size for page pagination used on the front-end.
@@ -10,3 +10,7 @@ logging.disable(logging.CRITICAL)
 SECRET_KEY = "test-key"
 DEBUG = False
 AUTH_PASSWORD_VALIDATORS = []
+
+# Participant IDs are reused between tests, so participants can't be cached
+API_PARTICIPANT_FILTER = False
+API_PARTICIPANT_CACHE_TIMEOUT = 0
@@ -9,6 +9,7 @@ from django.views.decorators.vary import vary_on_headers
 from django.views.generic import TemplateView
 
 from flare_portal.api import urls as api_urls
+from flare_portal.api.async_views import async_view
 from flare_portal.experiments import urls as experiment_urls
 from flare_portal.reimbursement import urls as reimbursement_urls
 from flare_portal.site_config import urls as site_config_urls
@@ -114,6 +115,10 @@ urlpatterns = decorate_urlpatterns(
     ),
 )
 
+if settings.API_ASYNC_VIEWS:
+    # Applied last, as the decorators above don't support async views
+    decorate_urlpatterns(api_urls.participant_urlpatterns, async_view)
+
 # Join private and public URLs.
 urlpatterns = private_urlpatterns + urlpatterns
 
@@ -1,4 +1,7 @@
-from typing import Callable
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Tuple
 
 from django.conf import settings
 from django.views.decorators.cache import cache_control
@@ -29,3 +32,42 @@ def get_default_cache_control_decorator() -> Callable:
     """
     cache_control_kwargs = get_default_cache_control_kwargs()
     return cache_control(**cache_control_kwargs)
+
+
+class LocalCache:
+    """
+    A thread safe, in-process cache of values that expire, which holds at most
+    as many values as the max_size_setting setting, evicting the least
+    recently used ones
+    """
+
+    def __init__(self, max_size_setting: str) -> None:
+        self.max_size_setting = max_size_setting
+        self.values: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self.lock:
+            if key in self.values:
+                expires_at, value = self.values[key]
+                if expires_at > time.monotonic():
+                    self.values.move_to_end(key)
+                    return value
+
+                del self.values[key]
+
+        return None
+
+    def set(self, key: str, value: Any, timeout: float) -> None:
+        with self.lock:
+            self.values[key] = (time.monotonic() + timeout, value)
+            while len(self.values) > getattr(settings, self.max_size_setting):
+                self.values.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self.values.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.values.clear()
@@ -0,0 +1,119 @@
+import queue
+import threading
+import time
+from typing import Any, Iterator, List, Optional, Sequence
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Number of bytes of COPY output passed from the database at a time
+COPY_CHUNK_SIZE = 64 * 1024
+# Number of chunks buffered ahead of whatever is consuming them
+COPY_QUEUE_SIZE = 16
+
+
+class CopyBuffer:
+    """
+    A file for psycopg2 to copy into, which passes the data on in chunks of
+    about COPY_CHUNK_SIZE bytes
+    """
+
+    def __init__(self, chunks: "queue.Queue[Optional[bytes]]") -> None:
+        self.chunks = chunks
+        self.buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        if len(self.buffer) >= COPY_CHUNK_SIZE:
+            self.flush()
+        return len(data)
+
+    def flush(self) -> None:
+        if self.buffer:
+            self.chunks.put(bytes(self.buffer))
+            self.buffer.clear()
+
+
+def iter_copy_to(
+    sql: str, params: Sequence[Any] = (), using: str = DEFAULT_DB_ALIAS
+) -> Iterator[bytes]:
+    """
+    Yields the output of COPY (sql) TO STDOUT WITH (FORMAT csv) as the
+    database sends it
+
+    psycopg2 only copies into files, so the copy runs in a thread, and only
+    a few chunks are held in memory at a time. If the generator is closed
+    before the copy is finished, the query is cancelled.
+    """
+    connection = connections[using]
+
+    with connection.cursor() as cursor:
+        query = cursor.mogrify(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv)", params)
+        chunks: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=COPY_QUEUE_SIZE)
+        errors: List[BaseException] = []
+
+        def copy() -> None:
+            buffer = CopyBuffer(chunks)
+            try:
+                cursor.cursor.copy_expert(query, buffer)
+                buffer.flush()
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                chunks.put(None)
+
+        thread = threading.Thread(target=copy, daemon=True)
+        thread.start()
+        finished = False
+
+        try:
+            while (chunk := chunks.get()) is not None:
+                yield chunk
+            finished = True
+        finally:
+            if not finished:
+                connection.connection.cancel()
+                # Unblock the thread, which stops once the query is cancelled
+                while chunks.get() is not None:
+                    pass
+                if connection.in_atomic_block:
+                    connection.needs_rollback = True
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+def wait_for_transactions(
+    timeout: float, interval: float = 0.05, using: str = DEFAULT_DB_ALIAS
+) -> bool:
+    """
+    Waits for the transactions that are writing to the database, apart from
+    the current one, to finish, and returns whether they did within timeout
+    seconds
+
+    Transactions started after this is called aren't waited for.
+    """
+    deadline = time.monotonic() + timeout
+
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT pg_current_snapshot()::text")
+        (snapshot,) = cursor.fetchone()
+
+        while True:
+            cursor.execute(
+                """
+                SELECT NOT EXISTS (
+                    SELECT FROM pg_snapshot_xip(%s::pg_snapshot) AS xid
+                    WHERE pg_xact_status(xid) = 'in progress'
+                    AND xid IS DISTINCT FROM pg_current_xact_id_if_assigned()
+                )
+                """,
+                [snapshot],
+            )
+            if cursor.fetchone()[0]:
+                return True
+
+            if time.monotonic() >= deadline:
+                return False
+
+            time.sleep(interval)
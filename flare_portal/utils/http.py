@@ -0,0 +1,104 @@
+import re
+from functools import partial, wraps
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+from django.db.models.fields.files import FieldFile
+from django.http import HttpRequest, HttpResponse
+from django.middleware.gzip import GZipMiddleware
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_header(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a Range header for a single byte range into inclusive start and
+    end offsets
+
+    Returns None if the header should be ignored (e.g. multiple ranges were
+    requested), in which case the whole file should be served. Raises
+    RangeNotSatisfiable if the range is outside of the file.
+    """
+    match = RANGE_RE.match(header.strip())
+
+    if not match or match.groups() == ("", ""):
+        return None
+
+    start, end = match.groups()
+
+    if not start:
+        # Suffix range, e.g. the last 500 bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+
+    if start > end or start >= size:
+        raise RangeNotSatisfiable()
+
+    return start, end
+
+
+def stream_file(
+    field_file: FieldFile, start: int, end: int, chunk_size: int = 64 * 1024
+) -> Iterator[bytes]:
+    """
+    Streams the bytes from start to end (inclusive) of a file in storage
+    """
+    f = field_file.storage.open(field_file.name, "rb")
+
+    try:
+        if hasattr(f, "obj"):
+            # S3 files are downloaded in full when they're first read, so
+            # request the range from S3 and stream the response body instead
+            body = f.obj.get(Range=f"bytes={start}-{end}")["Body"]
+            yield from body.iter_chunks(chunk_size)
+            return
+
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def gzip_json_page(
+    view_func: Callable[..., HttpResponse]
+) -> Callable[..., HttpResponse]:
+    """
+    Compresses the view's JSON responses, like gzip_page
+
+    Other responses, like the browsable API's HTML pages, aren't compressed,
+    as they can contain secrets (like CSRF tokens), which compression makes
+    vulnerable to BREACH attacks.
+    """
+    middleware = GZipMiddleware(view_func)
+
+    def compress(request: HttpRequest, response: HttpResponse) -> HttpResponse:
+        content_type = response.get("Content-Type", "").split(";")[0].strip()
+        if content_type == "application/json":
+            return middleware.process_response(request, response)
+        return response
+
+    @wraps(view_func)
+    def wrapped_view(request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
+        response = view_func(request, *args, **kwargs)
+
+        # Content types of responses that are rendered later, like DRF's,
+        # aren't known until they are
+        if callable(getattr(response, "render", None)):
+            response.add_post_render_callback(  # type: ignore
+                partial(compress, request)
+            )
+            return response
+
+        return compress(request, response)
+
+    return wrapped_view
@@ -0,0 +1,50 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Union
+
+from django.http import HttpRequest, HttpResponse
+
+from asgiref.sync import sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise middleware that can also be used in an async middleware chain
+
+    A synchronous middleware makes Django run the rest of the chain, and the
+    views, one request at a time in each process under ASGI. This keeps the
+    chain async, so the participant API views can run concurrently (see
+    flare_portal.api.async_views).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable, *args: Any, **kwargs: Any) -> None:
+        super().__init__(get_response, *args, **kwargs)
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Marks the instance as a coroutine function for Django, as
+            # MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine  # type: ignore
+
+    def __call__(
+        self, request: HttpRequest
+    ) -> Union[HttpResponse, Awaitable[HttpResponse]]:
+        if self.is_async:
+            return self.__acall__(request)
+
+        return super().__call__(request)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        if self.autorefresh:
+            # Files are looked up on the file system in development
+            response = await sync_to_async(
+                self.process_request, thread_sensitive=False
+            )(request)
+        else:
+            response = self.process_request(request)
+
+        if response is None:
+            response = await self.get_response(request)
+        return response